@@ -1,8 +1,10 @@
+import os
 import requests
 import json
 
 BASE_URL = 'https://localhost:5273/api/v1'
-API_KEY = 'your_api_key_here'
+# Issued by an admin through /api/api_keys or `flask --app main create-api-key <name>`
+API_KEY = os.environ['SHOE_API_KEY']
 
 headers = {
     'X-API-Key': API_KEY,
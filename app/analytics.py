@@ -0,0 +1,152 @@
+"""
+analytics.py
+This file contains the production analytics queries behind /api/analytics/production.
+Counts are grouped by time bucket and any of brand, category, model, operator and batch,
+then a window query adds throughput per operator-hour and a moving average per group.
+The moving average covers calendar buckets, so buckets without production count as zero.
+Most groupings read the hourly rollup; grouping by batch reads the raw shoes of the hot
+table and of the archived months in the requested date range.
+"""
+
+# Local imports
+import partitions
+from rollups import GRANULARITY_BUCKETS
+
+# Group-by fields and the column they read; batch only exists on raw shoes
+GROUP_BY_FIELDS = {
+    'brand': 'shoe_models.brand',
+    'category': 'shoe_models.category',
+    'model': 'shoe_models.model_name',
+    'operator': 'source.created_by',
+    'batch': 'source.batch_number',
+}
+MAX_MOVING_AVERAGE_WINDOW = 365
+
+# Consecutive buckets of each granularity get consecutive integers, so a RANGE window spans
+# calendar buckets rather than the buckets that happen to have rows
+BUCKET_ORDINALS = {
+    'hour': 'CAST(round(julianday({bucket}) * 24) AS INTEGER)',
+    'day': 'CAST(julianday({bucket}) AS INTEGER)',
+    'week': 'CAST(julianday({bucket}) AS INTEGER) / 7',
+    'month': 'CAST(substr({bucket}, 1, 4) AS INTEGER) * 12 + CAST(substr({bucket}, 6, 2) AS INTEGER)',
+}
+
+# Per-source grouped rows are collected here before the final window query
+GROUPED_TABLE = '''
+    CREATE TEMP TABLE IF NOT EXISTS analytics_grouped
+    (bucket TEXT, g0 TEXT, g1 TEXT, g2 TEXT, g3 TEXT, g4 TEXT,
+    count INTEGER NOT NULL, operator_hours INTEGER NOT NULL)
+'''
+
+# Builds the grouped query over one source: the rollup, or a (possibly attached) shoes table
+def _grouped_query(table, raw, granularity, group_by, filters):
+    hour = 'substr(source.created_at, 1, 13)' if raw else 'source.hour'
+    bucket = GRANULARITY_BUCKETS[granularity].replace('hour', hour)
+    model_id = 'source.shoe_model_id' if raw else 'nullif(source.shoe_model_id, 0)'
+    group_columns = [GROUP_BY_FIELDS[field] for field in group_by]
+    padding = ['NULL'] * (len(GROUP_BY_FIELDS) - len(group_columns))
+
+    query = f'''
+        SELECT {bucket}, {', '.join(group_columns + padding)},
+            {'COUNT(*)' if raw else 'SUM(source.count)'},
+            COUNT(DISTINCT {hour} || '|' || source.created_by)
+        FROM {table} AS source
+        LEFT JOIN shoe_models ON shoe_models.id = {model_id}
+        WHERE {'1' if raw else 'source.count > 0'}
+    '''
+    params = []
+    if filters.get('model_id') is not None:
+        query += ' AND source.shoe_model_id = ?'
+        params.append(filters['model_id'])
+    if filters.get('operator') is not None:
+        query += ' AND source.created_by = ?'
+        params.append(filters['operator'])
+    if filters.get('brand') is not None:
+        query += ' AND shoe_models.brand = ?'
+        params.append(filters['brand'])
+    if filters.get('category') is not None:
+        query += ' AND shoe_models.category = ?'
+        params.append(filters['category'])
+    if filters.get('start_date'):
+        query += f' AND {hour} >= ?'
+        params.append(filters['start_date'][:13])
+    if filters.get('end_date'):
+        query += f' AND {hour} <= ?'
+        params.append(filters['end_date'][:13])
+
+    query += ' GROUP BY ' + ', '.join(str(i) for i in range(1, len(group_columns) + 2))
+    return query, params
+
+# Returns one row per (bucket, group) with count, operator_hours, throughput_per_operator_hour
+# and, when moving_average is set, the mean count of the same group over that many buckets.
+# Empty buckets count as zero; near the start of the range fewer buckets are averaged.
+# conn must see shoe_models (a joined connection); archive_dir locates archived months.
+def production_analytics(conn, archive_dir, granularity='day', group_by=(), moving_average=None, **filters):
+    raw = 'batch' in group_by
+    conn.execute(GROUPED_TABLE)
+    try:
+        if raw:
+            query, params = _grouped_query('main.shoes', True, granularity, group_by, filters)
+            conn.execute(f'INSERT INTO temp.analytics_grouped {query}', params)
+            # Archived months are attached one at a time, and only when their dates can match
+            candidates = partitions.prune(partitions.list_partitions(conn, archive_dir),
+                                          since=filters.get('start_date'), until=filters.get('end_date'))
+            for partition in candidates:
+                conn.execute('ATTACH DATABASE ? AS analytics_archive', (partition.path,))
+                try:
+                    query, params = _grouped_query('analytics_archive.shoes', True, granularity, group_by, filters)
+                    conn.execute(f'INSERT INTO temp.analytics_grouped {query}', params)
+                finally:
+                    conn.commit()
+                    conn.execute('DETACH DATABASE analytics_archive')
+        else:
+            query, params = _grouped_query('shoe_production_hourly', False, granularity, group_by, filters)
+            conn.execute(f'INSERT INTO temp.analytics_grouped {query}', params)
+
+        groups = [f'g{i}' for i in range(len(group_by))]
+        partition_by = f"PARTITION BY {', '.join(groups)}" if groups else ''
+        window = ''
+        params = {}
+        if moving_average:
+            size = int(moving_average)
+            # The range starts at start_date's bucket, or else at the first bucket with production
+            range_start = '(SELECT MIN(ordinal) FROM totals)'
+            if filters.get('start_date'):
+                start_hour = filters['start_date'][:13] if len(filters['start_date']) >= 13 else filters['start_date'][:10] + 'T00'
+                # Named, since the bucket and ordinal templates may read the start hour more than once
+                start_bucket = GRANULARITY_BUCKETS[granularity].replace('hour', ':start_hour')
+                range_start = f"MIN(COALESCE({BUCKET_ORDINALS[granularity].format(bucket=start_bucket)}, {range_start}), {range_start})"
+                params['start_hour'] = start_hour
+            window = f''',
+                SUM(count) OVER (
+                    {partition_by} ORDER BY ordinal
+                    RANGE BETWEEN {size - 1} PRECEDING AND CURRENT ROW
+                ) * 1.0 / MIN({size}, ordinal - {range_start} + 1) AS moving_average'''
+        rows = conn.execute(f'''
+            WITH totals AS (
+                SELECT bucket, {''.join(group + ', ' for group in groups)}
+                    SUM(count) AS count, SUM(operator_hours) AS operator_hours,
+                    {BUCKET_ORDINALS[granularity].format(bucket='bucket')} AS ordinal
+                FROM temp.analytics_grouped
+                GROUP BY {', '.join(['bucket'] + groups)}
+            )
+            SELECT *, ROUND(count * 1.0 / operator_hours, 3) AS throughput_per_operator_hour{window}
+            FROM totals
+            ORDER BY {', '.join(groups + ['bucket'])}
+        ''', params).fetchall()
+    finally:
+        conn.execute('DELETE FROM temp.analytics_grouped')
+        conn.commit()
+
+    results = []
+    for row in rows:
+        result = {'bucket': row['bucket']}
+        for i, field in enumerate(group_by):
+            result[field] = row[f'g{i}']
+        result['count'] = row['count']
+        result['operator_hours'] = row['operator_hours']
+        result['throughput_per_operator_hour'] = row['throughput_per_operator_hour']
+        if moving_average:
+            result['moving_average'] = round(row['moving_average'], 3)
+        results.append(result)
+    return results
@@ -0,0 +1,173 @@
+"""
+api_keys.py
+This file contains the API key registry used by the external v1 API.
+Keys are stored in users.db as SHA-256 hashes; the plaintext is only returned when a key
+is issued or rotated. Verification hashes the presented key and looks it up in an
+in-process snapshot of the active keys, so API requests never query the database.
+Registry writes replace a shared generation file; every worker stats it on lookup and
+reloads its snapshot when it has changed, so a revoked key stops working everywhere at once.
+"""
+
+# Standard library imports
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
+
+# Issued keys start with this, so they are recognisable in configs and logs
+KEY_PREFIX = 'shoe_'
+# Characters of the key kept in plaintext, so admins can tell keys apart
+SHOWN_PREFIX_LENGTH = len(KEY_PREFIX) + 4
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS api_keys
+    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    key_prefix TEXT NOT NULL,
+    key_hash TEXT UNIQUE NOT NULL,
+    created_at TEXT NOT NULL,
+    created_by TEXT NOT NULL,
+    rotated_at TEXT,
+    revoked_at TEXT,
+    revoked_by TEXT)
+'''
+
+# An active key as seen by the API: its registry id and name
+ApiKey = namedtuple('ApiKey', ['id', 'name'])
+
+# Active keys by hash, as loaded from users.db, and the generation file they were loaded at
+RegistrySnapshot = namedtuple('RegistrySnapshot', ['by_hash', 'loaded_at', 'generation'])
+
+def ensure_api_keys_table(conn):
+    with conn:
+        conn.execute(SCHEMA)
+
+def hash_key(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+def generate_key():
+    return KEY_PREFIX + secrets.token_urlsafe(32)
+
+# Issues a key and returns (id, plaintext key)
+def create_key(conn, name, created_by):
+    api_key = generate_key()
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO api_keys (name, key_prefix, key_hash, created_at, created_by)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (name, api_key[:SHOWN_PREFIX_LENGTH], hash_key(api_key), datetime.now().isoformat(), created_by))
+    return cursor.lastrowid, api_key
+
+# Replaces an active key's secret, which stops the old one from working; returns the new
+# plaintext key, or None when there is no such active key
+def rotate_key(conn, key_id):
+    api_key = generate_key()
+    with conn:
+        cursor = conn.execute('''
+            UPDATE api_keys SET key_prefix = ?, key_hash = ?, rotated_at = ?
+            WHERE id = ? AND revoked_at IS NULL
+        ''', (api_key[:SHOWN_PREFIX_LENGTH], hash_key(api_key), datetime.now().isoformat(), key_id))
+    return api_key if cursor.rowcount else None
+
+# Revokes an active key, keeping its row for the record; returns False when there is none
+def revoke_key(conn, key_id, revoked_by):
+    with conn:
+        cursor = conn.execute('UPDATE api_keys SET revoked_at = ?, revoked_by = ? WHERE id = ? AND revoked_at IS NULL',
+                              (datetime.now().isoformat(), revoked_by, key_id))
+    return cursor.rowcount > 0
+
+def list_keys(conn):
+    return conn.execute('''
+        SELECT id, name, key_prefix, created_at, created_by, rotated_at, revoked_at, revoked_by
+        FROM api_keys ORDER BY id
+    ''').fetchall()
+
+class ApiKeyRegistry:
+    """Active API keys indexed by hash, reloaded after invalidation in any process or TTL expiry."""
+
+    def __init__(self, loader, ttl=None, generation_path=None):
+        self._loader = loader
+        self.ttl = ttl
+        self.generation_path = generation_path
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.rejections = 0
+
+    # Returns the current snapshot, loading it if it is missing or expired
+    def snapshot(self):
+        generation = self._generation()
+        snapshot = self._snapshot
+        if snapshot is not None and not self._stale(snapshot, generation):
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and not self._stale(snapshot, generation):
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            # The generation is read before the rows, so a write in between causes another reload
+            rows = self._loader()
+            self._snapshot = RegistrySnapshot(
+                by_hash={row['key_hash']: (row['key_hash'], ApiKey(row['id'], row['name'])) for row in rows},
+                loaded_at=time.monotonic(),
+                generation=generation
+            )
+            return self._snapshot
+
+    def _stale(self, snapshot, generation):
+        return snapshot.generation != generation or (bool(self.ttl) and time.monotonic() - snapshot.loaded_at > self.ttl)
+
+    # Identifies the current version of the generation file; it is replaced, never rewritten in place
+    def _generation(self):
+        if self.generation_path is None:
+            return None
+        try:
+            stat = os.stat(self.generation_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    # Returns the ApiKey for a presented key, or None when it is missing, unknown or revoked.
+    # Only the hash of the presented key is looked up, so timing reveals nothing about stored keys.
+    def verify(self, api_key):
+        if not api_key:
+            return None
+        presented = hash_key(api_key)
+        stored_hash, key = self.snapshot().by_hash.get(presented, ('', None))
+        if key is None or not hmac.compare_digest(stored_hash, presented):
+            self.rejections += 1
+            return None
+        return key
+
+    # Drops the snapshot so the next lookup reloads it, in this and every other process;
+    # called after registry writes
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self.invalidations += 1
+        if self.generation_path is not None:
+            temp_path = f'{self.generation_path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                f.write(uuid.uuid4().hex)
+            os.replace(temp_path, self.generation_path)
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'size': len(snapshot.by_hash) if snapshot else 0,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'rejections': self.rejections,
+        }
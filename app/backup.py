@@ -0,0 +1,356 @@
+"""
+backup.py
+This file contains the online backup engine for the Shoe Database application.
+Backups are taken with the SQLite backup API from a pinned read snapshot, so pages
+are copied in steps while writers keep committing. Each backup is either a full
+image or an incremental delta holding only the pages that changed since the previous
+backup of the same database, and can optionally be gzip-compressed. A JSON manifest
+and a page-hash file are written next to each backup so chains can be restored and verified.
+"""
+
+# Standard library imports
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Backup configuration
+BACKUP_STEP_PAGES = int(os.getenv('BACKUP_STEP_PAGES', '1024'))
+BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP', '0.005'))
+BACKUP_RETENTION_DAYS = int(os.getenv('BACKUP_RETENTION_DAYS', '30'))
+# An incremental backup becomes a full one after this many incrementals in a row, or once the
+# chain's full backup is older than the retention period, so chains stay short and can be pruned
+BACKUP_FULL_EVERY = max(int(os.getenv('BACKUP_FULL_EVERY', '6')), 1)
+
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+MANIFEST_SUFFIX = '.manifest.json'
+DELTA_MAGIC = b'SHOEDELTA1'
+PAGE_RECORD = struct.Struct('>I')
+HASH_SIZE = 16
+
+_TIMESTAMP_PATTERN = re.compile(r'_(\d{8}_\d{6})\.')
+
+class BackupError(Exception):
+    pass
+
+# Copies src_path to dest_path with the SQLite backup API, `step_pages` pages at a time
+def snapshot_database(src_path, dest_path, progress=None, step_pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP):
+    src = sqlite3.connect(src_path)
+    dest = sqlite3.connect(dest_path)
+    try:
+        # Pin one read snapshot so concurrent commits do not restart the copy
+        src.execute('BEGIN')
+        src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        page_size = src.execute('PRAGMA page_size').fetchone()[0]
+
+        def report(status, remaining, total):
+            if progress:
+                progress((total - remaining) * page_size, total * page_size)
+
+        src.backup(dest, pages=step_pages, progress=report, sleep=sleep)
+        dest.execute('PRAGMA journal_mode = DELETE')
+        src.rollback()
+    finally:
+        src.close()
+        dest.close()
+
+# Reads the page size from a database file header
+def read_page_size(path):
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    if len(header) < 100 or not header.startswith(b'SQLite format 3\x00'):
+        raise BackupError(f'{path} is not a SQLite database')
+    page_size = struct.unpack('>H', header[16:18])[0]
+    return 65536 if page_size == 1 else page_size
+
+# Yields (page_number, page_bytes) for a database image
+def iter_pages(path, page_size):
+    with open(path, 'rb') as f:
+        page_number = 0
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            yield page_number, page
+            page_number += 1
+
+def page_hash(page):
+    return hashlib.blake2b(page, digest_size=HASH_SIZE).digest()
+
+def read_hashes(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    return [data[i:i + HASH_SIZE] for i in range(0, len(data), HASH_SIZE)]
+
+def _open_output(path, compress):
+    return gzip.open(path, 'wb', compresslevel=6) if compress else open(path, 'wb')
+
+def _open_input(path, compressed):
+    return gzip.open(path, 'rb') if compressed else open(path, 'rb')
+
+def load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest['manifest_path'] = path
+    return manifest
+
+# Lists every manifest in backup_dir (one directory scan), oldest first
+def list_manifests(backup_dir, database=None):
+    manifests = []
+    if not os.path.isdir(backup_dir):
+        return manifests
+    for entry in os.scandir(backup_dir):
+        if entry.name.endswith(MANIFEST_SUFFIX):
+            manifest = load_manifest(entry.path)
+            if database is None or manifest['database'] == database:
+                manifests.append(manifest)
+    manifests.sort(key=lambda manifest: (manifest['timestamp'], manifest['created_at']))
+    return manifests
+
+def backup_paths(backup_dir, database, timestamp, backup_type, compress):
+    if backup_type == 'full':
+        data_name = f'{database}_{timestamp}.bak'
+    else:
+        data_name = f'{database}_{timestamp}.delta'
+    if compress:
+        data_name += '.gz'
+    return {
+        'data': os.path.join(backup_dir, data_name),
+        'manifest': os.path.join(backup_dir, f'{database}_{timestamp}{MANIFEST_SUFFIX}'),
+        'hashes': os.path.join(backup_dir, f'{database}_{timestamp}.hashes'),
+    }
+
+# Lists files that a backup of database at timestamp would overwrite
+def existing_backup_files(backup_dir, database, timestamp):
+    candidates = [
+        os.path.join(backup_dir, f'{database}_{timestamp}{MANIFEST_SUFFIX}'),
+        os.path.join(backup_dir, f'{database}_{timestamp}.bak'),
+    ]
+    return [path for path in candidates if os.path.exists(path)]
+
+# Returns the backup an incremental backup of database should build on, or None when it
+# should be a full backup: there is no previous backup, or the chain is long or old enough
+def incremental_parent(backup_dir, database, timestamp, full_every=BACKUP_FULL_EVERY, retention_days=BACKUP_RETENTION_DAYS):
+    previous = [manifest for manifest in list_manifests(backup_dir, database) if manifest['timestamp'] != timestamp]
+    if not previous:
+        return None
+    try:
+        chain = backup_chain(previous[-1])
+    except BackupError:
+        return None
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime(TIMESTAMP_FORMAT)
+    if len(chain) - 1 >= full_every or chain[0]['timestamp'] < cutoff:
+        return None
+    return previous[-1]
+
+# Backs up one database, returning its manifest. Incremental backups fall back to full without a
+# usable parent (see incremental_parent).
+def backup_database(db_path, backup_dir, timestamp, incremental=False, compress=False, progress=None):
+    database = os.path.basename(db_path)
+    os.makedirs(backup_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    parent = incremental_parent(backup_dir, database, timestamp) if incremental else None
+    backup_type = 'incremental' if parent else 'full'
+    paths = backup_paths(backup_dir, database, timestamp, backup_type, compress)
+
+    fd, snapshot_path = tempfile.mkstemp(prefix=f'{database}.', suffix='.snapshot', dir=backup_dir)
+    os.close(fd)
+    try:
+        snapshot_database(db_path, snapshot_path, progress=progress)
+        page_size = read_page_size(snapshot_path)
+        parent_hashes = read_hashes(os.path.join(backup_dir, parent['hashes'])) if parent else []
+
+        hashes = []
+        pages_written = 0
+        with _open_output(paths['data'], compress) as out:
+            if backup_type == 'incremental':
+                out.write(DELTA_MAGIC)
+            for page_number, page in iter_pages(snapshot_path, page_size):
+                digest = page_hash(page)
+                hashes.append(digest)
+                if backup_type == 'full':
+                    out.write(page)
+                    pages_written += 1
+                elif page_number >= len(parent_hashes) or parent_hashes[page_number] != digest:
+                    out.write(PAGE_RECORD.pack(page_number))
+                    out.write(page)
+                    pages_written += 1
+
+        with open(paths['hashes'], 'wb') as f:
+            f.write(b''.join(hashes))
+    finally:
+        os.remove(snapshot_path)
+
+    manifest = {
+        'database': database,
+        'source': os.path.abspath(db_path),
+        'timestamp': timestamp,
+        'created_at': datetime.now().isoformat(),
+        'type': backup_type,
+        'compressed': compress,
+        'file': os.path.basename(paths['data']),
+        'hashes': os.path.basename(paths['hashes']),
+        'parent': os.path.basename(parent['manifest_path']) if parent else None,
+        'page_size': page_size,
+        'page_count': len(hashes),
+        'pages_written': pages_written,
+        'source_bytes': page_size * len(hashes),
+        'bytes': os.path.getsize(paths['data']),
+        'duration_seconds': round(time.perf_counter() - started, 3),
+    }
+    with open(paths['manifest'], 'w') as f:
+        json.dump(manifest, f, indent=2)
+    manifest['manifest_path'] = paths['manifest']
+    return manifest
+
+# Copies archived shoe partitions into backup_dir/archive. Partitions are read-only once
+# written, so only new or re-archived files are copied and unchanged ones are skipped.
+def backup_archives(archive_dir, backup_dir):
+    copied = []
+    if not os.path.isdir(archive_dir):
+        return copied
+    dest_dir = os.path.join(backup_dir, 'archive')
+    os.makedirs(dest_dir, exist_ok=True)
+    for entry in os.scandir(archive_dir):
+        if not entry.name.endswith('.db'):
+            continue
+        dest_path = os.path.join(dest_dir, entry.name)
+        source = entry.stat()
+        if os.path.exists(dest_path):
+            existing = os.stat(dest_path)
+            if existing.st_size == source.st_size and int(existing.st_mtime) == int(source.st_mtime):
+                continue
+        started = time.perf_counter()
+        if os.path.exists(dest_path + '.tmp'):
+            os.remove(dest_path + '.tmp')
+        shutil.copy2(entry.path, dest_path + '.tmp')
+        os.replace(dest_path + '.tmp', dest_path)
+        copied.append({
+            'database': entry.name,
+            'type': 'archive',
+            'file': os.path.join('archive', entry.name),
+            'compressed': False,
+            'bytes': source.st_size,
+            'source_bytes': source.st_size,
+            'pages_written': None,
+            'duration_seconds': round(time.perf_counter() - started, 3),
+        })
+    return copied
+
+# Returns the manifests from the full backup up to (and including) the given one
+def backup_chain(manifest):
+    backup_dir = os.path.dirname(manifest['manifest_path'])
+    chain = [manifest]
+    while chain[0]['parent']:
+        parent_path = os.path.join(backup_dir, chain[0]['parent'])
+        if not os.path.exists(parent_path):
+            raise BackupError(f'Backup chain is broken: {chain[0]["parent"]} is missing')
+        chain.insert(0, load_manifest(parent_path))
+    return chain
+
+# Rebuilds the database image described by a manifest at target_path
+def restore_backup(manifest_path, target_path):
+    manifest = load_manifest(manifest_path)
+    chain = backup_chain(manifest)
+    backup_dir = os.path.dirname(manifest_path)
+
+    fd, temp_path = tempfile.mkstemp(prefix='restore.', dir=os.path.dirname(os.path.abspath(target_path)))
+    os.close(fd)
+    try:
+        full = chain[0]
+        with _open_input(os.path.join(backup_dir, full['file']), full['compressed']) as src, open(temp_path, 'wb') as out:
+            shutil.copyfileobj(src, out, 1024 * 1024)
+
+        with open(temp_path, 'r+b') as out:
+            for delta in chain[1:]:
+                page_size = delta['page_size']
+                with _open_input(os.path.join(backup_dir, delta['file']), delta['compressed']) as src:
+                    if src.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+                        raise BackupError(f'{delta["file"]} is not a delta backup')
+                    while True:
+                        record = src.read(PAGE_RECORD.size)
+                        if not record:
+                            break
+                        page_number = PAGE_RECORD.unpack(record)[0]
+                        out.seek(page_number * page_size)
+                        out.write(src.read(page_size))
+                out.truncate(delta['page_count'] * page_size)
+
+        # Replace the target and drop any WAL files that belonged to the old database
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(target_path + suffix):
+                os.remove(target_path + suffix)
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return manifest
+
+# Restores a backup to a scratch file and checks its page hashes and SQLite integrity
+def verify_backup(manifest_path):
+    manifest = load_manifest(manifest_path)
+    backup_dir = os.path.dirname(manifest_path)
+    fd, temp_path = tempfile.mkstemp(prefix='verify.', suffix='.db', dir=backup_dir)
+    os.close(fd)
+    try:
+        restore_backup(manifest_path, temp_path)
+        expected = read_hashes(os.path.join(backup_dir, manifest['hashes']))
+        actual = [page_hash(page) for _, page in iter_pages(temp_path, manifest['page_size'])]
+        conn = sqlite3.connect(temp_path)
+        integrity = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        conn.close()
+    finally:
+        for path in (temp_path, temp_path + '-wal', temp_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+    return {
+        'backup': os.path.basename(manifest_path),
+        'pages_match': expected == actual,
+        'integrity_check': integrity,
+        'ok': expected == actual and integrity == 'ok',
+    }
+
+# Deletes backups older than the retention period unless a newer kept backup depends on them
+def prune_backups(backup_dir, retention_days=BACKUP_RETENTION_DAYS):
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime(TIMESTAMP_FORMAT)
+    manifests = list_manifests(backup_dir)
+    by_name = {os.path.basename(manifest['manifest_path']): manifest for manifest in manifests}
+
+    keep = set()
+    for manifest in manifests:
+        if manifest['timestamp'] >= cutoff:
+            name = os.path.basename(manifest['manifest_path'])
+            while name and name not in keep:
+                keep.add(name)
+                name = by_name[name]['parent'] if name in by_name else None
+
+    managed = set()
+    for manifest in manifests:
+        name = os.path.basename(manifest['manifest_path'])
+        files = (name, manifest['file'], manifest['hashes'])
+        managed.update(files)
+        if name not in keep:
+            for file_name in files:
+                path = os.path.join(backup_dir, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # Legacy .bak copies without a manifest are pruned by the timestamp in their name
+    removed = [name for name in by_name if name not in keep]
+    for entry in os.scandir(backup_dir):
+        if entry.name in managed or not entry.is_file():
+            continue
+        match = _TIMESTAMP_PATTERN.search(entry.name)
+        if match and match.group(1) < cutoff:
+            os.remove(entry.path)
+            removed.append(entry.name)
+    return removed
@@ -0,0 +1,181 @@
+"""
+backup_jobs.py
+This file runs database backups as background jobs for the Shoe Database application.
+A job is started on a small worker pool and its state (status, bytes copied, ETA and
+result) is written to a JSON file in the backup directory, so any server process can
+report on it. An exclusive file lock makes sure only one backup runs at a time across
+processes; a request made while a backup is running is given the running job instead.
+"""
+
+# Standard library imports
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# How often a running job writes its progress to disk, in seconds
+PROGRESS_WRITE_INTERVAL = 0.5
+# Number of finished job files kept in the jobs directory
+JOB_HISTORY_SIZE = 50
+
+FINISHED_STATUSES = ('succeeded', 'failed')
+
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+class BackupJobs:
+    """Runs backups on a worker pool and tracks their progress in files shared by all processes."""
+
+    def __init__(self, backup_dir, run_backup, max_workers=1):
+        self.jobs_dir = os.path.join(backup_dir, 'jobs')
+        self.lock_path = os.path.join(self.jobs_dir, 'backup.lock')
+        self.current_path = os.path.join(self.jobs_dir, 'current')
+        self._run_backup = run_backup
+        self._max_workers = max_workers
+        self._executor = None
+        self._pid = None
+
+    # Starts a backup job unless one is already running. Returns (job, deduplicated).
+    def submit(self, **options):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            running = self._running_job()
+            if running is not None:
+                return running, True
+            # The other backup finished between our lock attempt and now, so try again
+            return self.submit(**options)
+
+        try:
+            job = {
+                'id': uuid.uuid4().hex,
+                'status': 'queued',
+                'options': options,
+                'created_at': datetime.now().isoformat(),
+                'started_at': None,
+                'finished_at': None,
+                'current_database': None,
+                'bytes_done': 0,
+                'bytes_total': None,
+                'percent': 0.0,
+                'eta_seconds': None,
+                'result': None,
+                'error': None,
+            }
+            self._write(job)
+            self._write_file(self.current_path, job['id'])
+            self._pool().submit(self._run, job, lock_file)
+        except BaseException:
+            lock_file.close()
+            raise
+        return job, False
+
+    def get(self, job_id):
+        if not _JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        try:
+            with open(self._job_path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    # Returns the most recent jobs, newest first
+    def recent(self, limit=10):
+        if not os.path.isdir(self.jobs_dir):
+            return []
+        jobs = [self.get(entry.name[:-5]) for entry in os.scandir(self.jobs_dir) if entry.name.endswith('.json')]
+        jobs = [job for job in jobs if job is not None]
+        jobs.sort(key=lambda job: job['created_at'], reverse=True)
+        return jobs[:limit]
+
+    # Waits for running jobs in this process; used on shutdown
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    # The pool is created lazily and recreated after fork, since threads do not survive it
+    def _pool(self):
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='backup')
+            self._pid = os.getpid()
+        return self._executor
+
+    def _running_job(self):
+        for _ in range(20):
+            try:
+                with open(self.current_path) as f:
+                    job = self.get(f.read().strip())
+            except FileNotFoundError:
+                job = None
+            if job is not None and job['status'] not in FINISHED_STATUSES:
+                return job
+            time.sleep(0.05)
+        return None
+
+    def _run(self, job, lock_file):
+        started = time.monotonic()
+        last_write = 0.0
+
+        def progress(database, bytes_done, bytes_total):
+            nonlocal last_write
+            job['current_database'] = database
+            job['bytes_done'] = bytes_done
+            job['bytes_total'] = bytes_total
+            job['percent'] = round(bytes_done * 100 / bytes_total, 1) if bytes_total else 0.0
+            elapsed = time.monotonic() - started
+            if bytes_done and elapsed > 0:
+                job['eta_seconds'] = round((bytes_total - bytes_done) / (bytes_done / elapsed), 1)
+            if time.monotonic() - last_write >= PROGRESS_WRITE_INTERVAL:
+                last_write = time.monotonic()
+                self._write(job)
+
+        try:
+            job['status'] = 'running'
+            job['started_at'] = datetime.now().isoformat()
+            self._write(job)
+            job['result'] = self._run_backup(progress=progress, **job['options'])
+            job['status'] = 'succeeded'
+            job['percent'] = 100.0
+            job['eta_seconds'] = 0
+        except Exception as e:
+            logger.exception('Backup job failed')
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        finally:
+            job['current_database'] = None
+            job['finished_at'] = datetime.now().isoformat()
+            self._write(job)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            self._prune_history()
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f'{job_id}.json')
+
+    def _write(self, job):
+        self._write_file(self._job_path(job['id']), json.dumps(job))
+
+    # Writes through a temporary file so readers never see a partial file
+    def _write_file(self, path, content):
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def _prune_history(self):
+        finished = [job for job in self.recent(limit=None) if job['status'] in FINISHED_STATUSES]
+        for job in finished[JOB_HISTORY_SIZE:]:
+            try:
+                os.remove(self._job_path(job['id']))
+            except FileNotFoundError:
+                pass
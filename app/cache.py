@@ -0,0 +1,183 @@
+"""
+cache.py
+This file contains the in-process caches used by the Shoe Database application.
+Each cache counts its hits and misses so they can be reported alongside the pool metrics.
+An LRUCache given a generation file shares its invalidations with every other worker:
+invalidating replaces the file, and each worker clears its entries once it sees the change.
+"""
+
+# Standard library imports
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+# An immutable view of the shoe model catalogue as loaded from models.db
+CatalogueSnapshot = namedtuple('CatalogueSnapshot', ['models', 'by_name', 'by_id', 'etag', 'last_modified', 'loaded_at'])
+
+class ModelCatalogue:
+    """Shoe model catalogue indexed by name and id, reloaded after invalidation or TTL expiry."""
+
+    def __init__(self, loader, ttl=None):
+        self._loader = loader
+        self.ttl = ttl
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # Returns the current snapshot, loading it if it is missing or expired
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and not self._expired(snapshot):
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and not self._expired(snapshot):
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            self._snapshot = self._load(snapshot)
+            return self._snapshot
+
+    def _expired(self, snapshot):
+        return bool(self.ttl) and time.monotonic() - snapshot.loaded_at > self.ttl
+
+    def _load(self, previous):
+        models = tuple(dict(row) for row in self._loader())
+        etag = hashlib.sha1(json.dumps(models, sort_keys=True, default=str).encode()).hexdigest()
+        # Keep Last-Modified stable when a TTL reload finds nothing changed
+        if previous is not None and previous.etag == etag:
+            last_modified = previous.last_modified
+        else:
+            last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        return CatalogueSnapshot(
+            models=models,
+            by_name={model['model_name']: model for model in models},
+            by_id={model['id']: model for model in models},
+            etag=etag,
+            last_modified=last_modified,
+            loaded_at=time.monotonic()
+        )
+
+    def all(self):
+        return self.snapshot().models
+
+    def get_by_name(self, model_name):
+        return self.snapshot().by_name.get(model_name)
+
+    def get_by_id(self, model_id):
+        try:
+            return self.snapshot().by_id.get(int(model_id))
+        except (TypeError, ValueError):
+            return None
+
+    # Drops the snapshot so the next lookup reloads it; called after catalogue writes
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self.invalidations += 1
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'size': len(snapshot.models) if snapshot else 0,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+        }
+
+class LRUCache:
+    """Thread-safe LRU cache with a maximum size, an optional per-entry TTL and optional
+    invalidation across processes through a generation file."""
+
+    def __init__(self, max_size, ttl=None, generation_path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation_path = generation_path
+        # The generation file version the entries were cached under
+        self.generation = self._read_generation()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Returns the cached value for key, or None when it is missing or expired
+    def get(self, key):
+        generation = self._read_generation()
+        with self._lock:
+            if generation != self.generation:
+                # Another process invalidated an entry; which one is unknown, so drop them all
+                self._entries.clear()
+                self.generation = generation
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() > expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    # Caches value under key. Callers that loaded value after a miss pass the generation they
+    # saw before loading; the value is not cached if an invalidation has been seen since.
+    def set(self, key, value, generation=None):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Drops key here and, with a generation file, every entry in the other processes
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+        if self.generation_path is not None:
+            temp_path = f'{self.generation_path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                f.write(uuid.uuid4().hex)
+            os.replace(temp_path, self.generation_path)
+
+    # Identifies the current version of the generation file; it is replaced, never rewritten in place
+    def _read_generation(self):
+        if self.generation_path is None:
+            return None
+        try:
+            stat = os.stat(self.generation_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
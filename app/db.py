@@ -0,0 +1,271 @@
+"""
+db.py
+This file contains the SQLite connection pool shared by the Shoe Database application.
+Connections are opened once per database, tuned with the pragmas below and then
+reused across requests instead of being reconnected on every call. A pool can also
+ATTACH other database files to each connection, so one statement can join across them.
+"""
+
+# Standard library imports
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Third-party imports
+from flask import g, has_app_context
+
+# Local imports
+import metrics
+
+# Pool configuration
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+
+# Pragmas applied once when a pooled connection is opened
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 268435456',
+    f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}',
+)
+
+class TimedCursor(sqlite3.Cursor):
+    """sqlite3 cursor that reports the time of each statement to the metrics module.
+
+    Execution is timed up to the first row; rows taken with fetchone/fetchmany/fetchall
+    are added to the statement afterwards. Rows read by iterating the cursor are not timed.
+    """
+
+    _sql = None
+    _parameters = None
+    _elapsed = 0.0
+    _logged = False
+
+    def _observe(self, seconds, executed):
+        pool = self.connection.pool
+        database = pool.name if pool is not None else 'unpooled'
+        metrics.observe_query(database, seconds, executed)
+        self._elapsed = seconds if executed else self._elapsed + seconds
+        if (metrics.SLOW_QUERY_MS is not None and not self._logged
+                and self._elapsed * 1000 >= metrics.SLOW_QUERY_MS):
+            self._logged = True
+            metrics.log_slow_query(self.connection, database, self._sql, self._parameters, self._elapsed)
+
+    def execute(self, sql, parameters=()):
+        self._sql, self._parameters, self._logged = sql, parameters, False
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._observe(time.perf_counter() - started, True)
+
+    def executemany(self, sql, seq_of_parameters):
+        # No single parameter set to explain the statement with
+        self._sql, self._parameters, self._logged = sql, None, False
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._observe(time.perf_counter() - started, True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._observe(time.perf_counter() - started, False)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._observe(time.perf_counter() - started, False)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._observe(time.perf_counter() - started, False)
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool and whose cursors are timed."""
+
+    pool = None
+    checked_out = False
+    checkout_id = 0
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or TimedCursor)
+
+    # The C shortcuts make a plain cursor, so they are routed through a timed one
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def close_for_real(self):
+        super().close()
+
+class ConnectionPool:
+    """Bounded pool of reusable connections to a SQLite database, with optional attached databases."""
+
+    def __init__(self, name, path, attach=(), max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.name = name
+        self.path = path
+        self.attach = attach
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False)
+        conn.pool = self
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        # Unqualified table names resolve across attached databases, so queries need no prefixes.
+        # A file that is the main database itself (consolidated layout) is not attached twice.
+        for alias, path in self.attach:
+            if os.path.abspath(path) != os.path.abspath(self.path):
+                conn.execute('ATTACH DATABASE ? AS ' + alias, (path,))
+        return conn
+
+    # Takes an idle connection, opening a new one while the pool is below max_size
+    def acquire(self):
+        with self._cond:
+            if self._idle:
+                self.hits += 1
+                conn = self._idle.pop()
+            elif self._size < self.max_size:
+                self.misses += 1
+                self._size += 1
+                conn = None
+            else:
+                self.waits += 1
+                started = time.perf_counter()
+                while not self._idle:
+                    remaining = self.timeout - (time.perf_counter() - started)
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        if self._idle:
+                            break
+                        self.timeouts += 1
+                        self.wait_seconds += time.perf_counter() - started
+                        raise sqlite3.OperationalError(f'Timed out waiting for a {self.name} database connection')
+                self.wait_seconds += time.perf_counter() - started
+                conn = self._idle.pop()
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        conn.row_factory = sqlite3.Row
+        conn.checked_out = True
+        conn.checkout_id += 1
+        return conn
+
+    # Returns a connection to the pool, rolling back anything left uncommitted
+    def release(self, conn):
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close_for_real()
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    # Closes every idle connection, e.g. before the database file is replaced
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                self._idle.pop().close_for_real()
+                self._size -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 6),
+                'timeouts': self.timeouts,
+            }
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Returns the pool for a database path (and attached databases), creating it on first use
+def get_pool(name, path, attach=()):
+    key = (path, attach)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(name, path, attach)
+    return pool
+
+# Checks out a pooled connection; inside a request it is also released at teardown.
+# attach is a tuple of (alias, path) pairs to ATTACH to every connection in the pool.
+def connect(name, path, attach=()):
+    conn = get_pool(name, path, attach).acquire()
+    if has_app_context():
+        g.setdefault('_pooled_connections', []).append((conn, conn.checkout_id))
+    return conn
+
+# Releases connections a handler did not close itself (e.g. after an exception)
+def release_request_connections(exception=None):
+    for conn, checkout_id in g.pop('_pooled_connections', []):
+        if conn.checked_out and conn.checkout_id == checkout_id:
+            conn.close()
+
+# Forked workers must open their own connections rather than reuse the parent's
+def _forget_pools_after_fork():
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
+
+def pool_stats():
+    return {pool.name: pool.stats() for pool in list(_pools.values())}
+
+def close_all_pools():
+    for pool in list(_pools.values()):
+        pool.close_all()
@@ -0,0 +1,48 @@
+"""
+gunicorn.conf.py
+Production server configuration for the Shoe Database application.
+Database setup and certificate generation run once in the gunicorn master before
+workers are forked, and the backup scheduler runs only in the master.
+"""
+
+import multiprocessing
+import os
+import sys
+
+# The config is loaded before gunicorn changes directory, so make the app importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+
+bind = os.getenv('BIND', '0.0.0.0:5273')
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+threads = main.GUNICORN_THREADS
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+keepalive = 5
+accesslog = '-'
+
+# Terminate TLS here unless SERVE_TLS=0, e.g. behind a TLS-terminating proxy
+if main.SERVE_TLS:
+    certfile = main.CERT_FILE
+    keyfile = main.KEY_FILE
+
+# Forwarded headers are only trusted from these proxy addresses
+forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+def on_starting(server):
+    main.bootstrap()
+
+def when_ready(server):
+    server.scheduler = main.start_backup_scheduler()
+
+def on_exit(server):
+    scheduler = getattr(server, 'scheduler', None)
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+    # Let a scheduled backup that is already running finish
+    main.backup_jobs.shutdown(wait=True)
+
+# Let each worker commit the shoe entries still in its ingest queue
+def worker_exit(server, worker):
+    main.ingest_queue.shutdown(wait=True)
@@ -0,0 +1,69 @@
+"""
+idempotency.py
+This file contains the Idempotency-Key support for the shoe entry endpoints.
+The response to a request that carried a key is stored in the same transaction as the
+shoes it wrote. A retry with the same key gets the stored response back instead of
+writing again; a different request reusing the key is rejected.
+"""
+
+# Standard library imports
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+# Keys are remembered for this long, which comfortably covers scanner and client retries
+KEY_RETENTION = timedelta(hours=24)
+MAX_KEY_LENGTH = 255
+# Expired keys are deleted at most this often per process, in seconds
+PRUNE_INTERVAL = 600
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS idempotency_keys
+    (owner TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    response TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (owner, key))
+'''
+
+_last_prune = 0.0
+
+def ensure_idempotency_table(conn):
+    with conn:
+        conn.execute(SCHEMA)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at)')
+
+# Identifies the request a key was first used with: method, path, query arguments and body.
+# Arguments are sorted, so their order does not matter; requests without any hash as before.
+def fingerprint(request):
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    if request.args:
+        digest.update(f'{urlencode(sorted(request.args.items(multi=True)))}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+# Returns (fingerprint, status, response) stored for the key, or None
+def lookup(conn, owner, key):
+    row = conn.execute('''
+        SELECT fingerprint, status, response FROM idempotency_keys
+        WHERE owner = ? AND key = ? AND created_at >= ?
+    ''', (owner, key, (datetime.now() - KEY_RETENTION).isoformat())).fetchone()
+    if row is None:
+        return None
+    return row[0], row[1], json.loads(row[2])
+
+# Stores the response inside the caller's transaction, so it commits together with the write
+def store(conn, owner, key, request_fingerprint, status, response):
+    global _last_prune
+    if time.monotonic() - _last_prune > PRUNE_INTERVAL:
+        _last_prune = time.monotonic()
+        conn.execute('DELETE FROM idempotency_keys WHERE created_at < ?', ((datetime.now() - KEY_RETENTION).isoformat(),))
+    conn.execute('''
+        INSERT OR REPLACE INTO idempotency_keys (owner, key, fingerprint, status, response, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (owner, key, request_fingerprint, status, json.dumps(response), datetime.now().isoformat()))
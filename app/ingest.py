@@ -0,0 +1,403 @@
+"""
+ingest.py
+This file contains the write-behind ingest queue for shoe entry.
+Validated entries are queued in memory and, depending on the durability level, appended
+to an fsync'd journal file. One writer thread per process drains the queue in group
+commits, so a burst of entries costs one SQLite transaction instead of one per request.
+Every entry gets a ticket, and its outcome is recorded in the ingest_receipts table in
+the same transaction as the shoe, so any process can report whether it was persisted.
+"""
+
+# Standard library imports
+import fcntl
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# memory: acknowledged once queued; disk: once the journal is fsync'd; commit: once committed
+DURABILITY_LEVELS = ('memory', 'disk', 'commit')
+# A journal segment is replaced by a new file once it grows past this size
+JOURNAL_SEGMENT_BYTES = 1024 * 1024
+# How long a ticket unknown to this process may still be queued in another one, in seconds
+TICKET_GRACE_SECONDS = 300
+# Receipts are kept this long for status lookups, then pruned by the writer
+RECEIPT_RETENTION = timedelta(days=1)
+
+RECEIPTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS ingest_receipts
+    (ticket TEXT PRIMARY KEY,
+    shoe_id INTEGER,
+    status TEXT NOT NULL,
+    message TEXT,
+    committed_at TEXT NOT NULL)
+'''
+
+def ensure_receipts_table(conn):
+    with conn:
+        conn.execute(RECEIPTS_SCHEMA)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_ingest_receipts_committed_at ON ingest_receipts (committed_at)')
+
+class IngestQueueFull(Exception):
+    """Raised when the queue already holds its maximum number of entries."""
+
+class IngestEntry:
+    def __init__(self, ticket, record, segment):
+        self.ticket = ticket
+        self.record = record
+        self.segment = segment
+        self.status = 'queued'
+        self.shoe_id = None
+        self.message = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {'ticket': self.ticket, 'status': self.status, 'shoe_id': self.shoe_id, 'message': self.message}
+
+# Tickets start with their creation time in milliseconds, so their age can be told from the ticket alone
+def new_ticket():
+    return f'{int(time.time() * 1000):x}-{uuid.uuid4().hex[:16]}'
+
+def ticket_age(ticket):
+    try:
+        return time.time() - int(ticket.split('-', 1)[0], 16) / 1000
+    except ValueError:
+        return None
+
+class IngestQueue:
+    """Queues shoe records and inserts them from a single writer thread in group commits."""
+
+    def __init__(self, connect, columns, journal_dir, durability='disk', batch_size=500,
+                 flush_interval=0.05, max_queue=10000, commit_timeout=30.0, on_commit=None):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f'Unknown ingest durability level: {durability}')
+        self._connect = connect
+        self.columns = tuple(columns)
+        self.journal_dir = journal_dir
+        self.durability = durability
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.commit_timeout = commit_timeout
+        self._on_commit = on_commit
+        self._insert = f'''
+            INSERT INTO shoes ({', '.join(self.columns)})
+            VALUES ({', '.join('?' for _ in self.columns)})
+        '''
+        self._reset()
+
+    # Threads and open journal files do not survive a fork, so each process starts afresh
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._queue = deque()
+        self._pending = {}
+        self._thread = None
+        self._stopping = False
+        # Journal segments: seq -> open file, and seq -> entries not yet committed
+        self._segments = {}
+        self._segment_remaining = {}
+        self._segment_seq = 0
+        # Bytes written to and fsync'd from the journal, counted across all segments
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        self._sync_cond = threading.Condition()
+        self._last_prune = 0.0
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+
+    # Queues a record and waits as long as the durability level requires. Returns the entry.
+    def submit(self, record, durability=None):
+        durability = durability or self.durability
+        if self._pid != os.getpid():
+            self._reset()
+        ticket = new_ticket()
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                raise IngestQueueFull()
+            segment = None
+            if durability == 'disk':
+                segment, position = self._append_journal(ticket, record)
+            entry = IngestEntry(ticket, record, segment)
+            self._queue.append(entry)
+            self._pending[ticket] = entry
+            self._ensure_started()
+            if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                self._not_empty.notify()
+
+        if durability == 'disk':
+            self._sync(position)
+        elif durability == 'commit':
+            entry.done.wait(self.commit_timeout)
+        return entry
+
+    # Reports a ticket: queued here, committed or failed (from receipts), pending elsewhere, or None
+    def status(self, ticket):
+        with self._lock:
+            entry = self._pending.get(ticket)
+        if entry is not None:
+            return entry.to_dict()
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT shoe_id, status, message FROM ingest_receipts WHERE ticket = ?', (ticket,)).fetchone()
+        finally:
+            conn.close()
+        if row is not None:
+            return {'ticket': ticket, 'status': row['status'], 'shoe_id': row['shoe_id'], 'message': row['message']}
+        age = ticket_age(ticket)
+        if age is not None and 0 <= age < TICKET_GRACE_SECONDS:
+            # Accepted by another worker that has not committed it yet
+            return {'ticket': ticket, 'status': 'pending', 'shoe_id': None, 'message': None}
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'durability': self.durability,
+                'queued': len(self._queue),
+                'max_queue': self.max_queue,
+                'batch_size': self.batch_size,
+                'flush_interval_ms': round(self.flush_interval * 1000, 3),
+                'journal_segments': len(self._segments),
+                'committed': self.committed,
+                'failed': self.failed,
+                'batches': self.batches,
+            }
+
+    # Wakes the writer so it commits what is queued and exits; used on shutdown
+    def shutdown(self, wait=True):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._stopping = True
+            self._not_empty.notify_all()
+            thread = self._thread
+        if wait and thread is not None:
+            thread.join()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+
+    # Appends one journal line; the caller holds the lock. Returns (segment, end position).
+    def _append_journal(self, ticket, record):
+        seq = self._segment_seq
+        journal = self._segments.get(seq)
+        if journal is None:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            journal = open(os.path.join(self.journal_dir, f'ingest-{self._pid}-{seq}.log'), 'a')
+            # The lock tells recover() in other processes that this segment is still live
+            fcntl.flock(journal, fcntl.LOCK_EX)
+            self._segments[seq] = journal
+            self._segment_remaining[seq] = 0
+        line = json.dumps({'ticket': ticket, 'record': record}, separators=(',', ':')) + '\n'
+        journal.write(line)
+        journal.flush()
+        self._written += len(line)
+        self._segment_remaining[seq] += 1
+        if journal.tell() >= JOURNAL_SEGMENT_BYTES:
+            self._segment_seq += 1
+        return seq, self._written
+
+    # Group fsync: one caller syncs every open segment on behalf of all callers waiting for it
+    def _sync(self, position):
+        with self._sync_cond:
+            while self._synced < position:
+                if self._syncing:
+                    self._sync_cond.wait()
+                    continue
+                self._syncing = True
+                synced = self._synced
+                try:
+                    # Duplicated descriptors stay valid if the writer closes a segment meanwhile
+                    with self._lock:
+                        target = self._written
+                        descriptors = [os.dup(journal.fileno()) for journal in self._segments.values()]
+                    self._sync_cond.release()
+                    try:
+                        for fd in descriptors:
+                            os.fsync(fd)
+                        synced = target
+                    finally:
+                        for fd in descriptors:
+                            os.close(fd)
+                        self._sync_cond.acquire()
+                finally:
+                    self._syncing = False
+                    self._synced = max(self._synced, synced)
+                    self._sync_cond.notify_all()
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception:
+            logger.exception('Recovering the ingest journal failed')
+        while True:
+            with self._lock:
+                while not self._queue and not self._stopping:
+                    self._not_empty.wait()
+                if not self._queue:
+                    self._thread = None
+                    return
+                # Give the batch up to flush_interval to fill before committing it
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+            self._commit_with_retry(batch)
+            self._finish(batch)
+            if self._on_commit is not None:
+                self._on_commit()
+            self._prune_receipts()
+
+    # Lock contention is retried with backoff; the batch stays in order meanwhile
+    def _commit_with_retry(self, batch):
+        delay = 0.05
+        while True:
+            try:
+                self._commit(batch)
+                return
+            except sqlite3.OperationalError:
+                logger.exception('Committing a batch of queued shoes failed; retrying')
+                time.sleep(delay)
+                delay = min(delay * 2, 2.0)
+
+    # Outcomes are only published on the entries once the transaction has committed
+    def _commit(self, batch):
+        committed_at = datetime.now().isoformat()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                try:
+                    outcomes = [(conn.execute(self._insert, self._values(entry.record)).lastrowid, 'committed', None) for entry in batch]
+                except sqlite3.IntegrityError:
+                    # Find the offending rows one savepoint at a time and commit the rest
+                    conn.rollback()
+                    conn.execute('BEGIN IMMEDIATE')
+                    outcomes = self._insert_each(conn, batch)
+                conn.executemany(
+                    'INSERT OR REPLACE INTO ingest_receipts (ticket, shoe_id, status, message, committed_at) VALUES (?, ?, ?, ?, ?)',
+                    [(entry.ticket, *outcome, committed_at) for entry, outcome in zip(batch, outcomes)]
+                )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            conn.close()
+        for entry, (shoe_id, status, message) in zip(batch, outcomes):
+            entry.shoe_id, entry.status, entry.message = shoe_id, status, message
+
+    def _insert_each(self, conn, batch):
+        outcomes = []
+        for entry in batch:
+            conn.execute('SAVEPOINT ingest_row')
+            try:
+                outcomes.append((conn.execute(self._insert, self._values(entry.record)).lastrowid, 'committed', None))
+            except sqlite3.IntegrityError as e:
+                conn.execute('ROLLBACK TO ingest_row')
+                outcomes.append((None, 'failed', str(e)))
+            conn.execute('RELEASE ingest_row')
+        return outcomes
+
+    def _values(self, record):
+        return [record.get(column) for column in self.columns]
+
+    # Releases committed entries and the journal segments they no longer need
+    def _finish(self, batch):
+        with self._lock:
+            for entry in batch:
+                self._pending.pop(entry.ticket, None)
+                if entry.status == 'committed':
+                    self.committed += 1
+                else:
+                    self.failed += 1
+                if entry.segment is not None:
+                    self._segment_remaining[entry.segment] -= 1
+            self.batches += 1
+            for seq in [seq for seq, remaining in self._segment_remaining.items() if remaining == 0]:
+                journal = self._segments[seq]
+                if seq == self._segment_seq:
+                    # Everything in the active segment is committed, so start it over
+                    journal.truncate(0)
+                    continue
+                os.remove(journal.name)
+                journal.close()
+                del self._segments[seq]
+                del self._segment_remaining[seq]
+        for entry in batch:
+            entry.done.set()
+
+    def _prune_receipts(self):
+        if time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM ingest_receipts WHERE committed_at < ?',
+                             ((datetime.now() - RECEIPT_RETENTION).isoformat(),))
+        except sqlite3.Error:
+            logger.exception('Pruning ingest receipts failed')
+        finally:
+            conn.close()
+
+    # Commits journal segments left behind by processes that exited before draining them.
+    # Segments still locked by a live process are skipped; receipts make replay idempotent.
+    def recover(self):
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, 'ingest-*.log'))):
+            try:
+                journal = open(path)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                entries = []
+                for line in journal:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash was never acknowledged
+                        continue
+                    entries.append(IngestEntry(item['ticket'], item['record'], None))
+                if entries:
+                    recovered += self._replay(entries)
+                os.remove(path)
+            finally:
+                journal.close()
+        return recovered
+
+    def _replay(self, entries):
+        conn = self._connect()
+        try:
+            placeholders = ', '.join('?' for _ in entries)
+            known = {row[0] for row in conn.execute(
+                f'SELECT ticket FROM ingest_receipts WHERE ticket IN ({placeholders})', [entry.ticket for entry in entries])}
+        finally:
+            conn.close()
+        entries = [entry for entry in entries if entry.ticket not in known]
+        for start in range(0, len(entries), self.batch_size):
+            self._commit_with_retry(entries[start:start + self.batch_size])
+        return len(entries)
@@ -0,0 +1,256 @@
+"""
+live_feed.py
+This file contains the live production feed for the Shoe Database application.
+One tailer thread per process reads newly committed shoes from the shoes table and fans
+them out to Server-Sent Events subscribers, together with today's per-model counters.
+Subscribers only hold a bounded queue, never a database connection. Recent events are
+kept in a ring buffer so a reconnecting client can resume from its Last-Event-ID.
+"""
+
+# Standard library imports
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Shoes read from the table per tailer query
+TAIL_BATCH_SIZE = 1000
+
+class LiveFeedFull(Exception):
+    """Raised when a process already serves its maximum number of subscribers."""
+
+# Formats one Server-Sent Event; events without an id leave the client's Last-Event-ID alone
+def format_event(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+class _Subscriber:
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        # Set when the client fell so far behind that its queue filled up
+        self.overflowed = False
+
+class LiveFeed:
+    """Tails the shoes table and broadcasts new shoes and model counters to SSE subscribers.
+    max_subscribers=None accepts any number; the app derives its limit from the worker threads."""
+
+    def __init__(self, connect, columns, poll_interval=1.0, buffer_size=1000, queue_size=256,
+                 heartbeat_interval=15.0, max_subscribers=None, replay_limit=1000):
+        self._connect = connect
+        self._columns = ', '.join(columns)
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.heartbeat_interval = heartbeat_interval
+        self.max_subscribers = max_subscribers
+        self.replay_limit = replay_limit
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscribers = set()
+        self._thread = None
+        # (shoe id, formatted event) pairs; every shoe with id > _buffer_floor is in the buffer
+        self._buffer = deque(maxlen=buffer_size)
+        self._buffer_floor = None
+        self._last_id = None
+        self._day = None
+        self._counts = {}
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    # Asks the tailer to poll now instead of waiting for the next interval; called after a commit
+    def notify(self):
+        self._wake.set()
+
+    # Registers a subscriber and returns a generator of SSE text. With last_event_id, shoes
+    # after that id are replayed first: from the ring buffer, or from the database when older.
+    def subscribe(self, last_event_id=None):
+        try:
+            last_event_id = int(last_event_id) if last_event_id not in (None, '') else None
+        except ValueError:
+            last_event_id = None
+
+        # Load the starting id here, so a resuming client knows which shoes to read back
+        if self._last_id is None:
+            self._load_state()
+        subscriber = _Subscriber(self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                raise LiveFeedFull()
+            self._subscribers.add(subscriber)
+            counters = self._counters_event()
+            floor = self._buffer_floor
+            buffered = [text for shoe_id, text in self._buffer if last_event_id is not None and shoe_id > last_event_id]
+        self._ensure_started()
+        return self._stream(subscriber, counters, last_event_id, floor, buffered)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'max_subscribers': self.max_subscribers,
+                'buffered_events': len(self._buffer),
+                'last_id': self._last_id,
+                'published': self.published,
+                'dropped_subscribers': self.dropped_subscribers,
+                'running': self._thread is not None,
+            }
+
+    def _stream(self, subscriber, counters, last_event_id, floor, buffered):
+        try:
+            yield 'retry: 3000\n\n'
+            yield counters
+            if last_event_id is not None and floor is not None and last_event_id < floor:
+                yield from self._replay_from_database(last_event_id, floor)
+            yield from buffered
+            while True:
+                try:
+                    yield subscriber.queue.get(timeout=self.heartbeat_interval)
+                except queue.Empty:
+                    if subscriber.overflowed:
+                        return
+                    # Comment lines keep proxies from closing the idle connection
+                    yield ': heartbeat\n\n'
+                    continue
+                if subscriber.overflowed and subscriber.queue.empty():
+                    # The client reconnects and resumes from the last event it received
+                    return
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+    # Shoes the ring buffer no longer holds are read back with a short-lived connection
+    def _replay_from_database(self, last_event_id, floor):
+        conn = self._connect()
+        try:
+            rows = conn.execute(f'''
+                SELECT {self._columns} FROM shoes
+                WHERE id > ? AND id <= ?
+                ORDER BY id
+                LIMIT ?
+            ''', (last_event_id, floor, self.replay_limit + 1)).fetchall()
+        finally:
+            conn.close()
+        if len(rows) > self.replay_limit:
+            # Too far behind to catch up event by event; the client should reload instead
+            yield format_event('reset', {'reason': 'too_far_behind', 'last_id': floor}, floor)
+            return
+        for row in rows:
+            yield format_event('shoe', dict(row), row['id'])
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+                self._thread.start()
+
+    # The tailer runs while anyone is subscribed and stops with the last subscriber;
+    # the next subscriber starts again from the newest shoe rather than catching up
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    self._last_id = None
+                    return
+            try:
+                if self._last_id is None or self._day != date.today().isoformat():
+                    self._load_state()
+                elif self._poll():
+                    # A full batch means more shoes are waiting
+                    continue
+            except Exception:
+                logger.exception('Live feed tailer failed')
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    # Reads the newest id and today's per-model counts from the rollup in one snapshot
+    def _load_state(self):
+        today = date.today().isoformat()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN')
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM shoes').fetchone()[0]
+            counts = conn.execute('''
+                SELECT shoe_model_id, SUM(count) FROM shoe_production_hourly
+                WHERE hour >= ? AND count > 0
+                GROUP BY shoe_model_id
+            ''', (today,)).fetchall()
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        with self._lock:
+            self._day = today
+            self._counts = {model_id: count for model_id, count in counts}
+            # Keep the buffer across a day change; after a restart it starts empty
+            if self._last_id is None or last_id < self._last_id:
+                self._buffer.clear()
+                self._buffer_floor = last_id
+            self._last_id = last_id
+            event = self._counters_event()
+            for subscriber in list(self._subscribers):
+                self._offer(subscriber, event)
+
+    # Publishes shoes committed since the last poll; returns True if the batch was full
+    def _poll(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute(f'''
+                SELECT {self._columns} FROM shoes
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (self._last_id, TAIL_BATCH_SIZE)).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return False
+
+        events = [(row['id'], format_event('shoe', dict(row), row['id'])) for row in rows]
+        with self._lock:
+            for row in rows:
+                if row['created_at'].startswith(self._day):
+                    model_id = row['shoe_model_id'] or 0
+                    self._counts[model_id] = self._counts.get(model_id, 0) + 1
+            if len(self._buffer) + len(events) > self._buffer.maxlen:
+                evicted = len(self._buffer) + len(events) - self._buffer.maxlen
+                self._buffer_floor = (list(self._buffer) + events)[evicted - 1][0]
+            self._buffer.extend(events)
+            self._last_id = rows[-1]['id']
+            self.published += len(events)
+
+            counters = self._counters_event()
+            for subscriber in list(self._subscribers):
+                for _, text in events:
+                    if not self._offer(subscriber, text):
+                        break
+                else:
+                    self._offer(subscriber, counters)
+        return len(rows) == TAIL_BATCH_SIZE
+
+    # Queues an event for one subscriber, dropping the subscriber if its queue is full
+    def _offer(self, subscriber, text):
+        if subscriber.overflowed:
+            return False
+        try:
+            subscriber.queue.put_nowait(text)
+            return True
+        except queue.Full:
+            subscriber.overflowed = True
+            self._subscribers.discard(subscriber)
+            self.dropped_subscribers += 1
+            return False
+
+    def _counters_event(self):
+        return format_event('counters', {
+            'date': self._day,
+            'models': {str(model_id): count for model_id, count in sorted(self._counts.items())},
+            'total': sum(self._counts.values()),
+            'at': time.time(),
+        })
@@ -6,15 +6,22 @@ It defines API endpoints, handles database operations, and manages user authenti
 
 # Standard library imports
 import os
+import io
+import csv
+import hmac
+import json
+import logging
 import sqlite3
-import shutil
-from datetime import datetime, timedelta
+import itertools
+from datetime import datetime
 
 # Third-party imports
 import ssl
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+import click
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, stream_with_context, abort, g
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 from OpenSSL import crypto
 from apscheduler.schedulers.background import BackgroundScheduler
 
@@ -25,17 +32,61 @@ from flask_apispec.views import MethodResource
 from marshmallow import Schema, fields
 from functools import wraps
 from flask_apispec.extension import FlaskApiSpec
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+
+# Local imports
+import db
+import search_index
+import rollups
+import analytics
+import backup
+import partitions
+import migrations
+import ingest
+import idempotency
+import rate_limits
+import metrics
+import profiling
+import api_keys
+from api_keys import ApiKeyRegistry
+from password_hashing import PasswordHasher, HasherBusy
+from backup_jobs import BackupJobs
+from live_feed import LiveFeed, LiveFeedFull
+from cache import LRUCache, ModelCatalogue
 
 # Database paths
 SHOE_DB_PATH = os.getenv('SHOE_DB_PATH', 'database/shoes.db')
 USERS_DB_PATH = os.getenv('USERS_DB_PATH', 'database/users.db')
 MODELS_DB_PATH = os.getenv('MODELS_DB_PATH', 'database/models.db')
 
+# Closed months of shoes are archived here; the current month and SHOE_HOT_MONTHS - 1 before it stay hot
+SHOE_ARCHIVE_DIR = os.getenv('SHOE_ARCHIVE_DIR', os.path.join(os.path.dirname(SHOE_DB_PATH), 'archive'))
+SHOE_HOT_MONTHS = max(int(os.getenv('SHOE_HOT_MONTHS', '2')), 1)
+SHOE_ARCHIVE_SCHEDULE = os.getenv('SHOE_ARCHIVE_SCHEDULE', '0') == '1'
+
+# Profiler settings and samples shared by every worker; profiling is switched on by an admin
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(SHOE_DB_PATH), 'profiles'))
+profiler = profiling.RequestProfiler(PROFILE_DIR)
+
+# Server messages go through logging; LOG_LEVEL=DEBUG shows more, WARNING only problems
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bearer token that lets a scraper read /metrics without an admin session; unset means admins only
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 app = Flask(__name__, template_folder='templates')
 app.secret_key = 'your_secret_key'
 
+# Record per-endpoint latency, response size and SQL usage
+app.before_request(metrics.start_request)
+app.after_request(metrics.record_response)
+# Sample the stacks of a fraction of requests while profiling is on
+app.before_request(profiler.start_request)
+app.teardown_request(profiler.finish_request)
+# Return pooled database connections when the request finishes
+app.teardown_appcontext(db.release_request_connections)
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -46,14 +97,42 @@ class User(UserMixin):
         self.username = username
         self.role = role
 
+# Authenticated users cached by id; role changes, deletions and password resets invalidate entries
+# in every worker through a generation file next to users.db
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+USER_CACHE_GENERATION_PATH = os.path.join(os.path.dirname(USERS_DB_PATH), 'users.generation')
+user_cache = LRUCache(USER_CACHE_SIZE, ttl=USER_CACHE_TTL, generation_path=USER_CACHE_GENERATION_PATH)
+
+# Passwords are hashed and verified on a bounded pool; logins beyond its queue get 429.
+# Stored hashes made with other settings are upgraded to PASSWORD_HASH_METHOD on login.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(min(os.cpu_count() or 2, 4))))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', '16'))
+password_hasher = PasswordHasher(PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS, queue_size=PASSWORD_HASH_QUEUE_SIZE)
+
+def password_hasher_busy_response(error):
+    response = jsonify({'success': False, 'message': 'Too many sign-ins at once. Please try again in a moment.'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 # Flask-Login user loader
 @login_manager.user_loader
 def load_user(user_id):
+    user_id = str(user_id)
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    generation = user_cache.generation
+
     conn = get_users_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+    user = conn.execute('SELECT id, username, role FROM users WHERE id = ?', (user_id,)).fetchone()
     conn.close()
     if user:
-        return User(user['id'], user['username'], user['role'])
+        cached = User(user['id'], user['username'], user['role'])
+        user_cache.set(user_id, cached, generation=generation)
+        return cached
     return None
 
 # Catch-all route for single-page application
@@ -71,7 +150,12 @@ def api_login():
     user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
     conn.close()
 
-    if user and check_password_hash(user['password'], password):
+    try:
+        verified = user is not None and password_hasher.verify(user['password'], password)
+    except HasherBusy as e:
+        return password_hasher_busy_response(e)
+    if verified:
+        upgrade_password_hash(user, password)
         if check_password_expiration(user):
             return jsonify({'success': False, 'message': 'Password expired. Please reset your password.', 'reset_required': True}), 401
         login_user(User(user['id'], user['username'], user['role']))
@@ -79,6 +163,21 @@ def api_login():
     else:
         return jsonify({'success': False, 'message': 'Invalid username or password'}), 401
 
+# Re-hashes a verified password whose stored hash uses other settings than PASSWORD_HASH_METHOD.
+# The upgrade is skipped while the hashing pool is saturated and retried on a later login.
+def upgrade_password_hash(user, password):
+    try:
+        upgraded = password_hasher.upgraded_hash(user['password'], password)
+    except HasherBusy:
+        return
+    if upgraded is None:
+        return
+    conn = get_users_db_connection()
+    # Only replace the hash that was verified, in case the password changed meanwhile
+    conn.execute('UPDATE users SET password = ? WHERE id = ? AND password = ?', (upgraded, user['id'], user['password']))
+    conn.commit()
+    conn.close()
+
 # Check password expiration date
 def check_password_expiration(user):
     if user['role'] == 'admin':
@@ -96,21 +195,134 @@ def api_reset_password():
     conn = get_users_db_connection()
     user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
 
-    if user and check_password_hash(user['password'], current_password):
-        if check_password_hash(user['password'], new_password):
+    try:
+        verified = user is not None and password_hasher.verify(user['password'], current_password)
+        # The stored hash matches the current password, so the new one only needs comparing with that
+        if verified and hmac.compare_digest(new_password.encode(), current_password.encode()):
             conn.close()
             return jsonify({'success': False, 'message': 'New password must be different from the current password.'}), 400
-        
-        hashed_password = generate_password_hash(new_password)
+        hashed_password = password_hasher.hash(new_password) if verified else None
+    except HasherBusy as e:
+        conn.close()
+        return password_hasher_busy_response(e)
+
+    if verified:
         conn.execute('UPDATE users SET password = ?, last_password_change = ? WHERE id = ?', 
                      (hashed_password, datetime.now().date().isoformat(), user['id']))
         conn.commit()
         conn.close()
+        user_cache.invalidate(str(user['id']))
         return jsonify({'success': True, 'message': 'Password reset successfully.'})
     else:
         conn.close()
         return jsonify({'success': False, 'message': 'Invalid username or current password.'}), 401
 
+# Shoe entry either inserts directly (the default) or, with INGEST_MODE=queued, hands validated
+# entries to a writer thread that inserts them in group commits
+INGEST_MODE = os.getenv('INGEST_MODE', 'direct')
+INGEST_DURABILITY = os.getenv('INGEST_DURABILITY', 'disk')
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '500'))
+INGEST_FLUSH_MS = float(os.getenv('INGEST_FLUSH_MS', '50'))
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '10000'))
+INGEST_JOURNAL_DIR = os.getenv('INGEST_JOURNAL_DIR', os.path.join(os.path.dirname(SHOE_DB_PATH), 'ingest'))
+INGEST_COLUMNS = ('model_name', 'shoe_model_id', 'serial_number', 'batch_number', 'created_at', 'created_by')
+ingest_queue = ingest.IngestQueue(
+    lambda: get_shoe_db_connection(),
+    INGEST_COLUMNS,
+    INGEST_JOURNAL_DIR,
+    durability=INGEST_DURABILITY,
+    batch_size=INGEST_BATCH_SIZE,
+    flush_interval=INGEST_FLUSH_MS / 1000,
+    max_queue=INGEST_QUEUE_SIZE,
+    on_commit=lambda: live_feed.notify()
+)
+
+# Queues a validated shoe entry and answers according to how far it got
+def queued_shoe_entry_response(record, model):
+    try:
+        entry = ingest_queue.submit(record)
+    except ingest.IngestQueueFull:
+        response = jsonify({'success': False, 'message': 'Shoe entry queue is full, try again shortly.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+
+    if entry.status == 'failed':
+        return jsonify({'success': False, 'message': f'An error occurred: {entry.message}', 'ticket': entry.ticket}), 409
+
+    response_data = {
+        'success': True,
+        'message': 'Data sent to database successfully!' if entry.status == 'committed' else 'Shoe entry queued.',
+        'model_details': dict(model),
+        'ticket': entry.ticket,
+        'status': entry.status,
+        'shoe_id': entry.shoe_id,
+        'status_url': url_for('api_shoe_entry_ticket', ticket=entry.ticket)
+    }
+    return jsonify(response_data), 200 if entry.status == 'committed' else 202
+
+# How shoe entry treats a serial number that already exists: reject it (the default) or
+# update the existing shoe's model and batch in place
+SHOE_CONFLICT_MODES = ('reject', 'upsert')
+
+# Writes shoe records inside the caller's transaction. Existing serial numbers are found
+# through the unique serial number index and the index of archived serial numbers; archived
+# shoes are read-only, so they are always conflicts. Returns (inserted, updated, conflicts).
+def write_shoe_rows(conn, rows, on_conflict):
+    inserted, updated, conflicts = [], [], []
+    for row, record in rows:
+        existing = conn.execute('SELECT id FROM shoes WHERE serial_number = ?', (record['serial_number'],)).fetchone()
+        archived_id = partitions.archived_serial_owner(conn, record['serial_number']) if existing is None else None
+        if archived_id is not None:
+            conflicts.append({'row': row, 'serial_number': record['serial_number'], 'existing_id': archived_id, 'archived': True})
+        elif existing is None:
+            cursor = conn.execute('''
+                INSERT INTO shoes (model_name, shoe_model_id, serial_number, batch_number, created_at, created_by)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', tuple(record[column] for column in INGEST_COLUMNS))
+            inserted.append({'row': row, 'id': cursor.lastrowid})
+        elif on_conflict == 'upsert':
+            conn.execute('UPDATE shoes SET model_name = ?, shoe_model_id = ?, batch_number = ? WHERE id = ?',
+                         (record['model_name'], record['shoe_model_id'], record['batch_number'], existing['id']))
+            updated.append({'row': row, 'id': existing['id']})
+        else:
+            conflicts.append({'row': row, 'serial_number': record['serial_number'], 'existing_id': existing['id']})
+    return inserted, updated, conflicts
+
+# Runs write(conn) in one write transaction and returns its (body, status, headers). With an
+# Idempotency-Key header the response is stored with the write, and a retry using the same
+# key gets the stored response back instead of writing again.
+def idempotent_write(owner, write):
+    key = request.headers.get('Idempotency-Key')
+    if key is not None and not 0 < len(key) <= idempotency.MAX_KEY_LENGTH:
+        return {'success': False, 'message': f'Idempotency-Key must be 1 to {idempotency.MAX_KEY_LENGTH} characters.'}, 400, {}
+    request_fingerprint = idempotency.fingerprint(request) if key else None
+
+    conn = get_shoe_db_connection()
+    try:
+        # Take the write lock first, so concurrent retries with one key are serialised
+        conn.execute('BEGIN IMMEDIATE')
+        if key:
+            stored = idempotency.lookup(conn, owner, key)
+            if stored is not None:
+                stored_fingerprint, status, body = stored
+                if stored_fingerprint != request_fingerprint:
+                    return {'success': False, 'message': 'Idempotency-Key was already used for a different request.'}, 422, {}
+                return body, status, {'Idempotent-Replayed': 'true'}
+        body, status = write(conn)
+        if key:
+            idempotency.store(conn, owner, key, request_fingerprint, status, body)
+        conn.commit()
+    finally:
+        conn.close()
+    live_feed.notify()
+    return body, status, {}
+
+# Reads ?on_conflict=, returning None when it is not a known mode
+def requested_conflict_mode():
+    on_conflict = request.args.get('on_conflict', 'reject')
+    return on_conflict if on_conflict in SHOE_CONFLICT_MODES else None
+
 # API endpoint for submitting shoe entry data
 @app.route('/api/shoe_entry', methods=['POST'])
 @login_required
@@ -120,70 +332,333 @@ def api_shoe_entry():
         serial_number = request.json['serial_number']
         batch_number = request.json['batch_number']
 
-        # Fetch model details from the models database
-        conn_models = get_models_db_connection()
-        model = conn_models.execute('SELECT * FROM shoe_models WHERE model_name = ?', (model_name,)).fetchone()
-        conn_models.close()
+        # Fetch model details from the model catalogue
+        model = model_catalogue.get_by_name(model_name)
 
         if not model:
             return jsonify({'success': False, 'message': 'Model not found.'}), 404
 
-        conn = get_shoe_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO shoes (model_name, serial_number, batch_number, created_at, created_by)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            model_name,
-            serial_number,
-            batch_number,
-            datetime.now().isoformat(),
-            current_user.username
-        ))
-        conn.commit()
-        conn.close()
-
-        # Prepare the response with all model details
-        response_data = {
-            'success': True,
-            'message': 'Data sent to database successfully!',
-            'model_details': dict(model)
+        on_conflict = requested_conflict_mode()
+        if on_conflict is None:
+            return jsonify({'success': False, 'message': f'on_conflict must be one of: {", ".join(SHOE_CONFLICT_MODES)}.'}), 400
+
+        record = {
+            'model_name': model_name,
+            'shoe_model_id': model['id'],
+            'serial_number': serial_number,
+            'batch_number': batch_number,
+            'created_at': datetime.now().isoformat(),
+            'created_by': current_user.username
         }
 
-        return jsonify(response_data)
+        if INGEST_MODE == 'queued':
+            # Queued entries that reuse a serial number fail at commit, which the ticket reports
+            if on_conflict == 'upsert':
+                return jsonify({'success': False, 'message': 'on_conflict=upsert is not available for queued shoe entry.'}), 400
+            return queued_shoe_entry_response(record, model)
+
+        def write(conn):
+            inserted, updated, conflicts = write_shoe_rows(conn, [(0, record)], on_conflict)
+            if conflicts:
+                return {
+                    'success': False,
+                    'message': 'A shoe with this serial number already exists.',
+                    'conflict': conflicts[0]
+                }, 409
+
+            # Prepare the response with all model details
+            return {
+                'success': True,
+                'message': 'Shoe updated successfully!' if updated else 'Data sent to database successfully!',
+                'model_details': dict(model),
+                'shoe_id': (inserted or updated)[0]['id'],
+                'updated': bool(updated)
+            }, 200
+
+        body, status, headers = idempotent_write(current_user.username, write)
+        return jsonify(body), status, headers
     except sqlite3.Error as e:
+        logger.exception('Database error on %s %s', request.method, request.path)
         return jsonify({'success': False, 'message': f'An error occurred: {e}'}), 500
-    
-# API endpoint for viewing shoe data
+
+# API endpoint reporting whether a queued shoe entry has been persisted
+@app.route('/api/shoe_entry/tickets/<ticket>', methods=['GET'])
+@login_required
+def api_shoe_entry_ticket(ticket):
+    status = ingest_queue.status(ticket)
+    if status is None:
+        return jsonify({'success': False, 'message': 'Ticket not found.'}), 404
+    return jsonify(status)
+
+# API endpoint for retrieving ingest queue metrics
+@app.route('/api/ingest_stats', methods=['GET'])
+@login_required
+def api_get_ingest_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to view this data.'}), 403
+
+    return jsonify(dict(ingest_queue.stats(), mode=INGEST_MODE))
+
+# Maximum number of records accepted by one bulk shoe entry request
+BULK_ENTRY_MAX_ROWS = int(os.getenv('BULK_ENTRY_MAX_ROWS', '5000'))
+SHOE_ENTRY_FIELDS = ('model_name', 'serial_number', 'batch_number')
+
+# Reads bulk shoe records from a JSON array or an NDJSON body, returning (records, errors)
+def parse_bulk_shoe_records():
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        records, errors = [], []
+        for row, line in enumerate(request.get_data(as_text=True).splitlines()):
+            if not line.strip():
+                continue
+            try:
+                records.append((row, json.loads(line)))
+            except ValueError:
+                errors.append({'row': row, 'message': 'Invalid JSON.'})
+        return records, errors
+
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('shoes')
+    if not isinstance(payload, list):
+        return None, [{'row': None, 'message': 'Expected a JSON array or NDJSON body of shoe records.'}]
+    return list(enumerate(payload)), []
+
+# Validates shoe records against the model catalogue, returning (records to write, errors)
+def validate_shoe_records(records, created_by):
+    errors = []
+    valid = []
+    for row, record in records:
+        if not isinstance(record, dict):
+            errors.append({'row': row, 'message': 'Record must be an object.'})
+            continue
+        missing = [field for field in SHOE_ENTRY_FIELDS if not record.get(field)]
+        if missing:
+            errors.append({'row': row, 'message': f'Missing fields: {", ".join(missing)}.'})
+            continue
+        not_strings = [field for field in SHOE_ENTRY_FIELDS if not isinstance(record[field], str)]
+        if not_strings:
+            errors.append({'row': row, 'message': f'Fields must be strings: {", ".join(not_strings)}.'})
+            continue
+        valid.append((row, record))
+
+    # Validate every model name against a single catalogue snapshot
+    known_models = model_catalogue.snapshot().by_name
+
+    created_at = datetime.now().isoformat()
+    to_write = []
+    for row, record in valid:
+        model = known_models.get(record['model_name'])
+        if model is None:
+            errors.append({'row': row, 'message': f"Model not found: {record['model_name']}."})
+            continue
+        to_write.append((row, {
+            'model_name': record['model_name'],
+            'shoe_model_id': model['id'],
+            'serial_number': record['serial_number'],
+            'batch_number': record['batch_number'],
+            'created_at': created_at,
+            'created_by': created_by
+        }))
+
+    return to_write, errors
+
+# Builds the JSON response shared by the bulk shoe entry endpoints, as (body, status, headers).
+# Valid records are written in one transaction; serial number conflicts are reported per row.
+def bulk_shoe_entry_response(created_by, owner=None):
+    records, errors = parse_bulk_shoe_records()
+    if records is None:
+        return {'success': False, 'message': errors[0]['message'], 'inserted': 0, 'errors': []}, 400, {}
+    if len(records) + len(errors) > BULK_ENTRY_MAX_ROWS:
+        return {'success': False, 'message': f'A batch may contain at most {BULK_ENTRY_MAX_ROWS} records.', 'inserted': 0, 'errors': []}, 413, {}
+    on_conflict = requested_conflict_mode()
+    if on_conflict is None:
+        return {'success': False, 'message': f'on_conflict must be one of: {", ".join(SHOE_CONFLICT_MODES)}.', 'inserted': 0, 'errors': []}, 400, {}
+
+    to_write, row_errors = validate_shoe_records(records, created_by)
+    errors = sorted(errors + row_errors, key=lambda error: error['row'])
+
+    def write(conn):
+        inserted, updated, conflicts = write_shoe_rows(conn, to_write, on_conflict)
+        written = len(inserted) + len(updated)
+        if inserted:
+            message = f'{len(inserted)} shoes sent to database.'
+        elif updated:
+            message = 'No new shoes were sent to the database.'
+        else:
+            message = 'No shoes were sent to the database.'
+        if updated:
+            message += f' {len(updated)} existing shoes updated.'
+        result = {
+            'success': not errors and not conflicts,
+            'message': message,
+            'inserted': len(inserted),
+            'updated': len(updated),
+            'conflicts': conflicts,
+            'errors': errors
+        }
+        if written or not (errors or conflicts):
+            return result, 200
+        return result, 409 if conflicts else 400
+
+    try:
+        return idempotent_write(owner or created_by, write)
+    except sqlite3.Error as e:
+        logger.exception('Database error on %s %s', request.method, request.path)
+        return {'success': False, 'message': f'An error occurred: {e}', 'inserted': 0, 'errors': []}, 500, {}
+
+# API endpoint for submitting many shoe entries in one request
+@app.route('/api/shoe_entry/bulk', methods=['POST'])
+@login_required
+def api_bulk_shoe_entry():
+    result, status, headers = bulk_shoe_entry_response(current_user.username)
+    return jsonify(result), status, headers
+
+# Columns the shoe search may filter on, and the supported search modes
+SHOE_SEARCH_COLUMNS = ('model_name', 'serial_number', 'batch_number', 'created_by')
+SHOE_SEARCH_MODES = ('contains', 'prefix', 'exact', 'ranked')
+SHOE_SEARCH_DEFAULT_LIMIT = 100
+SHOE_SEARCH_MAX_LIMIT = 1000
+SHOE_COLUMNS = ('id', 'model_name', 'shoe_model_id', 'serial_number', 'batch_number', 'created_at', 'created_by')
+
+# Returns the smallest string above every string that starts with prefix, or None when there
+# is none (the prefix is all U+10FFFF). Surrogates are skipped since SQLite cannot store them.
+def prefix_upper_bound(prefix):
+    prefix = prefix.rstrip('\U0010ffff')
+    if not prefix:
+        return None
+    next_char = ord(prefix[-1]) + 1
+    if 0xD800 <= next_char <= 0xDFFF:
+        next_char = 0xE000
+    return prefix[:-1] + chr(next_char)
+
+# Returns the ids of catalogue models whose name matches like the shoe search would
+def matching_model_ids(search_term, search_mode):
+    if search_mode == 'exact':
+        matches = lambda name: name == search_term
+    elif search_mode == 'prefix':
+        matches = lambda name: name.startswith(search_term)
+    else:
+        matches = lambda name: search_term.lower() in name.lower()
+    return [model['id'] for model in model_catalogue.all() if matches(model['model_name'])]
+
+# Threads per gunicorn worker; gunicorn.conf.py reads it from here so the live feed can size itself
+GUNICORN_THREADS = max(int(os.getenv('GUNICORN_THREADS', '8')), 2)
+
+# Live feed of new shoes; each worker tails the shoes table once for all of its subscribers.
+# Every stream holds a worker thread, so by default half of the threads are kept for other requests.
+LIVE_FEED_POLL_INTERVAL = float(os.getenv('LIVE_FEED_POLL_INTERVAL', '1'))
+LIVE_FEED_BUFFER_SIZE = int(os.getenv('LIVE_FEED_BUFFER_SIZE', '1000'))
+LIVE_FEED_QUEUE_SIZE = int(os.getenv('LIVE_FEED_QUEUE_SIZE', '256'))
+LIVE_FEED_HEARTBEAT = float(os.getenv('LIVE_FEED_HEARTBEAT', '15'))
+LIVE_FEED_MAX_SUBSCRIBERS = int(os.getenv('LIVE_FEED_MAX_SUBSCRIBERS', str(GUNICORN_THREADS // 2)))
+live_feed = LiveFeed(
+    lambda: get_shoe_db_connection(),
+    SHOE_COLUMNS,
+    poll_interval=LIVE_FEED_POLL_INTERVAL,
+    buffer_size=LIVE_FEED_BUFFER_SIZE,
+    queue_size=LIVE_FEED_QUEUE_SIZE,
+    heartbeat_interval=LIVE_FEED_HEARTBEAT,
+    max_subscribers=LIVE_FEED_MAX_SUBSCRIBERS
+)
+
+# API endpoint streaming new shoes and today's per-model counts as Server-Sent Events
+@app.route('/api/live/shoes', methods=['GET'])
+@login_required
+def api_live_shoes():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        events = live_feed.subscribe(last_event_id)
+    except LiveFeedFull:
+        response = jsonify({'success': False, 'message': 'Too many live feed subscribers, try again later.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# API endpoint for retrieving live feed metrics
+@app.route('/api/live/stats', methods=['GET'])
+@login_required
+def api_get_live_feed_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to view this data.'}), 403
+
+    return jsonify(live_feed.stats())
+
+# API endpoint for viewing shoe data, one keyset page at a time
 @app.route('/api/view_shoes', methods=['GET'])
 @login_required
 def api_view_shoes():
     search_term = request.args.get('search', '')
     search_type = request.args.get('type', 'model_name')
+    search_mode = request.args.get('mode', 'contains')
+
+    if search_type not in SHOE_SEARCH_COLUMNS:
+        return jsonify({'success': False, 'message': 'Invalid search type.'}), 400
+    if search_mode not in SHOE_SEARCH_MODES:
+        return jsonify({'success': False, 'message': 'Invalid search mode.'}), 400
+    try:
+        after_id = int(request.args.get('after_id', 0))
+        limit = min(max(int(request.args.get('limit', SHOE_SEARCH_DEFAULT_LIMIT)), 1), SHOE_SEARCH_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'after_id and limit must be integers.'}), 400
+
+    # Ranked mode returns the best full-text matches, recent months first; terms too short for
+    # trigrams fall back to contains
+    if search_mode == 'ranked':
+        if search_term and search_index.can_use_fulltext(search_term):
+            conn = get_shoe_db_connection()
+            shoes = partitions.search_fulltext(
+                conn, SHOE_ARCHIVE_DIR, ', '.join(f's.{column}' for column in SHOE_COLUMNS),
+                search_index.fulltext_query(search_term, search_type), limit,
+                since=request.args.get('start_date'), until=request.args.get('end_date')
+            )
+            conn.close()
+            return jsonify({'shoes': [{column: row[column] for column in SHOE_COLUMNS} for row in shoes], 'next_after_id': None})
+        search_mode = 'contains'
+
+    where = ''
+    params = []
 
+    # Model searches are resolved against the catalogue and become an integer IN lookup
+    if search_term and search_type == 'model_name':
+        model_ids = matching_model_ids(search_term, search_mode)
+        if not model_ids:
+            return jsonify({'shoes': [], 'next_after_id': None})
+        where = f'AND shoe_model_id IN ({", ".join("?" * len(model_ids))})'
+        params.extend(model_ids)
+    # Prefix and exact searches are index range scans; contains has to scan in id order
+    elif search_term:
+        if search_mode == 'exact':
+            where = f'AND {search_type} = ?'
+            params.append(search_term)
+        elif search_mode == 'prefix':
+            upper_bound = prefix_upper_bound(search_term)
+            where = f'AND {search_type} >= ?'
+            params.append(search_term)
+            if upper_bound is not None:
+                where += f' AND {search_type} < ?'
+                params.append(upper_bound)
+        else:
+            where = f'AND {search_type} LIKE ?'
+            params.append('%' + search_term + '%')
+
+    # Fetch one extra row to know whether another page exists; archived months are
+    # only opened when their id range lies beyond after_id
     conn = get_shoe_db_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    query = '''
-    SELECT 
-        id,
-        model_name,
-        serial_number,
-        batch_number,
-        created_at,
-        created_by
-    FROM shoes
-    WHERE {} LIKE ?
-    '''.format(search_type)
-    
-    cursor.execute(query, ('%' + search_term + '%',))
-    shoes = cursor.fetchall()
+    shoes = partitions.fetch_shoes(conn, SHOE_ARCHIVE_DIR, ', '.join(SHOE_COLUMNS), where, params, after_id, limit + 1)
     conn.close()
-    
-    shoe_list = [dict(row) for row in shoes]
-    
-    return jsonify(shoe_list)
+
+    has_more = len(shoes) > limit
+    shoe_list = [dict(row) for row in shoes[:limit]]
+
+    return jsonify({
+        'shoes': shoe_list,
+        'next_after_id': shoe_list[-1]['id'] if has_more else None
+    })
 
 # API endpoint for creating a new account
 @app.route('/api/create_account', methods=['POST'])
@@ -196,9 +671,13 @@ def api_create_account():
     password = request.json['password']
     role = request.json['role']
 
+    try:
+        hashed_password = password_hasher.hash(password)
+    except HasherBusy as e:
+        return password_hasher_busy_response(e)
+
     conn = get_users_db_connection()
     try:
-        hashed_password = generate_password_hash(password)
         current_date = datetime.now().date().isoformat()
         conn.execute('INSERT INTO users (username, password, role, last_password_change) VALUES (?, ?, ?, ?)',
                      (username, hashed_password, role, current_date))
@@ -235,6 +714,7 @@ def api_update_user_role():
     conn.execute('UPDATE users SET role = ? WHERE id = ?', (new_role, user_id))
     conn.commit()
     conn.close()
+    user_cache.invalidate(str(user_id))
 
     return jsonify({'success': True, 'message': 'User role updated successfully.'})
 
@@ -257,9 +737,77 @@ def api_delete_user():
     conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
     conn.commit()
     conn.close()
+    user_cache.invalidate(str(user_id))
 
     return jsonify({'success': True, 'message': 'User deleted successfully.'})
 
+# API endpoint for listing the API keys issued to external programs
+@app.route('/api/api_keys', methods=['GET'])
+@login_required
+def api_get_api_keys():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to view API keys.'}), 403
+
+    conn = get_users_db_connection()
+    keys = api_keys.list_keys(conn)
+    conn.close()
+    return jsonify([dict(key) for key in keys])
+
+# API endpoint for issuing an API key; the key itself is only shown in this response
+@app.route('/api/api_keys', methods=['POST'])
+@login_required
+def api_create_api_key():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to manage API keys.'}), 403
+
+    name = (request.get_json(silent=True) or {}).get('name')
+    if not isinstance(name, str) or not name.strip():
+        return jsonify({'success': False, 'message': 'A name for the key is required.'}), 400
+
+    conn = get_users_db_connection()
+    try:
+        key_id, api_key = api_keys.create_key(conn, name.strip(), current_user.username)
+    finally:
+        conn.close()
+    api_key_registry.invalidate()
+    return jsonify({'success': True, 'message': 'API key created. Store it now; it cannot be shown again.',
+                    'id': key_id, 'api_key': api_key}), 201
+
+# API endpoint for replacing an API key's secret; the old key stops working
+@app.route('/api/api_keys/<int:key_id>/rotate', methods=['POST'])
+@login_required
+def api_rotate_api_key(key_id):
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to manage API keys.'}), 403
+
+    conn = get_users_db_connection()
+    try:
+        api_key = api_keys.rotate_key(conn, key_id)
+    finally:
+        conn.close()
+    if api_key is None:
+        return jsonify({'success': False, 'message': 'Active API key not found.'}), 404
+    api_key_registry.invalidate()
+    return jsonify({'success': True, 'message': 'API key rotated. Store it now; it cannot be shown again.',
+                    'id': key_id, 'api_key': api_key})
+
+# API endpoint for revoking an API key
+@app.route('/api/api_keys/<int:key_id>', methods=['DELETE'])
+@login_required
+def api_revoke_api_key(key_id):
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to manage API keys.'}), 403
+
+    conn = get_users_db_connection()
+    try:
+        revoked = api_keys.revoke_key(conn, key_id, current_user.username)
+    finally:
+        conn.close()
+    if not revoked:
+        return jsonify({'success': False, 'message': 'Active API key not found.'}), 404
+    api_key_registry.invalidate()
+    return jsonify({'success': True, 'message': 'API key revoked.'})
+
 # API endpoint for adding a new shoe model
 @app.route('/api/add_shoe_model', methods=['POST'])
 @login_required
@@ -302,8 +850,10 @@ def api_add_shoe_model():
         conn.commit()
         new_id = cursor.lastrowid
         conn.close()
+        model_catalogue.invalidate()
         return jsonify({'success': True, 'message': 'Shoe model added successfully!', 'id': new_id})
     except sqlite3.Error as e:
+        logger.exception('Database error on %s %s', request.method, request.path)
         return jsonify({'success': False, 'message': f'An error occurred: {e}'}), 500
 
 # API endpoint for deleting a shoe model
@@ -319,16 +869,30 @@ def api_delete_shoe_model(model_id):
         cursor.execute('DELETE FROM shoe_models WHERE id = ?', (model_id,))
         conn.commit()
         conn.close()
+        model_catalogue.invalidate()
         return jsonify({'success': True, 'message': 'Shoe model deleted successfully!'})
     except sqlite3.Error as e:
+        logger.exception('Database error on %s %s', request.method, request.path)
         return jsonify({'success': False, 'message': f'An error occurred: {e}'}), 500
 
 # API endpoint for retrieving all shoe models
 @app.route('/api/shoe_models', methods=['GET'])
 @login_required
 def api_get_shoe_models():
+    search_term = request.args.get('search', '')
+    if not search_term:
+        return catalogue_response(list(model_catalogue.all()))
+
     conn = get_models_db_connection()
-    models = conn.execute('SELECT * FROM shoe_models').fetchall()
+    if search_index.can_use_fulltext(search_term):
+        models = conn.execute('''
+            SELECT m.* FROM shoe_models_fts
+            JOIN shoe_models m ON m.id = shoe_models_fts.rowid
+            WHERE shoe_models_fts MATCH ?
+            ORDER BY shoe_models_fts.rank
+        ''', (search_index.fulltext_query(search_term),)).fetchall()
+    else:
+        models = conn.execute('SELECT * FROM shoe_models WHERE model_name LIKE ?', ('%' + search_term + '%',)).fetchall()
     conn.close()
     
     return jsonify([dict(model) for model in models])
@@ -344,40 +908,101 @@ def api_get_shoe_creation_data():
     operator = request.args.get('operator', 'all')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    
-    conn_shoes = get_shoe_db_connection()
-    conn_models = get_models_db_connection()
-    
-    query = '''
-        SELECT date(s.created_at) as date, COUNT(*) as count
-        FROM shoes s
-        WHERE 1=1
-    '''
-    params = []
-    
+    granularity = request.args.get('granularity', 'day')
+    brand = request.args.get('brand')
+    category = request.args.get('category')
+
+    if granularity not in rollups.GRANULARITY_BUCKETS:
+        return jsonify({'success': False, 'message': 'Invalid granularity.'}), 400
+
     if model_id != 'all':
-        query += ' AND s.shoe_model_id = ?'
-        params.append(model_id)
-    
-    if operator != 'all':
-        query += ' AND s.created_by = ?'
-        params.append(operator)
-    
-    if start_date:
-        query += ' AND s.created_at >= ?'
-        params.append(start_date)
-    
-    if end_date:
-        query += ' AND s.created_at <= ?'
-        params.append(end_date)
-    
-    query += ' GROUP BY date(s.created_at) ORDER BY date(s.created_at)'
-    
-    data = conn_shoes.execute(query, params).fetchall()
+        try:
+            model_id = int(model_id)
+        except ValueError:
+            return jsonify([])
+
+    # Brand and category filters join the rollup to shoe_models in one statement
+    conn_shoes = get_joined_db_connection()
+    data = rollups.production_counts(
+        conn_shoes,
+        granularity=granularity,
+        model_id=None if model_id == 'all' else model_id,
+        operator=None if operator == 'all' else operator,
+        start_date=start_date,
+        end_date=end_date,
+        brand=brand,
+        category=category
+    )
     conn_shoes.close()
-    conn_models.close()
-    
-    return jsonify([{'date': row['date'], 'count': row['count']} for row in data])
+
+    return jsonify(data)
+
+# Analytics results cached by query; new shoes show up once an entry expires
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', '256'))
+ANALYTICS_CACHE_TTL = float(os.getenv('ANALYTICS_CACHE_TTL', '60'))
+analytics_cache = LRUCache(ANALYTICS_CACHE_SIZE, ttl=ANALYTICS_CACHE_TTL)
+
+# API endpoint for grouped production analytics: counts per time bucket and group, with
+# throughput per operator-hour and an optional moving average, all computed in SQL
+@app.route('/api/analytics/production', methods=['GET'])
+@login_required
+def api_get_production_analytics():
+    if current_user.role not in ['admin', 'prodeng']:
+        return jsonify({'success': False, 'message': 'You do not have permission to view this data.'}), 403
+
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in rollups.GRANULARITY_BUCKETS:
+        return jsonify({'success': False, 'message': 'Invalid granularity.'}), 400
+
+    group_by = tuple(dict.fromkeys(field.strip() for field in request.args.get('group_by', '').split(',') if field.strip()))
+    if any(field not in analytics.GROUP_BY_FIELDS for field in group_by):
+        return jsonify({'success': False, 'message': f"group_by must be a comma-separated list of: {', '.join(analytics.GROUP_BY_FIELDS)}."}), 400
+
+    try:
+        moving_average = int(request.args.get('moving_average', '0'))
+    except ValueError:
+        moving_average = -1
+    if not 0 <= moving_average <= analytics.MAX_MOVING_AVERAGE_WINDOW:
+        return jsonify({'success': False, 'message': f'moving_average must be between 0 and {analytics.MAX_MOVING_AVERAGE_WINDOW}.'}), 400
+
+    model_id = request.args.get('model_id', 'all')
+    if model_id != 'all':
+        try:
+            model_id = int(model_id)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid model_id.'}), 400
+
+    operator = request.args.get('operator', 'all')
+    filters = {
+        'model_id': None if model_id == 'all' else model_id,
+        'operator': None if operator == 'all' else operator,
+        'brand': request.args.get('brand'),
+        'category': request.args.get('category'),
+        'start_date': request.args.get('start_date') or None,
+        'end_date': request.args.get('end_date') or None,
+    }
+
+    key = (granularity, group_by, moving_average, *sorted(filters.items()))
+    rows = analytics_cache.get(key)
+    if rows is None:
+        conn_shoes = get_joined_db_connection()
+        rows = analytics.production_analytics(
+            conn_shoes,
+            SHOE_ARCHIVE_DIR,
+            granularity=granularity,
+            group_by=group_by,
+            moving_average=moving_average,
+            **filters
+        )
+        conn_shoes.close()
+        analytics_cache.set(key, rows)
+
+    return jsonify({
+        'granularity': granularity,
+        'group_by': list(group_by),
+        'moving_average': moving_average or None,
+        'rows': rows
+    })
 
 # API endpoint for retrieving shoe models and operators for graphs
 @app.route('/api/shoe_models_and_operators', methods=['GET'])
@@ -386,12 +1011,11 @@ def api_get_shoe_models_and_operators():
     if current_user.role not in ['admin', 'prodeng']:
         return jsonify({'success': False, 'message': 'You do not have permission to view this data.'}), 403
     
-    conn_models = get_models_db_connection()
-    models = conn_models.execute('SELECT id, model_name FROM shoe_models').fetchall()
-    conn_models.close()
+    models = model_catalogue.all()
 
+    # The rollup covers archived months too and is far smaller than the shoes table
     conn_shoes = get_shoe_db_connection()
-    operators = conn_shoes.execute('SELECT DISTINCT created_by FROM shoes').fetchall()
+    operators = conn_shoes.execute('SELECT DISTINCT created_by FROM shoe_production_hourly ORDER BY created_by').fetchall()
     conn_shoes.close()
     
     return jsonify({
@@ -399,23 +1023,126 @@ def api_get_shoe_models_and_operators():
         'operators': [operator['created_by'] for operator in operators]
     })
 
-# Helper function to get a connection to the shoe database
+# Helper function to get a pooled connection to the shoe database with the users and
+# models databases attached, for queries that join shoes to users or model attributes
+def get_joined_db_connection():
+    return db.connect('joined', SHOE_DB_PATH, attach=(('users_db', USERS_DB_PATH), ('models_db', MODELS_DB_PATH)))
+
+# The distinct database files; all three settings may point at one consolidated file
+def database_paths():
+    return list(dict.fromkeys(os.path.abspath(path) for path in (SHOE_DB_PATH, USERS_DB_PATH, MODELS_DB_PATH)))
+
+# Helper function to get a pooled connection to the shoe database
 def get_shoe_db_connection():
-    conn = sqlite3.connect(SHOE_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db.connect('shoes', SHOE_DB_PATH)
 
-# Helper function to get a connection to the users database
+# Helper function to get a pooled connection to the users database
 def get_users_db_connection():
-    conn = sqlite3.connect(USERS_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db.connect('users', USERS_DB_PATH)
 
-# Helper function to get a connection to the models database
+# Helper function to get a pooled connection to the models database
 def get_models_db_connection():
-    conn = sqlite3.connect(MODELS_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db.connect('models', MODELS_DB_PATH)
+
+# Loads every shoe model for the catalogue cache
+def load_shoe_models():
+    conn = get_models_db_connection()
+    models = conn.execute('SELECT * FROM shoe_models').fetchall()
+    conn.close()
+    return models
+
+# In-process shoe model catalogue; writes invalidate it, the TTL bounds staleness across workers
+MODEL_CACHE_TTL = float(os.getenv('MODEL_CACHE_TTL', '60'))
+model_catalogue = ModelCatalogue(load_shoe_models, ttl=MODEL_CACHE_TTL)
+
+# Loads the active API keys for the key registry
+def load_api_keys():
+    conn = get_users_db_connection()
+    keys = conn.execute('SELECT id, name, key_hash FROM api_keys WHERE revoked_at IS NULL').fetchall()
+    conn.close()
+    return keys
+
+# In-process API key registry; writes in any worker (or the CLI) replace the generation file,
+# which makes every worker reload on its next lookup. The TTL is only a backstop.
+API_KEY_CACHE_TTL = float(os.getenv('API_KEY_CACHE_TTL', '300'))
+API_KEY_GENERATION_PATH = os.path.join(os.path.dirname(USERS_DB_PATH), 'api_keys.generation')
+api_key_registry = ApiKeyRegistry(load_api_keys, ttl=API_KEY_CACHE_TTL, generation_path=API_KEY_GENERATION_PATH)
+
+# Builds a JSON response carrying the catalogue's ETag/Last-Modified, answering 304 when unchanged
+def catalogue_response(payload):
+    snapshot = model_catalogue.snapshot()
+    response = jsonify(payload)
+    response.set_etag(snapshot.etag)
+    response.last_modified = snapshot.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+# API endpoint for retrieving cache metrics
+@app.route('/api/cache_stats', methods=['GET'])
+@login_required
+def api_get_cache_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to view this data.'}), 403
+
+    return jsonify({'model_catalogue': model_catalogue.stats(), 'users': user_cache.stats(), 'analytics': analytics_cache.stats(), 'api_keys': api_key_registry.stats()})
+
+# API endpoint for retrieving password hashing pool metrics
+@app.route('/api/password_hash_stats', methods=['GET'])
+@login_required
+def api_get_password_hash_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to view this data.'}), 403
+
+    return jsonify(password_hasher.stats())
+
+# API endpoint for retrieving connection pool metrics
+@app.route('/api/db_pool_stats', methods=['GET'])
+@login_required
+def api_get_db_pool_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to view this data.'}), 403
+
+    return jsonify(db.pool_stats())
+
+# Prometheus endpoint for the request, SQL and connection pool metrics of this worker process
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    scraper = bool(METRICS_TOKEN) and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())
+    if not scraper and not (current_user.is_authenticated and current_user.role == 'admin'):
+        return jsonify({'success': False, 'message': 'You do not have permission to view this data.'}), 403
+
+    return Response(metrics.render(db.pool_stats()), mimetype='text/plain; version=0.0.4')
+
+# API endpoints for switching the request profiler on and off and reading its per-route summary
+@app.route('/api/profiling', methods=['GET', 'POST', 'DELETE'])
+@login_required
+def api_profiling():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to profile requests.'}), 403
+
+    if request.method == 'POST':
+        options = request.get_json(silent=True) or {}
+        sample_rate = options.get('sample_rate', 0.1)
+        routes = options.get('routes') or []
+        if not isinstance(sample_rate, (int, float)) or not 0 < sample_rate <= 1:
+            return jsonify({'success': False, 'message': 'sample_rate must be a number above 0 and at most 1.'}), 400
+        if not isinstance(routes, list) or not all(isinstance(route, str) for route in routes):
+            return jsonify({'success': False, 'message': 'routes must be a list of URL rules or endpoint names.'}), 400
+        profiler.enable(sample_rate, routes, enabled_by=current_user.username)
+    elif request.method == 'DELETE':
+        profiler.disable()
+    return jsonify({'success': True, **profiler.summary()})
+
+# API endpoint for downloading the sampled stacks in collapsed format for flamegraph tools
+@app.route('/api/profiling/stacks', methods=['GET'])
+@login_required
+def api_profiling_stacks():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to profile requests.'}), 403
+
+    return Response(profiler.collapsed_stacks(request.args.get('route')), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename=profile.collapsed'})
 
 # API endpoint for user logout
 @app.route('/api/logout', methods=['GET'])
@@ -424,43 +1151,96 @@ def api_logout():
     logout_user()
     return jsonify({'success': True, 'message': 'Logged out successfully.'})
 
-# Add this function to handle database backups
-def backup_databases(override=False):
-    backup_dir = os.path.join(os.path.dirname(os.path.dirname(SHOE_DB_PATH)), 'database', 'backup')
-    os.makedirs(backup_dir, exist_ok=True)
+# Backup configuration
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join(os.path.dirname(os.path.dirname(SHOE_DB_PATH)), 'database', 'backup'))
+BACKUP_MODE = os.getenv('BACKUP_MODE', 'full')
+BACKUP_COMPRESS = os.getenv('BACKUP_COMPRESS', '0') == '1'
 
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    existing_files = []
+# Keeps the parts of a backup manifest worth reporting to clients
+def backup_summary(manifest):
+    return {key: manifest[key] for key in ('database', 'type', 'file', 'compressed', 'bytes', 'source_bytes', 'pages_written', 'duration_seconds')}
 
-    for db_path in [SHOE_DB_PATH, USERS_DB_PATH, MODELS_DB_PATH]:
-        db_name = os.path.basename(db_path)
-        backup_path = os.path.join(backup_dir, f'{db_name}_{timestamp}.bak')
-        if os.path.exists(backup_path) and not override:
-            existing_files.append(backup_path)
-        else:
-            shutil.copy2(db_path, backup_path)
-            print(f'Backed up {db_path} to {backup_path}')
+# Takes an online backup of every database, then prunes expired backups.
+# progress, if given, is called with (database, bytes_done, bytes_total) across all databases.
+def backup_databases(override=False, incremental=None, compress=None, timestamp=None, progress=None):
+    incremental = BACKUP_MODE == 'incremental' if incremental is None else incremental
+    compress = BACKUP_COMPRESS if compress is None else compress
+    timestamp = timestamp or datetime.now().strftime(backup.TIMESTAMP_FORMAT)
+    db_paths = database_paths()
 
+    existing_files = existing_backup_files(timestamp)
     if existing_files and not override:
-        return False, existing_files
-
-    # Remove backups older than 30 days
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    for db_path in [SHOE_DB_PATH, USERS_DB_PATH, MODELS_DB_PATH]:
-        db_name = os.path.basename(db_path)
-        for backup_file in os.listdir(backup_dir):
-            if backup_file.startswith(db_name):
-                backup_path = os.path.join(backup_dir, backup_file)
-                if os.path.isfile(backup_path):
-                    try:
-                        file_timestamp = datetime.strptime(backup_file.split('_')[-1].split('.')[0], '%Y%m%d_%H%M%S')
-                        if file_timestamp < thirty_days_ago:
-                            os.remove(backup_path)
-                            print(f'Removed old backup: {backup_path}')
-                    except ValueError:
-                        print(f'Skipping file with invalid timestamp format: {backup_file}')
-
-    return True, []
+        return False, existing_files, []
+
+    # File sizes are the estimate until the backup of each database reports its real size
+    sizes = [os.path.getsize(db_path) for db_path in db_paths]
+    reports = []
+    for index, db_path in enumerate(db_paths):
+        database = os.path.basename(db_path)
+
+        def report_progress(bytes_done, bytes_total, index=index, database=database):
+            sizes[index] = bytes_total
+            if progress:
+                progress(database, sum(sizes[:index]) + bytes_done, sum(sizes))
+
+        manifest = backup.backup_database(db_path, BACKUP_DIR, timestamp, incremental=incremental, compress=compress, progress=report_progress)
+        logger.info('Backed up %s to %s (%s, %s bytes, %ss)', db_path, manifest['file'], manifest['type'], manifest['bytes'], manifest['duration_seconds'])
+        reports.append(backup_summary(manifest))
+
+    # Closed partitions never change, so they are only copied when new
+    for report in backup.backup_archives(SHOE_ARCHIVE_DIR, BACKUP_DIR):
+        logger.info('Backed up archive %s (%s bytes)', report['database'], report['bytes'])
+        reports.append(report)
+
+    for removed in backup.prune_backups(BACKUP_DIR):
+        logger.info('Removed old backup: %s', removed)
+
+    return True, [], reports
+
+def existing_backup_files(timestamp):
+    existing_files = []
+    for db_path in database_paths():
+        existing_files.extend(backup.existing_backup_files(BACKUP_DIR, os.path.basename(db_path), timestamp))
+    return existing_files
+
+# Runs a backup for a background job and returns the report the job stores
+def run_backup_job(progress=None, override=False, incremental=None, compress=None, timestamp=None):
+    success, existing_files, reports = backup_databases(override=override, incremental=incremental, compress=compress, timestamp=timestamp, progress=progress)
+    if not success:
+        raise backup.BackupError(f'Backup files already exist: {", ".join(existing_files)}')
+    return {
+        'backups': reports,
+        'duration_seconds': round(sum(report['duration_seconds'] for report in reports), 3),
+        'bytes': sum(report['bytes'] for report in reports)
+    }
+
+backup_jobs = BackupJobs(BACKUP_DIR, run_backup_job)
+
+# Reads the optional backup options sent with a manual backup request
+def requested_backup_options():
+    options = request.get_json(silent=True) or {}
+    incremental = options.get('mode', BACKUP_MODE) == 'incremental'
+    compress = bool(options.get('compress', BACKUP_COMPRESS))
+    return incremental, compress
+
+# Starts a backup job and returns 202 with the job to poll
+def backup_job_response(override):
+    incremental, compress = requested_backup_options()
+    timestamp = datetime.now().strftime(backup.TIMESTAMP_FORMAT)
+    if not override:
+        existing_files = existing_backup_files(timestamp)
+        if existing_files:
+            return jsonify({'success': False, 'message': 'Existing backup files found.', 'existing_files': existing_files}), 409
+
+    job, deduplicated = backup_jobs.submit(override=override, incremental=incremental, compress=compress, timestamp=timestamp)
+    message = 'A backup is already running.' if deduplicated else 'Backup started.'
+    return jsonify({
+        'success': True,
+        'message': message,
+        'deduplicated': deduplicated,
+        'job': job,
+        'status_url': url_for('api_backup_job_status', job_id=job['id'])
+    }), 202
 
 # API endpoint for performing a manual backup
 @app.route('/api/manual_backup', methods=['POST'])
@@ -470,10 +1250,7 @@ def api_manual_backup():
         return jsonify({'success': False, 'message': 'You do not have permission to perform manual backups.'}), 403
     
     try:
-        success, existing_files = backup_databases()
-        if not success:
-            return jsonify({'success': False, 'message': 'Existing backup files found.', 'existing_files': existing_files}), 409
-        return jsonify({'success': True, 'message': 'Manual backup performed successfully.'})
+        return backup_job_response(override=False)
     except Exception as e:
         return jsonify({'success': False, 'message': f'An error occurred during backup: {str(e)}'}), 500
 
@@ -485,24 +1262,39 @@ def api_confirm_backup_overwrite():
         return jsonify({'success': False, 'message': 'You do not have permission to perform manual backups.'}), 403
     
     try:
-        success, _ = backup_databases(override=True)
-        if success:
-            return jsonify({'success': True, 'message': 'Manual backup performed successfully, overwriting existing files.'})
-        else:
-            return jsonify({'success': False, 'message': 'Failed to perform backup with overwrite.'}), 500
+        return backup_job_response(override=True)
     except Exception as e:
         return jsonify({'success': False, 'message': f'An error occurred during backup: {str(e)}'}), 500
 
+# API endpoint for polling the status and progress of a backup job
+@app.route('/api/backup_jobs/<job_id>', methods=['GET'])
+@login_required
+def api_backup_job_status(job_id):
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to view backups.'}), 403
+
+    job = backup_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Backup job not found.'}), 404
+    return jsonify({'success': True, 'job': job})
+
+# API endpoint for listing recent backup jobs
+@app.route('/api/backup_jobs', methods=['GET'])
+@login_required
+def api_backup_jobs():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'You do not have permission to view backups.'}), 403
+
+    return jsonify({'success': True, 'jobs': backup_jobs.recent()})
+
 # API endpoint for retrieving details of a specific shoe model
 @app.route('/api/shoe_model_details/<model_name>', methods=['GET'])
 @login_required
 def api_get_shoe_model_details(model_name):
-    conn = get_models_db_connection()
-    model = conn.execute('SELECT * FROM shoe_models WHERE model_name = ?', (model_name,)).fetchone()
-    conn.close()
-    
+    model = model_catalogue.get_by_name(model_name)
+
     if model:
-        return jsonify(dict(model))
+        return catalogue_response(model)
     else:
         return jsonify({'error': 'Model not found'}), 404
 
@@ -541,21 +1333,30 @@ def api_edit_shoe_model(model_id):
         ))
         conn.commit()
         conn.close()
+        model_catalogue.invalidate()
         return jsonify({'success': True, 'message': 'Shoe model updated successfully!'})
     except sqlite3.Error as e:
+        logger.exception('Database error on %s %s', request.method, request.path)
         return jsonify({'success': False, 'message': f'An error occurred: {e}'}), 500
     
 """This code is API for external programs to connect to this one."""
 api = Api(app)
 docs = FlaskApiSpec(app)
 
+# Returns the registry's ApiKey for the request's X-API-Key, or None. The key is verified once
+# per request and kept as g.api_key, so the rate limiter and require_api_key agree on it.
+def request_api_key():
+    if 'api_key' not in g:
+        g.api_key = api_key_registry.verify(request.headers.get('X-API-Key'))
+    return g.api_key
+
+# Accepts requests whose X-API-Key is an active key of the registry and exposes it as g.api_key
 def require_api_key(view_function):
     @wraps(view_function)
     def decorated_function(*args, **kwargs):
-        if request.headers.get('X-API-Key') and request.headers.get('X-API-Key') == 'your_api_key_here':
-            return view_function(*args, **kwargs)
-        else:
+        if request_api_key() is None:
             abort(401)
+        return view_function(*args, **kwargs)
     return decorated_function
 
 class ShoeModelSchema(Schema):
@@ -572,49 +1373,516 @@ class ShoeModelSchema(Schema):
     price = fields.Float()
     release_date = fields.Str()
 
+# Responses that are not the schema's payload are returned as Response objects, so that
+# marshal_with passes them through unchanged
+def api_error(message, status):
+    response = jsonify({'message': message})
+    response.status_code = status
+    return response
+
+# Reads ?fields= as a comma-separated subset of allowed, returning all of them by default
+def requested_fields(allowed):
+    requested = request.args.get('fields')
+    if not requested:
+        return tuple(allowed)
+    names = tuple(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    if not names or any(name not in allowed for name in names):
+        raise ValueError(f'fields must be a comma-separated list of: {", ".join(allowed)}.')
+    return names
+
+# Reads ?limit= for a keyset page, or None when no page was asked for
+def requested_page_limit():
+    limit = request.args.get('limit')
+    if limit is None:
+        return None
+    return min(max(int(limit), 1), SHOE_SEARCH_MAX_LIMIT)
+
+# Catalogue fields the shoe model list may be filtered on by exact value
+SHOE_MODEL_FILTERS = ('brand', 'category', 'gender', 'material', 'sole_type', 'closure_type', 'color')
+
 class ShoeModelListAPI(MethodResource, Resource):
     @require_api_key
-    @doc(description='Get all shoe models')
+    @doc(description='Get shoe models, optionally filtered and paged by id',
+         params=dict({
+             'fields': {'description': 'Comma-separated fields to return', 'in': 'query', 'type': 'string', 'required': False},
+             'limit': {'description': f'Return one page of at most this many models (up to {SHOE_SEARCH_MAX_LIMIT})', 'in': 'query', 'type': 'integer', 'required': False},
+             'since_id': {'description': 'Only return models with a greater id', 'in': 'query', 'type': 'integer', 'required': False}
+         }, **{field: {'description': f'Only return models with this {field}', 'in': 'query', 'type': 'string', 'required': False}
+               for field in SHOE_MODEL_FILTERS}))
     @marshal_with(ShoeModelSchema(many=True))
     def get(self):
-        conn = get_models_db_connection()
-        models = conn.execute('SELECT * FROM shoe_models').fetchall()
-        conn.close()
-        return models
+        try:
+            names = requested_fields(tuple(ShoeModelSchema._declared_fields))
+        except ValueError as e:
+            return api_error(str(e), 400)
+        try:
+            limit = requested_page_limit()
+            since_id = int(request.args.get('since_id', 0))
+        except ValueError:
+            return api_error('limit and since_id must be integers.', 400)
+
+        # The catalogue is held in memory, so filtering and paging it costs no query
+        filters = {field: request.args[field] for field in SHOE_MODEL_FILTERS if request.args.get(field)}
+        models = sorted((model for model in model_catalogue.all()
+                         if model['id'] > since_id and all(model[field] == value for field, value in filters.items())),
+                        key=lambda model: model['id'])
+        schema = ShoeModelSchema(many=True, only=names)
+        if limit is None:
+            return catalogue_response(schema.dump(models))
+
+        page = models[:limit]
+        return catalogue_response({
+            'shoe_models': schema.dump(page),
+            'next_since_id': page[-1]['id'] if len(models) > limit else None
+        })
+
+class ShoeModelAPI(MethodResource, Resource):
+    @require_api_key
+    @doc(description='Get one shoe model by id',
+         params={'fields': {'description': 'Comma-separated fields to return', 'in': 'query', 'type': 'string', 'required': False}})
+    @marshal_with(ShoeModelSchema)
+    def get(self, model_id):
+        try:
+            names = requested_fields(tuple(ShoeModelSchema._declared_fields))
+        except ValueError as e:
+            return api_error(str(e), 400)
+        model = model_catalogue.get_by_id(model_id)
+        if model is None:
+            return api_error('Shoe model not found.', 404)
+        return catalogue_response(ShoeModelSchema(only=names).dump(model))
 
 class ShoeSchema(Schema):
     id = fields.Int(dump_only=True)
     model_name = fields.Str()
+    shoe_model_id = fields.Int()
     serial_number = fields.Str()
     batch_number = fields.Str()
     created_at = fields.Str()
     created_by = fields.Str()
 
+# Streamed export formats for the shoes resource and the rows fetched per chunk
+SHOE_EXPORT_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+SHOE_EXPORT_CHUNK_SIZE = int(os.getenv('SHOE_EXPORT_CHUNK_SIZE', '1000'))
+
+# Picks the export format from ?format= or, failing that, the Accept header
+def negotiate_shoe_export_format():
+    requested = request.args.get('format')
+    if requested:
+        return requested if requested in SHOE_EXPORT_FORMATS else None
+    best = request.accept_mimetypes.best_match(list(SHOE_EXPORT_FORMATS.values()), default='application/json')
+    return next(name for name, mimetype in SHOE_EXPORT_FORMATS.items() if mimetype == best)
+
+# Builds the WHERE fragment for the /api/v1/shoes filters, returning (where, params, since, until).
+# Model, batch and operator each have an index that also yields rows in id order.
+# Raises ValueError for a malformed model_id or timestamp.
+def shoe_list_filters():
+    clauses, params = [], []
+    if request.args.get('model_id'):
+        clauses.append('shoe_model_id = ?')
+        params.append(int(request.args['model_id']))
+    if request.args.get('model_name'):
+        # Resolved through the catalogue; an unknown name matches no shoes
+        model = model_catalogue.get_by_name(request.args['model_name'])
+        clauses.append('shoe_model_id = ?')
+        params.append(model['id'] if model else 0)
+    if request.args.get('batch_number'):
+        clauses.append('batch_number = ?')
+        params.append(request.args['batch_number'])
+    if request.args.get('operator'):
+        clauses.append('created_by = ?')
+        params.append(request.args['operator'])
+
+    since = request.args.get('since')
+    until = request.args.get('until')
+    since = datetime.fromisoformat(since).isoformat() if since else None
+    until = datetime.fromisoformat(until).isoformat() if until else None
+    if since:
+        clauses.append('created_at >= ?')
+        params.append(since)
+    if until:
+        clauses.append('created_at < ?')
+        params.append(until)
+    return ''.join(f' AND {clause}' for clause in clauses), params, since, until
+
+# Selected columns always include id, which the keyset cursor and partition merge need
+def shoe_select_columns(names):
+    return ', '.join(('id',) + tuple(name for name in names if name != 'id'))
+
+# Yields matching shoes after since_id in chunks, serialised as they are read
+def stream_shoes(export_format, since_id, names, where, params, since, until):
+    schema = ShoeSchema(many=True, only=names)
+    conn = get_shoe_db_connection()
+    try:
+        # Archived months outside since_id and the since/until range are never opened
+        rows = partitions.iter_shoes(conn, SHOE_ARCHIVE_DIR, shoe_select_columns(names), where, params,
+                                     after_id=since_id, since=since, until=until)
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=list(names))
+            writer.writeheader()
+            yield buffer.getvalue()
+        elif export_format == 'json':
+            yield '['
+
+        first = True
+        while True:
+            chunk = list(itertools.islice(rows, SHOE_EXPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+            shoes = schema.dump(chunk)
+            if export_format == 'csv':
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(shoes)
+                yield buffer.getvalue()
+            elif export_format == 'ndjson':
+                yield ''.join(json.dumps(shoe) + '\n' for shoe in shoes)
+            else:
+                chunk = ','.join(json.dumps(shoe) for shoe in shoes)
+                yield chunk if first else ',' + chunk
+            first = False
+
+        if export_format == 'json':
+            yield ']'
+    finally:
+        rows.close()
+        conn.close()
+
+# Query parameters shared by the shoe list and export
+SHOE_LIST_PARAMS = {
+    'fields': {'description': 'Comma-separated fields to return', 'in': 'query', 'type': 'string', 'required': False},
+    'since_id': {'description': 'Only return shoes with a greater id', 'in': 'query', 'type': 'integer', 'required': False},
+    'since': {'description': 'Only return shoes created at or after this ISO timestamp', 'in': 'query', 'type': 'string', 'required': False},
+    'until': {'description': 'Only return shoes created before this ISO timestamp', 'in': 'query', 'type': 'string', 'required': False},
+    'model_id': {'description': 'Only return shoes of this model id', 'in': 'query', 'type': 'integer', 'required': False},
+    'model_name': {'description': 'Only return shoes of this model', 'in': 'query', 'type': 'string', 'required': False},
+    'batch_number': {'description': 'Only return shoes of this batch', 'in': 'query', 'type': 'string', 'required': False},
+    'operator': {'description': 'Only return shoes entered by this user', 'in': 'query', 'type': 'string', 'required': False}
+}
+
 class ShoeListAPI(MethodResource, Resource):
     @require_api_key
-    @doc(description='Get all produced shoes')
+    @doc(description='Get produced shoes. With limit, one JSON page and the next_since_id cursor; '
+                     'otherwise the full export streamed as JSON, NDJSON or CSV (chosen by ?format= or the Accept header)',
+         params=dict(SHOE_LIST_PARAMS, **{
+             'limit': {'description': f'Return one page of at most this many shoes (up to {SHOE_SEARCH_MAX_LIMIT})', 'in': 'query', 'type': 'integer', 'required': False},
+             'format': {'description': 'json, ndjson or csv', 'in': 'query', 'type': 'string', 'required': False}
+         }))
     @marshal_with(ShoeSchema(many=True))
     def get(self):
+        export_format = negotiate_shoe_export_format()
+        try:
+            names = requested_fields(tuple(ShoeSchema._declared_fields))
+        except ValueError as e:
+            return api_error(str(e), 400)
+        try:
+            since_id = int(request.args.get('since_id', 0))
+            limit = requested_page_limit()
+            where, params, since, until = shoe_list_filters()
+        except ValueError:
+            return api_error('since_id, limit and model_id must be integers and since and until ISO timestamps.', 400)
+        if export_format is None:
+            return api_error(f'format must be one of: {", ".join(SHOE_EXPORT_FORMATS)}.', 400)
+
+        if limit is None:
+            return Response(
+                stream_with_context(stream_shoes(export_format, since_id, names, where, params, since, until)),
+                mimetype=SHOE_EXPORT_FORMATS[export_format]
+            )
+
+        if export_format != 'json':
+            return api_error('Pages are returned as JSON; leave out limit to export NDJSON or CSV.', 400)
         conn = get_shoe_db_connection()
-        shoes = conn.execute('SELECT * FROM shoes').fetchall()
-        conn.close()
-        return shoes
+        try:
+            # One row past the page tells whether there is a next page
+            rows = partitions.fetch_shoes(conn, SHOE_ARCHIVE_DIR, shoe_select_columns(names), where, params,
+                                          since_id, limit + 1, since=since, until=until)
+        finally:
+            conn.close()
+        page = rows[:limit]
+        return jsonify({
+            'shoes': ShoeSchema(many=True, only=names).dump(page),
+            'next_since_id': page[-1]['id'] if len(rows) > limit else None
+        })
+
+    @require_api_key
+    @doc(description='Create one shoe from a {model_name, serial_number, batch_number} record',
+         params={'on_conflict': {'description': 'reject (default) or upsert an existing serial number', 'in': 'query', 'type': 'string', 'required': False}})
+    def post(self):
+        on_conflict = requested_conflict_mode()
+        if on_conflict is None:
+            return api_error(f'on_conflict must be one of: {", ".join(SHOE_CONFLICT_MODES)}.', 400)
+        to_write, errors = validate_shoe_records([(0, request.get_json(silent=True))], 'api')
+        if errors:
+            return api_error(errors[0]['message'], 400)
+
+        def write(conn):
+            inserted, updated, conflicts = write_shoe_rows(conn, to_write, on_conflict)
+            if conflicts:
+                return {'message': 'A shoe with this serial number already exists.', 'conflict': conflicts[0]}, 409
+            shoe_id = (inserted or updated)[0]['id']
+            row = conn.execute(f'SELECT {", ".join(SHOE_COLUMNS)} FROM shoes WHERE id = ?', (shoe_id,)).fetchone()
+            return ShoeSchema().dump(row), 201 if inserted else 200
+
+        try:
+            body, status, headers = idempotent_write(f'api:{g.api_key.id}', write)
+        except sqlite3.Error as e:
+            logger.exception('Database error on %s %s', request.method, request.path)
+            return api_error(f'An error occurred: {e}', 500)
+        response = jsonify(body)
+        response.status_code = status
+        response.headers.update(headers)
+        return response
+
+# Fields of a shoe that may be changed through the API
+SHOE_UPDATE_FIELDS = SHOE_ENTRY_FIELDS
+
+class ShoeAPI(MethodResource, Resource):
+    @require_api_key
+    @doc(description='Get one shoe by id, from the current table or an archived month',
+         params={'fields': SHOE_LIST_PARAMS['fields']})
+    @marshal_with(ShoeSchema)
+    def get(self, shoe_id):
+        try:
+            names = requested_fields(tuple(ShoeSchema._declared_fields))
+        except ValueError as e:
+            return api_error(str(e), 400)
+        conn = get_shoe_db_connection()
+        try:
+            row, _ = partitions.find_shoe(conn, SHOE_ARCHIVE_DIR, shoe_select_columns(names), shoe_id)
+        finally:
+            conn.close()
+        if row is None:
+            return api_error('Shoe not found.', 404)
+        return jsonify(ShoeSchema(only=names).dump(row))
+
+    @require_api_key
+    @doc(description='Change the model_name, serial_number or batch_number of a shoe; archived shoes are read-only')
+    def put(self, shoe_id):
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return api_error('Expected a JSON object.', 400)
+        changes = {field: data[field] for field in SHOE_UPDATE_FIELDS if field in data}
+        if not changes or not all(isinstance(value, str) and value for value in changes.values()):
+            return api_error(f'Provide one or more of: {", ".join(SHOE_UPDATE_FIELDS)}.', 400)
+        if 'model_name' in changes:
+            model = model_catalogue.get_by_name(changes['model_name'])
+            if model is None:
+                return api_error(f"Model not found: {changes['model_name']}.", 400)
+            changes['shoe_model_id'] = model['id']
+
+        conn = get_shoe_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row, archived = partitions.find_shoe(conn, SHOE_ARCHIVE_DIR, 'id', shoe_id)
+            if archived:
+                return api_error('Archived shoes cannot be changed.', 409)
+            if row is None:
+                return api_error('Shoe not found.', 404)
+            if 'serial_number' in changes:
+                existing = conn.execute('SELECT id FROM shoes WHERE serial_number = ? AND id != ?',
+                                        (changes['serial_number'], shoe_id)).fetchone()
+                existing_id = existing['id'] if existing is not None else partitions.archived_serial_owner(conn, changes['serial_number'])
+                if existing_id is not None:
+                    return api_error(f"Serial number {changes['serial_number']} already belongs to shoe {existing_id}.", 409)
+            conn.execute(f'UPDATE shoes SET {", ".join(f"{field} = ?" for field in changes)} WHERE id = ?',
+                         (*changes.values(), shoe_id))
+            row = conn.execute(f'SELECT {", ".join(SHOE_COLUMNS)} FROM shoes WHERE id = ?', (shoe_id,)).fetchone()
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.exception('Database error on %s %s', request.method, request.path)
+            return api_error(f'An error occurred: {e}', 500)
+        finally:
+            conn.close()
+        return jsonify(ShoeSchema().dump(row))
+
+    @require_api_key
+    @doc(description='Delete a shoe; archived shoes are read-only')
+    def delete(self, shoe_id):
+        conn = get_shoe_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row, archived = partitions.find_shoe(conn, SHOE_ARCHIVE_DIR, 'id', shoe_id)
+            if archived:
+                return api_error('Archived shoes cannot be deleted.', 409)
+            if row is None:
+                return api_error('Shoe not found.', 404)
+            conn.execute('DELETE FROM shoes WHERE id = ?', (shoe_id,))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.exception('Database error on %s %s', request.method, request.path)
+            return api_error(f'An error occurred: {e}', 500)
+        finally:
+            conn.close()
+        return Response(status=204)
+
+class ShoeBulkAPI(MethodResource, Resource):
+    @require_api_key
+    @doc(description='Create many shoes from a JSON array or NDJSON body of {model_name, serial_number, batch_number} records')
+    def post(self):
+        return bulk_shoe_entry_response('api', owner=f'api:{g.api_key.id}')
+
+# Add rate limiting. Counters are shared by all workers through RATE_LIMIT_STORAGE_URI
+# (memory:// keeps them per process) and requests are counted per API key.
+RATE_LIMIT_STORAGE_URI = os.getenv('RATE_LIMIT_STORAGE_URI', 'sqlite:///' + os.path.join(os.path.dirname(SHOE_DB_PATH), 'rate_limits.db'))
+limiter = rate_limits.ApiRateLimiter(RATE_LIMIT_STORAGE_URI)
+
+# Applies the quota and burst allowance of the request's API key; requests without a valid
+# key are counted per client address against the default limits
+def api_rate_limited(view_function):
+    @wraps(view_function)
+    def decorated_function(*args, **kwargs):
+        key = request_api_key()
+        if key is not None:
+            identifier = str(key.id)
+            identity = f'key:{key.id}'
+        else:
+            identifier = None
+            identity = f'addr:{request.remote_addr}'
+        breached = limiter.hit(identity, identifier)
+        if breached is not None:
+            response = jsonify({'message': f'Rate limit exceeded: {breached}.'})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(limiter.retry_after(breached, identity))
+            return response
+        return view_function(*args, **kwargs)
+    return decorated_function
+
+# Apply rate limiting to the API classes; one quota per key covers the whole v1 API.
+# Decorators are applied when a resource is added, so they must be set before add_resource.
+ShoeModelListAPI.decorators = [api_rate_limited]
+ShoeModelAPI.decorators = [api_rate_limited]
+ShoeListAPI.decorators = [api_rate_limited]
+ShoeAPI.decorators = [api_rate_limited]
+ShoeBulkAPI.decorators = [api_rate_limited]
 
 api.add_resource(ShoeModelListAPI, '/api/v1/shoe_models')
+api.add_resource(ShoeModelAPI, '/api/v1/shoe_models/<int:model_id>')
 api.add_resource(ShoeListAPI, '/api/v1/shoes')
+api.add_resource(ShoeAPI, '/api/v1/shoes/<int:shoe_id>')
+api.add_resource(ShoeBulkAPI, '/api/v1/shoes/bulk')
 
 docs.register(ShoeModelListAPI)
+docs.register(ShoeModelAPI)
 docs.register(ShoeListAPI)
+docs.register(ShoeAPI)
+docs.register(ShoeBulkAPI)
+
+# Command for issuing an API key without going through the admin UI
+@app.cli.command('create-api-key')
+@click.argument('name')
+def create_api_key_command(name):
+    """Issue an API key for an external program and print it once."""
+    conn = get_users_db_connection()
+    api_keys.ensure_api_keys_table(conn)
+    key_id, api_key = api_keys.create_key(conn, name, 'cli')
+    conn.close()
+    api_key_registry.invalidate()
+    print(f'API key {key_id} for {name}: {api_key}')
+    print('Store it now; it cannot be shown again.')
+
+# Command for backfilling the full-text indexes of existing databases
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the FTS5 search indexes over shoes and shoe models."""
+    conn_shoes = get_shoe_db_connection()
+    search_index.rebuild_fts_index(conn_shoes, 'shoes', search_index.SHOES_FTS_COLUMNS)
+    conn_shoes.close()
 
-# Add rate limiting
-limiter = Limiter(key_func=get_remote_address)
-limiter.init_app(app)
+    conn_models = get_models_db_connection()
+    search_index.rebuild_fts_index(conn_models, 'shoe_models', search_index.SHOE_MODELS_FTS_COLUMNS)
+    conn_models.close()
+    print('Search indexes rebuilt.')
 
-# Apply rate limiting to the API classes
-ShoeModelListAPI.decorators = [limiter.limit("100/day")]
-ShoeListAPI.decorators = [limiter.limit("100/day")]
+# Command for recomputing the production rollup from the raw shoes table
+@app.cli.command('rebuild-production-rollup')
+def rebuild_production_rollup_command():
+    """Rebuild the hourly production rollup used by the charts."""
+    conn_shoes = get_shoe_db_connection()
+    archives = partitions.open_all(conn_shoes, SHOE_ARCHIVE_DIR)
+    try:
+        rollups.rebuild_production_rollup(conn_shoes, archives)
+    finally:
+        for archive in archives:
+            archive.close()
+    conn_shoes.close()
+    print('Production rollup rebuilt.')
 
-if __name__ == '__main__':
+# Moves closed months of shoes into read-only archive partitions
+def archive_closed_months(months=None):
+    conn_shoes = get_shoe_db_connection()
+    try:
+        months = months or partitions.closed_months(conn_shoes, SHOE_HOT_MONTHS)
+        archived = []
+        for month in months:
+            try:
+                result = partitions.archive_month(conn_shoes, SHOE_DB_PATH, SHOE_ARCHIVE_DIR, month)
+            except partitions.ArchiveError as e:
+                # The month stays in the hot table until the clashing shoes are resolved
+                logger.error('%s', e)
+                continue
+            if result:
+                logger.info('Archived %s shoes from %s to %s (%s bytes, %ss)', result['rows'], month, result['file'], result['bytes'], result['duration_seconds'])
+                archived.append(result)
+        return archived
+    finally:
+        conn_shoes.close()
+
+# Command for archiving closed months out of the hot shoes table
+@app.cli.command('archive-shoes')
+@click.option('--month', 'months', multiple=True, help='Archive this month (YYYY-MM) instead of every closed month.')
+def archive_shoes_command(months):
+    """Move closed months of shoes into read-only monthly archive files."""
+    archived = archive_closed_months(list(months))
+    if not archived:
+        print('No closed months to archive.')
+
+# Command for taking a backup outside the web server
+@app.cli.command('backup')
+@click.option('--incremental', is_flag=True, help='Only store pages changed since the previous backup.')
+@click.option('--compress', is_flag=True, help='Gzip the backup files.')
+def backup_command(incremental, compress):
+    """Take an online backup of all databases."""
+    success, existing_files, _ = backup_databases(incremental=incremental, compress=compress)
+    if not success:
+        raise click.ClickException(f'Backup files already exist: {", ".join(existing_files)}')
+
+# Command for restoring a database from a backup manifest
+@app.cli.command('restore-backup')
+@click.argument('manifest_path')
+@click.option('--target', help='Database file to write (defaults to the database the backup was taken from).')
+@click.option('--yes', is_flag=True, help='Do not ask before overwriting the target.')
+def restore_backup_command(manifest_path, target, yes):
+    """Restore a database from a full or incremental backup chain."""
+    target = target or backup.load_manifest(manifest_path)['source']
+    if os.path.exists(target) and not yes:
+        click.confirm(f'Overwrite {target}? Stop the server first when restoring a live database.', abort=True)
+    db.close_all_pools()
+    manifest = backup.restore_backup(manifest_path, target)
+    print(f"Restored {manifest['database']} ({manifest['timestamp']}) to {target}")
+
+# Command for checking that a backup restores to an intact database
+@app.cli.command('verify-backup')
+@click.argument('manifest_path')
+def verify_backup_command(manifest_path):
+    """Restore a backup to a scratch file and verify its pages and integrity."""
+    result = backup.verify_backup(manifest_path)
+    print(json.dumps(result, indent=2))
+    if not result['ok']:
+        raise click.ClickException('Backup verification failed.')
+
+# Server configuration
+CERT_FILE = os.getenv('CERT_FILE', 'cert.pem')
+KEY_FILE = os.getenv('KEY_FILE', 'key.pem')
+SERVE_TLS = os.getenv('SERVE_TLS', '1') != '0'
+TRUST_PROXY_HEADERS = int(os.getenv('TRUST_PROXY_HEADERS', '0'))
+
+# Creates the database schemas and the default admin account
+def init_databases():
     os.makedirs(os.path.dirname(SHOE_DB_PATH), exist_ok=True)
     os.makedirs(os.path.dirname(USERS_DB_PATH), exist_ok=True)
     os.makedirs(os.path.dirname(MODELS_DB_PATH), exist_ok=True)
@@ -630,6 +1898,9 @@ if __name__ == '__main__':
         created_at TEXT NOT NULL,
         created_by TEXT NOT NULL)
     ''')
+    for column in ('batch_number', 'created_at', 'created_by'):
+        conn_shoes.execute(f'CREATE INDEX IF NOT EXISTS idx_shoes_{column} ON shoes ({column})')
+    partitions.ensure_partition_catalogue(conn_shoes)
     conn_shoes.close()
 
     # Initialize users database
@@ -664,21 +1935,95 @@ if __name__ == '__main__':
         updated_at TEXT,
         updated_by INTEGER)
     ''')
+    search_index.ensure_shoe_models_fts(conn_models)
     conn_models.close()
 
+    # Bring every database up to the latest schema, then create what depends on it
+    run_migrations()
+    conn_shoes = get_shoe_db_connection()
+    search_index.ensure_shoes_fts(conn_shoes)
+    rollups.ensure_production_rollup(conn_shoes)
+    ingest.ensure_receipts_table(conn_shoes)
+    idempotency.ensure_idempotency_table(conn_shoes)
+    conn_shoes.close()
+    api_keys.ensure_api_keys_table(conn_users)
+
     # Check if admin user exists, if not create one
     admin = conn_users.execute('SELECT * FROM users WHERE username = ?', ('admin',)).fetchone()
     if not admin:
-        hashed_password = generate_password_hash('shoepass')
-        conn_users.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
-                     ('admin', hashed_password, 'admin'))
+        hashed_password = generate_password_hash('shoepass', PASSWORD_HASH_METHOD)
+        conn_users.execute('INSERT INTO users (username, password, role, last_password_change) VALUES (?, ?, ?, ?)',
+                     ('admin', hashed_password, 'admin', datetime.now().date().isoformat()))
     conn_users.commit()
     conn_users.close()
 
-    # Generate self-signed certificate
-    cert_file = 'cert.pem'
-    key_file = 'key.pem'
+# Applies pending schema migrations to all three databases and the archived shoe partitions
+def run_migrations():
+    context = {
+        'model_ids': {name: model['id'] for name, model in model_catalogue.snapshot().by_name.items()},
+        'archive_dir': SHOE_ARCHIVE_DIR
+    }
+    applied = {}
+    for name, get_connection, database_migrations in (
+        ('models', get_models_db_connection, migrations.MODELS_MIGRATIONS),
+        ('users', get_users_db_connection, migrations.USERS_MIGRATIONS),
+        ('shoes', get_shoe_db_connection, migrations.SHOES_MIGRATIONS),
+    ):
+        conn = get_connection()
+        try:
+            # Archived partitions are migrated first so shoes.db migrations can read them
+            if name == 'shoes':
+                for month in migrations.migrate_archives(conn, SHOE_ARCHIVE_DIR, database_migrations, context):
+                    logger.info('Migrated archived partition %s', month)
+            applied[name] = migrations.migrate(conn, name, database_migrations, context)
+        finally:
+            conn.close()
+        for migration in applied[name]:
+            logger.info('Applied %s migration %s: %s', name, migration.version, migration.description)
+    return applied
+
+# Command for applying pending schema migrations
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations to every database."""
+    applied = run_migrations()
+    if not any(applied.values()):
+        print('All databases are up to date.')
+
+# Command for merging the three databases into one file for the consolidated layout
+@app.cli.command('consolidate-databases')
+@click.argument('target')
+def consolidate_databases_command(target):
+    """Copy shoes, users and models into one database file at TARGET."""
+    if os.path.exists(target):
+        raise click.ClickException(f'{target} already exists.')
+    if len(database_paths()) == 1:
+        raise click.ClickException('The databases are already consolidated.')
+    click.confirm('Stop the server first: writes made while copying are not included. Continue?', abort=True)
+
+    migrations.consolidate_databases(SHOE_DB_PATH, USERS_DB_PATH, MODELS_DB_PATH, target, backup.snapshot_database)
+    print(f'Consolidated databases into {target}. To use it, set:')
+    for variable in ('SHOE_DB_PATH', 'USERS_DB_PATH', 'MODELS_DB_PATH'):
+        print(f'  {variable}={os.path.abspath(target)}')
+    if os.path.dirname(os.path.abspath(target)) != os.path.dirname(os.path.abspath(SHOE_DB_PATH)):
+        print(f'  SHOE_ARCHIVE_DIR={os.path.abspath(SHOE_ARCHIVE_DIR)}')
+
+# Command for showing the schema version of each database
+@app.cli.command('migration-status')
+def migration_status_command():
+    """Show the schema version of each database."""
+    for name, get_connection, database_migrations in (
+        ('models', get_models_db_connection, migrations.MODELS_MIGRATIONS),
+        ('users', get_users_db_connection, migrations.USERS_MIGRATIONS),
+        ('shoes', get_shoe_db_connection, migrations.SHOES_MIGRATIONS),
+    ):
+        conn = get_connection()
+        version = migrations.schema_version(conn, name)
+        conn.close()
+        print(f'{name}: version {version} of {migrations.latest_version(database_migrations)}')
 
+# Generates a self-signed certificate if none exists yet
+def ensure_certificate(cert_file=CERT_FILE, key_file=KEY_FILE):
     if not os.path.exists(cert_file) or not os.path.exists(key_file):
         # create a key pair
         k = crypto.PKey()
@@ -705,16 +2050,41 @@ if __name__ == '__main__':
         with open(key_file, "wb") as f:
             f.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, k))
 
-    # Schedule backup task
+# Starts the weekly backup job; call this in exactly one process
+def start_backup_scheduler():
     def scheduled_backup():
-        with app.app_context():
-            backup_databases()
+        job, deduplicated = backup_jobs.submit(timestamp=datetime.now().strftime(backup.TIMESTAMP_FORMAT))
+        if deduplicated:
+            logger.info('Skipped scheduled backup: job %s is already running', job['id'])
 
     scheduler = BackgroundScheduler()
     scheduler.add_job(func=scheduled_backup, trigger="interval", days=7)
+    if SHOE_ARCHIVE_SCHEDULE:
+        scheduler.add_job(func=archive_closed_months, trigger="cron", day=1, hour=3)
     scheduler.start()
+    return scheduler
+
+# One-time startup work, run before any request-serving process starts
+def bootstrap():
+    init_databases()
+    # Commit queued shoe entries that a previous run journaled but never wrote
+    recovered = ingest_queue.recover()
+    if recovered:
+        logger.info('Recovered %s queued shoe entries from the ingest journal', recovered)
+    if SERVE_TLS:
+        ensure_certificate()
+    # Do not hand open SQLite connections to forked workers
+    db.close_all_pools()
+
+# App factory used by the WSGI entry point
+def create_app():
+    # Behind a TLS-terminating proxy, trust its X-Forwarded-* headers for client address and scheme
+    if TRUST_PROXY_HEADERS and not isinstance(app.wsgi_app, ProxyFix):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUST_PROXY_HEADERS, x_proto=TRUST_PROXY_HEADERS, x_host=TRUST_PROXY_HEADERS)
+    return app
 
-    # Run the app with SSL
-    app.run(host='0.0.0.0', port=5273, ssl_context=(cert_file, key_file))
-
-    
\ No newline at end of file
+if __name__ == '__main__':
+    # Development server; use gunicorn with gunicorn.conf.py in production
+    bootstrap()
+    start_backup_scheduler()
+    create_app().run(host='0.0.0.0', port=5273, ssl_context=(CERT_FILE, KEY_FILE) if SERVE_TLS else None)
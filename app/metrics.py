@@ -0,0 +1,188 @@
+"""
+metrics.py
+This file contains the request and SQL metrics of the Shoe Database application.
+Request hooks record per-endpoint latency, response size and SQL query counts; pooled
+connections report every statement they run. Metrics are kept in memory per process and
+rendered in the Prometheus text format, each sample labelled with the worker's pid.
+With SLOW_QUERY_MS set, statements slower than that are logged with their query plan.
+"""
+
+# Standard library imports
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+# Third-party imports
+from flask import g, request
+
+# Statements slower than this many milliseconds are logged with EXPLAIN QUERY PLAN; unset is off
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS')) if os.getenv('SLOW_QUERY_MS') else None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Only these statements have a query plan worth logging
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+slow_query_logger = logging.getLogger('slow_query')
+
+def _format_labels(names, values):
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self, worker):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{_format_labels(self.labels + ("worker",), label_values + (worker,))}}} {value}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self, worker):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.labels + ('worker',)
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._values.items()):
+                labels = _format_labels(names, label_values + (worker,))
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{{labels}}} {total}')
+                lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+REQUESTS = Counter('shoedb_http_requests_total', 'HTTP requests by endpoint and status.', ('method', 'endpoint', 'status'))
+REQUEST_DURATION = Histogram('shoedb_http_request_duration_seconds', 'Time spent in the request handler; streamed bodies are not included.',
+                             ('method', 'endpoint'), LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram('shoedb_http_response_size_bytes', 'Response body size, counted as streamed bodies are sent.',
+                          ('method', 'endpoint'), SIZE_BUCKETS)
+REQUEST_QUERIES = Histogram('shoedb_http_request_sql_queries', 'SQL statements run by one request handler.',
+                            ('method', 'endpoint'), QUERY_COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Counter('shoedb_http_request_sql_seconds_total', 'Time request handlers spent in SQL.', ('method', 'endpoint'))
+QUERY_DURATION = Histogram('shoedb_sql_query_duration_seconds', 'SQL statement execution time on pooled connections, up to the first row.',
+                           ('database',), SQL_BUCKETS)
+FETCH_SECONDS = Counter('shoedb_sql_fetch_seconds_total', 'Time spent fetching further rows of SQL statements.', ('database',))
+SLOW_QUERIES = Counter('shoedb_sql_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS.', ('database',))
+
+METRICS = (REQUESTS, REQUEST_DURATION, RESPONSE_SIZE, REQUEST_QUERIES, REQUEST_SQL_SECONDS, QUERY_DURATION, FETCH_SECONDS, SLOW_QUERIES)
+
+# Connection pool counters rendered from db.pool_stats(): stat name -> (metric, type, help)
+POOL_METRICS = {
+    'misses': ('shoedb_db_connections_opened_total', 'counter', 'Connections opened by the pool.'),
+    'hits': ('shoedb_db_connections_reused_total', 'counter', 'Checkouts served by an idle pooled connection.'),
+    'waits': ('shoedb_db_pool_waits_total', 'counter', 'Checkouts that waited for a free connection.'),
+    'wait_seconds': ('shoedb_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a free connection.'),
+    'timeouts': ('shoedb_db_pool_timeouts_total', 'counter', 'Checkouts that timed out waiting.'),
+    'size': ('shoedb_db_pool_connections', 'gauge', 'Connections currently open.'),
+    'in_use': ('shoedb_db_pool_connections_in_use', 'gauge', 'Connections currently checked out.'),
+}
+
+# SQL statements run on the current thread while it handles a request
+_request_sql = threading.local()
+
+def start_request():
+    g.metrics_started = time.perf_counter()
+    _request_sql.queries = 0
+    _request_sql.seconds = 0.0
+    _request_sql.active = True
+
+def record_response(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    labels = (request.method, request.url_rule.rule if request.url_rule else 'unmatched')
+    REQUESTS.inc(labels + (response.status_code,))
+    REQUEST_DURATION.observe(labels, time.perf_counter() - started)
+    REQUEST_QUERIES.observe(labels, _request_sql.queries)
+    REQUEST_SQL_SECONDS.inc(labels, _request_sql.seconds)
+    _request_sql.active = False
+
+    if response.content_length is not None:
+        RESPONSE_SIZE.observe(labels, response.content_length)
+    elif response.is_streamed:
+        response.response = _counted(response.response, labels)
+    return response
+
+# Passes a streamed body through, recording its size once it has been sent
+def _counted(body, labels):
+    size = 0
+    try:
+        for chunk in body:
+            size += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+        RESPONSE_SIZE.observe(labels, size)
+
+# Records one statement of a pooled connection: its execution, or rows fetched from it later
+def observe_query(database, seconds, executed=True):
+    if executed:
+        QUERY_DURATION.observe((database,), seconds)
+    else:
+        FETCH_SECONDS.inc((database,), seconds)
+    if getattr(_request_sql, 'active', False):
+        _request_sql.queries += executed
+        _request_sql.seconds += seconds
+
+# Logs a statement that ran longer than SLOW_QUERY_MS, with the plan SQLite chose for it
+def log_slow_query(conn, database, sql, parameters, seconds):
+    SLOW_QUERIES.inc((database,))
+    statement = ' '.join(sql.split())
+    plan = ''
+    if parameters is not None and statement.upper().startswith(EXPLAINABLE):
+        try:
+            # A plain cursor, so explaining is not itself timed
+            rows = sqlite3.Connection.cursor(conn).execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+            plan = ''.join(f'\n    {row[3]}' for row in rows)
+        except sqlite3.Error as e:
+            plan = f'\n    (no plan: {e})'
+    slow_query_logger.warning('%.1f ms on %s: %s%s', seconds * 1000, database, statement, plan)
+
+def render(pool_stats):
+    worker = os.getpid()
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render(worker))
+    for stat, (name, kind, help) in POOL_METRICS.items():
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        for database, stats in sorted(pool_stats.items()):
+            lines.append(f'{name}{{database="{database}",worker="{worker}"}} {stats[stat]}')
+    return '\n'.join(lines) + '\n'
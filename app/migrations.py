@@ -0,0 +1,283 @@
+"""
+migrations.py
+This file contains the versioned schema migrations for the shoes, users and models databases.
+Each database records the last migration applied to it in its schema_versions table, and
+pending migrations run in order at startup or with `flask migrate`. Archived shoe partitions
+are migrated too: each one is rewritten from a copy and made read-only again. The tools for
+consolidating the three files into one database also live here.
+"""
+
+# Standard library imports
+import os
+import shutil
+import sqlite3
+from collections import namedtuple
+from datetime import datetime
+
+# Local imports
+import partitions
+import rollups
+import search_index
+
+# Rows updated per transaction by backfills, so writers are never blocked for long
+MIGRATION_CHUNK_SIZE = int(os.getenv('MIGRATION_CHUNK_SIZE', '10000'))
+
+# `archives` marks migrations that also apply to archived shoe partitions
+Migration = namedtuple('Migration', ['version', 'description', 'apply', 'archives'])
+
+# Versions are kept per logical database, so the three can share one consolidated file
+SCHEMA_VERSIONS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_versions
+    (database TEXT PRIMARY KEY,
+    version INTEGER NOT NULL)
+'''
+
+# Falls back to PRAGMA user_version, where versions were recorded before schema_versions existed
+def schema_version(conn, database):
+    try:
+        row = conn.execute('SELECT version FROM schema_versions WHERE database = ?', (database,)).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    return row[0] if row else conn.execute('PRAGMA user_version').fetchone()[0]
+
+def set_schema_version(conn, database, version):
+    with conn:
+        conn.execute(SCHEMA_VERSIONS_TABLE)
+        conn.execute('INSERT OR REPLACE INTO schema_versions (database, version) VALUES (?, ?)', (database, version))
+
+def latest_version(migrations):
+    return migrations[-1].version if migrations else 0
+
+def has_column(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f'PRAGMA table_info({table})'))
+
+# Applies the pending migrations in order, recording each version as it completes
+def migrate(conn, database, migrations, context, archive=False):
+    applied = []
+    for migration in migrations:
+        if migration.version <= schema_version(conn, database):
+            continue
+        if migration.archives or not archive:
+            migration.apply(conn, context)
+        set_schema_version(conn, database, migration.version)
+        applied.append(migration)
+    # Record a version that so far only lived in PRAGMA user_version
+    if not applied and not _has_version_row(conn, database):
+        set_schema_version(conn, database, schema_version(conn, database))
+    return applied
+
+def _has_version_row(conn, database):
+    try:
+        return conn.execute('SELECT 1 FROM schema_versions WHERE database = ?', (database,)).fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+
+# Migrates every archived partition that is behind, rewriting it through a temporary copy
+def migrate_archives(conn, archive_dir, migrations, context):
+    migrated = []
+    for partition in partitions.list_partitions(conn, archive_dir):
+        archive = partitions.open_partition(partition.path)
+        version = schema_version(archive, 'shoes')
+        archive.close()
+        if version >= latest_version(migrations):
+            continue
+
+        temp_path = f'{partition.path}.{os.getpid()}.tmp'
+        shutil.copyfile(partition.path, temp_path)
+        archive = sqlite3.connect(temp_path)
+        try:
+            migrate(archive, 'shoes', migrations, context, archive=True)
+            archive.execute('VACUUM')
+        finally:
+            archive.close()
+        os.chmod(temp_path, 0o444)
+        os.replace(temp_path, partition.path)
+        migrated.append(partition.month)
+    return migrated
+
+# Version 1: store the model as an integer id instead of repeating its name on every shoe
+def add_shoe_model_id(conn, context):
+    if not has_column(conn, 'shoes', 'shoe_model_id'):
+        with conn:
+            conn.execute('ALTER TABLE shoes ADD COLUMN shoe_model_id INTEGER')
+    with conn:
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_shoes_shoe_model_id ON shoes (shoe_model_id)')
+        conn.execute('DROP INDEX IF EXISTS idx_shoes_model_name')
+        # Only re-index full-text rows when an indexed column changes, not on this backfill
+        conn.execute('DROP TRIGGER IF EXISTS shoes_fts_au')
+    search_index.ensure_shoes_fts(conn)
+
+    with conn:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS migration_model_ids (model_name TEXT PRIMARY KEY, id INTEGER NOT NULL)')
+        conn.execute('DELETE FROM migration_model_ids')
+        conn.executemany('INSERT INTO migration_model_ids (model_name, id) VALUES (?, ?)', context['model_ids'].items())
+
+    # Backfill in id ranges, one short transaction each; already backfilled rows are skipped
+    max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM shoes').fetchone()[0]
+    for start in range(0, max_id, MIGRATION_CHUNK_SIZE):
+        with conn:
+            conn.execute('''
+                UPDATE shoes
+                SET shoe_model_id = (SELECT id FROM migration_model_ids m WHERE m.model_name = shoes.model_name)
+                WHERE id > ? AND id <= ? AND shoe_model_id IS NULL
+            ''', (start, start + MIGRATION_CHUNK_SIZE))
+    conn.execute('DROP TABLE temp.migration_model_ids')
+
+# Version 2: key the production rollup by shoe_model_id, recounting hot and archived shoes
+def rekey_production_rollup(conn, context):
+    archives = partitions.open_all(conn, context['archive_dir'])
+    try:
+        rollups.drop_production_rollup(conn)
+        rollups.rebuild_production_rollup(conn, archives)
+    finally:
+        for archive in archives:
+            archive.close()
+
+# Shoes removed as duplicate serial numbers are kept here, with the id of the shoe that was kept
+SERIAL_DUPLICATES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS shoe_serial_duplicates
+    (id INTEGER PRIMARY KEY,
+    model_name TEXT,
+    shoe_model_id INTEGER,
+    serial_number TEXT,
+    batch_number TEXT,
+    created_at TEXT NOT NULL,
+    created_by TEXT NOT NULL,
+    kept_id INTEGER NOT NULL,
+    removed_at TEXT NOT NULL)
+'''
+
+# Version 3: keep the first shoe for each serial number and make serial numbers unique
+def unique_serial_numbers(conn, context):
+    with conn:
+        conn.execute(SERIAL_DUPLICATES_TABLE)
+        conn.execute('''
+            INSERT OR IGNORE INTO shoe_serial_duplicates
+            (id, model_name, shoe_model_id, serial_number, batch_number, created_at, created_by, kept_id, removed_at)
+            SELECT s.id, s.model_name, s.shoe_model_id, s.serial_number, s.batch_number, s.created_at, s.created_by,
+                first.kept_id, ?
+            FROM shoes s
+            JOIN (
+                SELECT serial_number, MIN(id) AS kept_id FROM shoes
+                WHERE serial_number IS NOT NULL
+                GROUP BY serial_number HAVING COUNT(*) > 1
+            ) first ON first.serial_number = s.serial_number
+            WHERE s.id != first.kept_id
+        ''', (datetime.now().isoformat(),))
+        # The delete triggers take the duplicates out of the rollup and the full-text index
+        conn.execute('DELETE FROM shoes WHERE id IN (SELECT id FROM shoe_serial_duplicates)')
+        conn.execute('DROP INDEX IF EXISTS idx_shoes_serial_number')
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_shoes_serial_number_unique ON shoes (serial_number)')
+
+# Version 4: duplicates removed from archived months were still counted in the rollup of shoes.db
+def discount_archived_duplicates(conn, context):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shoe_production_hourly'").fetchone()
+    if not exists:
+        return
+    archives = partitions.open_all(conn, context['archive_dir'])
+    try:
+        with conn:
+            for archive in archives:
+                if not archive.execute("SELECT 1 FROM sqlite_master WHERE name = 'shoe_serial_duplicates'").fetchone():
+                    continue
+                rollups.add_grouped_counts(conn, archive.execute('''
+                    SELECT substr(created_at, 1, 13), coalesce(shoe_model_id, 0), created_by, -COUNT(*)
+                    FROM shoe_serial_duplicates
+                    GROUP BY 1, 2, 3
+                ''').fetchall())
+    finally:
+        for archive in archives:
+            archive.close()
+
+# Version 5: index the serial numbers of archived shoes in shoes.db, so new shoes cannot reuse
+# them. Hot shoes that already reuse one are moved to shoe_serial_duplicates like in version 3.
+def index_archived_serial_numbers(conn, context):
+    partitions.ensure_partition_catalogue(conn)
+    for partition in partitions.list_partitions(conn, context['archive_dir']):
+        archive = partitions.open_partition(partition.path)
+        try:
+            rows = archive.execute('SELECT serial_number, id FROM shoes WHERE serial_number IS NOT NULL ORDER BY id').fetchall()
+        finally:
+            archive.close()
+        with conn:
+            # Partitions are visited oldest first, so the first shoe with a serial number is kept
+            conn.executemany('INSERT OR IGNORE INTO archived_serial_numbers (serial_number, shoe_id, month) VALUES (?, ?, ?)',
+                             [(serial_number, shoe_id, partition.month) for serial_number, shoe_id in rows])
+
+    with conn:
+        conn.execute(SERIAL_DUPLICATES_TABLE)
+        conn.execute('''
+            INSERT OR IGNORE INTO shoe_serial_duplicates
+            (id, model_name, shoe_model_id, serial_number, batch_number, created_at, created_by, kept_id, removed_at)
+            SELECT s.id, s.model_name, s.shoe_model_id, s.serial_number, s.batch_number, s.created_at, s.created_by,
+                a.shoe_id, ?
+            FROM shoes s
+            JOIN archived_serial_numbers a ON a.serial_number = s.serial_number AND a.shoe_id != s.id
+        ''', (datetime.now().isoformat(),))
+        conn.execute('''
+            DELETE FROM shoes WHERE id IN (
+                SELECT s.id FROM shoes s
+                JOIN archived_serial_numbers a ON a.serial_number = s.serial_number AND a.shoe_id != s.id
+            )
+        ''')
+
+SHOES_MIGRATIONS = [
+    Migration(1, 'Add shoes.shoe_model_id and backfill it from models.db', add_shoe_model_id, True),
+    Migration(2, 'Key the production rollup by shoe_model_id', rekey_production_rollup, False),
+    Migration(3, 'Remove duplicate serial numbers and add a unique index on shoes.serial_number', unique_serial_numbers, True),
+    Migration(4, 'Take duplicates removed from archived months out of the production rollup', discount_archived_duplicates, False),
+    Migration(5, 'Index archived serial numbers so new shoes cannot reuse them', index_archived_serial_numbers, False),
+]
+USERS_MIGRATIONS = []
+MODELS_MIGRATIONS = []
+
+# Suffixes of the shadow tables SQLite keeps for an FTS5 virtual table
+FTS_SHADOW_SUFFIXES = ('_data', '_idx', '_content', '_docsize', '_config')
+
+# Copies every table (with its indexes, triggers and full-text indexes) from an attached
+# database into main. Triggers are created after the rows are copied so they do not fire.
+def _copy_attached_database(conn, alias):
+    objects = conn.execute(f'''
+        SELECT type, name, tbl_name, sql FROM {alias}.sqlite_master
+        WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' AND name != 'schema_versions'
+    ''').fetchall()
+    virtual = {name for type_, name, _, sql in objects if type_ == 'table' and sql.upper().startswith('CREATE VIRTUAL TABLE')}
+    shadow = {name + suffix for name in virtual for suffix in FTS_SHADOW_SUFFIXES}
+    tables = [(name, sql) for type_, name, _, sql in objects if type_ == 'table' and name not in shadow]
+
+    with conn:
+        for name, sql in tables:
+            conn.execute(sql)
+        for name, _ in tables:
+            if name not in virtual:
+                conn.execute(f'INSERT INTO main.{name} SELECT * FROM {alias}.{name}')
+        if conn.execute(f"SELECT 1 FROM {alias}.sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+            conn.execute(f'INSERT OR REPLACE INTO main.sqlite_sequence SELECT * FROM {alias}.sqlite_sequence')
+        for name in virtual:
+            conn.execute(f"INSERT INTO main.{name} ({name}) VALUES ('rebuild')")
+        for type_, name, _, sql in objects:
+            if type_ in ('index', 'trigger') and name not in shadow:
+                conn.execute(sql)
+
+# Builds one database at target_path holding the shoes, users and models databases.
+# shoes.db is copied with the online backup API; users and models are copied table by table.
+def consolidate_databases(shoes_path, users_path, models_path, target_path, snapshot):
+    snapshot(shoes_path, target_path)
+    conn = sqlite3.connect(target_path)
+    try:
+        for database, alias, path in (('users', 'users_db', users_path), ('models', 'models_db', models_path)):
+            source = sqlite3.connect(path)
+            version = schema_version(source, database)
+            source.close()
+
+            conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+            _copy_attached_database(conn, alias)
+            conn.execute(f'DETACH DATABASE {alias}')
+            set_schema_version(conn, database, version)
+
+        # shoes.db may predate schema_versions, so record its version under its own name too
+        set_schema_version(conn, 'shoes', schema_version(conn, 'shoes'))
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
@@ -0,0 +1,295 @@
+"""
+partitions.py
+This file contains the monthly partitioning of the shoes table.
+Recent months stay in the hot shoes table in shoes.db. Closed months are moved into
+one read-only, compacted database file per month in the archive directory, each with
+its own indexes and full-text index, and recorded in the shoe_partitions catalogue.
+Readers open only the partitions whose id and created_at ranges can match a query.
+Serial numbers of archived shoes are indexed in shoes.db, so they stay unique across
+the hot table and every partition.
+"""
+
+# Standard library imports
+import heapq
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from datetime import date, datetime
+from urllib.parse import quote
+
+# Local imports
+import rollups
+import search_index
+
+CATALOGUE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS shoe_partitions
+    (month TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    min_id INTEGER NOT NULL,
+    max_id INTEGER NOT NULL,
+    min_created_at TEXT NOT NULL,
+    max_created_at TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    archived_at TEXT NOT NULL)
+'''
+
+# Serial numbers of archived shoes; triggers keep the hot table from reusing them
+ARCHIVED_SERIALS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archived_serial_numbers
+    (serial_number TEXT PRIMARY KEY,
+    shoe_id INTEGER NOT NULL,
+    month TEXT NOT NULL) WITHOUT ROWID
+'''
+ARCHIVED_SERIAL_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS shoes_archived_serial_bi BEFORE INSERT ON shoes
+    WHEN EXISTS (SELECT 1 FROM archived_serial_numbers WHERE serial_number = new.serial_number)
+    BEGIN SELECT RAISE(ABORT, 'UNIQUE constraint failed: serial number belongs to an archived shoe'); END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS shoes_archived_serial_bu BEFORE UPDATE OF serial_number ON shoes
+    WHEN EXISTS (SELECT 1 FROM archived_serial_numbers WHERE serial_number = new.serial_number AND shoe_id != new.id)
+    BEGIN SELECT RAISE(ABORT, 'UNIQUE constraint failed: serial number belongs to an archived shoe'); END
+    ''',
+)
+
+class ArchiveError(Exception):
+    pass
+
+Partition = namedtuple('Partition', ['month', 'path', 'min_id', 'max_id', 'min_created_at', 'max_created_at', 'row_count'])
+
+def ensure_partition_catalogue(conn):
+    with conn:
+        conn.execute(CATALOGUE_SCHEMA)
+        conn.execute(ARCHIVED_SERIALS_SCHEMA)
+        for trigger in ARCHIVED_SERIAL_TRIGGERS:
+            conn.execute(trigger)
+
+# Returns the id of the archived shoe that has serial_number, or None
+def archived_serial_owner(conn, serial_number):
+    row = conn.execute('SELECT shoe_id FROM archived_serial_numbers WHERE serial_number = ?', (serial_number,)).fetchone()
+    return row[0] if row else None
+
+# Returns the archived partitions, ordered by their lowest id
+def list_partitions(conn, archive_dir):
+    rows = conn.execute('''
+        SELECT month, file, min_id, max_id, min_created_at, max_created_at, row_count
+        FROM shoe_partitions
+        ORDER BY min_id
+    ''').fetchall()
+    return [Partition(row[0], os.path.join(archive_dir, row[1]), *row[2:]) for row in rows]
+
+# Opens an archived partition read-only; immutable lets SQLite skip all locking
+def open_partition(path):
+    conn = sqlite3.connect(f'file:{quote(path)}?mode=ro&immutable=1', uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+# Keeps the partitions that can hold ids above after_id created between since and until
+def prune(partitions, after_id=0, since=None, until=None):
+    return [
+        partition for partition in partitions
+        if partition.max_id > after_id
+        and (not since or partition.max_created_at >= since)
+        and (not until or partition.min_created_at[:len(until)] <= until)
+    ]
+
+def month_bounds(month):
+    year, month_number = (int(part) for part in month.split('-'))
+    start = date(year, month_number, 1)
+    end = date(year + month_number // 12, month_number % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+# Months before the hot window, which keeps the current month and the (hot_months - 1) before it
+def closed_months(conn, hot_months, today=None):
+    today = today or date.today()
+    months_back = today.year * 12 + today.month - 1 - (hot_months - 1)
+    cutoff = date(months_back // 12, months_back % 12 + 1, 1).isoformat()
+    rows = conn.execute('''
+        SELECT DISTINCT substr(created_at, 1, 7) FROM shoes
+        WHERE created_at < ?
+        ORDER BY 1
+    ''', (cutoff,)).fetchall()
+    return [row[0] for row in rows]
+
+def _copy_schema(source, target, source_schema):
+    statements = source.execute(f'''
+        SELECT sql FROM {source_schema}.sqlite_master
+        WHERE tbl_name = 'shoes' AND type IN ('table', 'index') AND sql IS NOT NULL
+        ORDER BY type = 'index'
+    ''').fetchall()
+    for (sql,) in statements:
+        target.execute(sql)
+
+# Moves one month of shoes from the hot table into its archive file. Rows already
+# archived for that month (from an earlier run) are merged into the new file. A serial
+# number that another archived shoe already has raises ArchiveError instead of being dropped.
+def archive_month(conn, hot_path, archive_dir, month):
+    start, end = month_bounds(month)
+    file_name = f'shoes_{month.replace("-", "_")}.db'
+    path = os.path.join(archive_dir, file_name)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    os.makedirs(archive_dir, exist_ok=True)
+
+    # Rows entered after this point are left in the hot table for the next run
+    max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM shoes').fetchone()[0]
+    where = 'created_at >= ? AND created_at < ? AND id <= ?'
+    params = (start, end, max_id)
+
+    clashes = [row[0] for row in conn.execute(f'''
+        SELECT serial_number FROM shoes
+        WHERE {where} AND serial_number IN (SELECT serial_number FROM archived_serial_numbers a WHERE a.shoe_id != shoes.id)
+        LIMIT 10
+    ''', params).fetchall()]
+    if clashes:
+        raise ArchiveError(f'Cannot archive {month}: serial numbers already archived with other shoes: {", ".join(clashes)}')
+
+    started = time.perf_counter()
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    archive = sqlite3.connect(f'file:{quote(temp_path)}', uri=True)
+    try:
+        archive.execute('ATTACH DATABASE ? AS hot', (hot_path,))
+        _copy_schema(archive, archive, 'hot')
+        # The archive starts at the hot table's schema version
+        if archive.execute("SELECT 1 FROM hot.sqlite_master WHERE name = 'schema_versions'").fetchone():
+            archive.execute("CREATE TABLE schema_versions AS SELECT * FROM hot.schema_versions WHERE database = 'shoes'")
+        with archive:
+            archive.execute(f'INSERT INTO main.shoes SELECT * FROM hot.shoes WHERE {where}', params)
+            if os.path.exists(path):
+                archive.execute('ATTACH DATABASE ? AS previous', (f'file:{quote(path)}?mode=ro&immutable=1',))
+                # Rows of an interrupted run are in both; any other clash fails the run
+                archive.execute('INSERT INTO main.shoes SELECT * FROM previous.shoes WHERE id NOT IN (SELECT id FROM main.shoes)')
+        archive.execute('DETACH DATABASE hot')
+        if os.path.exists(path):
+            archive.execute('DETACH DATABASE previous')
+
+        search_index.ensure_shoes_fts(archive)
+        with archive:
+            archive.execute("INSERT INTO shoes_fts (shoes_fts) VALUES ('optimize')")
+        archive.execute('ANALYZE')
+        archive.execute('VACUUM')
+        stats = archive.execute('SELECT MIN(id), MAX(id), MIN(created_at), MAX(created_at), COUNT(*) FROM shoes').fetchone()
+    finally:
+        archive.close()
+
+    if not stats[4]:
+        os.remove(temp_path)
+        return None
+    os.chmod(temp_path, 0o444)
+    os.replace(temp_path, path)
+
+    # Swap the rows out of the hot table and publish the partition in one transaction
+    with conn:
+        rollups.retain_counts(conn, where, params)
+        conn.execute(f'''
+            INSERT OR REPLACE INTO archived_serial_numbers (serial_number, shoe_id, month)
+            SELECT serial_number, id, ? FROM shoes WHERE {where} AND serial_number IS NOT NULL
+        ''', (month, *params))
+        conn.execute(f'DELETE FROM shoes WHERE {where}', params)
+        conn.execute('''
+            INSERT OR REPLACE INTO shoe_partitions
+            (month, file, min_id, max_id, min_created_at, max_created_at, row_count, archived_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (month, file_name, *stats, datetime.now().isoformat()))
+
+    return {
+        'month': month,
+        'file': file_name,
+        'rows': stats[4],
+        'bytes': os.path.getsize(path),
+        'duration_seconds': round(time.perf_counter() - started, 3)
+    }
+
+# Yields the connections to search in id order: pruned archives first, then the hot table.
+# Each item is (connection, min_id); archive connections are closed once the caller moves on.
+def _sources(conn, archive_dir, after_id=0, since=None, until=None):
+    for partition in prune(list_partitions(conn, archive_dir), after_id, since, until):
+        archive = open_partition(partition.path)
+        try:
+            yield archive, partition.min_id
+        finally:
+            archive.close()
+    yield conn, conn.execute('SELECT COALESCE(MIN(id), 0) FROM shoes').fetchone()[0]
+
+def _unique_by_id(rows):
+    last_id = None
+    for row in rows:
+        if row['id'] != last_id:
+            last_id = row['id']
+            yield row
+
+# Returns up to `limit` shoes with id > after_id matching `where`, in id order across partitions.
+# Partitions are visited by their lowest id and the scan stops once no later partition can
+# contribute a smaller id than the rows already found.
+def fetch_shoes(conn, archive_dir, columns, where, params, after_id, limit, since=None, until=None):
+    query = f'SELECT {columns} FROM shoes WHERE id > ? {where} ORDER BY id LIMIT ?'
+    found = []
+    sources = _sources(conn, archive_dir, after_id, since, until)
+    try:
+        for source, min_id in sources:
+            if len(found) >= limit and found[limit - 1]['id'] < min_id:
+                break
+            rows = source.execute(query, [after_id, *params, limit]).fetchall()
+            found = list(_unique_by_id(heapq.merge(found, rows, key=lambda row: row['id'])))[:limit]
+    finally:
+        sources.close()
+    return found
+
+# Yields every shoe with id > after_id matching `where`, in id order across the pruned partitions
+def iter_shoes(conn, archive_dir, columns, where, params, after_id=0, since=None, until=None):
+    partitions = prune(list_partitions(conn, archive_dir), after_id, since, until)
+    archives = [open_partition(partition.path) for partition in partitions]
+    try:
+        query = f'SELECT {columns} FROM shoes WHERE id > ? {where} ORDER BY id'
+        cursors = [source.execute(query, [after_id, *params]) for source in archives + [conn]]
+        yield from _unique_by_id(heapq.merge(*cursors, key=lambda row: row['id']))
+    finally:
+        for archive in archives:
+            archive.close()
+
+# Runs a full-text query against the hot table, then against the archived months created
+# between since and until, newest first, until `limit` matches are found. FTS ranks are only
+# comparable within one index, so matches are ordered by rank within each month.
+def search_fulltext(conn, archive_dir, columns, match, limit, since=None, until=None):
+    query = f'''
+        SELECT {columns}, shoes_fts.rank AS rank
+        FROM shoes_fts
+        JOIN shoes s ON s.id = shoes_fts.rowid
+        WHERE shoes_fts MATCH ?
+        ORDER BY shoes_fts.rank
+        LIMIT ?
+    '''
+    matches = list(conn.execute(query, (match, limit)))
+    for partition in reversed(prune(list_partitions(conn, archive_dir), since=since, until=until)):
+        if len(matches) >= limit:
+            break
+        archive = open_partition(partition.path)
+        try:
+            matches.extend(archive.execute(query, (match, limit - len(matches))))
+        finally:
+            archive.close()
+    return matches
+
+# Returns (row, archived) for the shoe with this id, looking in the hot table and then in the
+# one partition whose id range holds it, or (None, False) when there is no such shoe
+def find_shoe(conn, archive_dir, columns, shoe_id):
+    query = f'SELECT {columns} FROM shoes WHERE id = ?'
+    row = conn.execute(query, (shoe_id,)).fetchone()
+    if row is not None:
+        return row, False
+    for partition in list_partitions(conn, archive_dir):
+        if partition.min_id <= shoe_id <= partition.max_id:
+            archive = open_partition(partition.path)
+            try:
+                row = archive.execute(query, (shoe_id,)).fetchone()
+            finally:
+                archive.close()
+            if row is not None:
+                return row, True
+    return None, False
+
+# Opens every archived partition, for maintenance commands that need all of them
+def open_all(conn, archive_dir):
+    return [open_partition(partition.path) for partition in list_partitions(conn, archive_dir)]
@@ -0,0 +1,139 @@
+"""
+password_hashing.py
+This file contains the bounded worker pool that hashes and verifies passwords.
+Password hashes are deliberately slow, so they run on a few dedicated threads instead of
+on the request threads; hashlib releases the GIL while it works, so the threads run in
+parallel. When every worker is busy and the wait queue is full, callers get
+HasherBusy with a retry hint instead of queuing behind a burst of logins.
+"""
+
+# Standard library imports
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-party imports
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Durations kept per operation for the percentiles in stats()
+TIMING_WINDOW = 1024
+
+class HasherBusy(Exception):
+    """Raised when every hashing worker is busy and the wait queue is full."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Password hashing is saturated; retry in {retry_after}s')
+        self.retry_after = retry_after
+
+class _Timings:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.wait_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent = deque(maxlen=TIMING_WINDOW)
+
+    def record(self, seconds, wait_seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.wait_seconds += wait_seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.recent.append(seconds)
+
+    def mean(self):
+        return self.seconds / self.count if self.count else 0.0
+
+    def stats(self):
+        recent = sorted(self.recent)
+        percentile = lambda p: round(recent[min(int(len(recent) * p), len(recent) - 1)] * 1000, 2) if recent else None
+        return {
+            'count': self.count,
+            'mean_ms': round(self.mean() * 1000, 2),
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(self.max_seconds * 1000, 2),
+            'mean_wait_ms': round(self.wait_seconds / self.count * 1000, 2) if self.count else 0.0,
+        }
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded thread pool with load shedding."""
+
+    def __init__(self, method, workers=2, queue_size=16):
+        self.method = method
+        self.workers = workers
+        self.queue_size = queue_size
+        # Threads start on first use, so a pool created before gunicorn forks is safe
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        # One slot per running or waiting operation
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._method_prefix = None
+        self._timings = {'hash': _Timings(), 'verify': _Timings()}
+        self.in_flight = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def hash(self, password):
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    # True when a stored hash was made with another method or cost than the configured one
+    def needs_rehash(self, pwhash):
+        if self._method_prefix is None:
+            # Werkzeug fills in default parameters, so read them back from a real hash
+            self._method_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._method_prefix
+
+    # Returns a new hash of a verified password whose stored hash needs upgrading, else None
+    def upgraded_hash(self, pwhash, password):
+        if not self.needs_rehash(pwhash):
+            return None
+        upgraded = self.hash(password)
+        with self._lock:
+            self.rehashed += 1
+        return upgraded
+
+    def _run(self, operation, function, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy(self._retry_after())
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self._executor.submit(self._timed, operation, time.perf_counter(), function, *args).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _timed(self, operation, submitted_at, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self._timings[operation].record(finished - started, started - submitted_at)
+
+    # Estimates how long the operations ahead of a new one would take to drain
+    def _retry_after(self):
+        mean = max(timings.mean() for timings in self._timings.values()) or 0.1
+        return max(math.ceil(mean * self.in_flight / self.workers), 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+                'hash': self._timings['hash'].stats(),
+                'verify': self._timings['verify'].stats(),
+            }
@@ -0,0 +1,239 @@
+"""
+profiling.py
+This file contains the on-demand request profiler of the Shoe Database application.
+While an admin has profiling switched on, a sampled fraction of requests is watched by a
+background thread that records the stack of each watched request every few milliseconds.
+Samples are aggregated per route and can be downloaded as collapsed stacks, the input
+format of flamegraph.pl and speedscope. The settings and each worker's samples are kept
+in files, so every gunicorn worker follows the same switch. While profiling is off no
+thread runs and a request only pays for one clock comparison.
+"""
+
+# Standard library imports
+import glob
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+# Third-party imports
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+# Time between two stack samples of a watched request, in milliseconds
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+# How often each worker looks for changed settings and writes out its samples, in seconds
+SETTINGS_CHECK_INTERVAL = 1.0
+FLUSH_INTERVAL = 2.0
+# Frames kept per sample, counted from the innermost one
+MAX_STACK_DEPTH = 128
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_qualname} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+
+# Collapses a stack into root-first frames joined by semicolons
+def collapse_stack(frame):
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+class RequestProfiler:
+    """Samples the stacks of a fraction of requests while an admin has profiling switched on."""
+
+    def __init__(self, profile_dir, interval_ms=PROFILE_SAMPLE_INTERVAL_MS):
+        self.profile_dir = profile_dir
+        self.settings_path = os.path.join(profile_dir, 'settings.json')
+        self.interval = interval_ms / 1000
+        self.settings = None
+        self._settings_mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        # Thread ident -> route of the request it is serving, for the threads being watched
+        self._watched = {}
+        # route -> {'requests': watched requests, 'stacks': Counter of collapsed stacks}
+        self._routes = {}
+        self._thread = None
+        self._pid = None
+
+    # before_request hook: decides whether to watch the request on this thread
+    def start_request(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + SETTINGS_CHECK_INTERVAL
+            self._refresh()
+        settings = self.settings
+        if settings is None or request.url_rule is None:
+            return
+        route = request.url_rule.rule
+        if settings['routes'] and route not in settings['routes'] and request.endpoint not in settings['routes']:
+            return
+        if random.random() >= settings['sample_rate']:
+            return
+        with self._lock:
+            entry = self._routes.setdefault(route, {'requests': 0, 'stacks': Counter()})
+            entry['requests'] += 1
+            self._watched[threading.get_ident()] = route
+
+    # teardown_request hook: stops watching the thread
+    def finish_request(self, exception=None):
+        if self._watched:
+            self._watched.pop(threading.get_ident(), None)
+
+    # Follows the settings file: starts or stops sampling, and starts over on a new session
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.settings_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._settings_mtime:
+            return
+        self._settings_mtime = mtime
+        settings = self.read_settings()
+        active = settings if settings and settings['enabled'] else None
+
+        with self._lock:
+            if active is not None and (self.settings is None or self.settings['session'] != active['session']):
+                self._routes = {}
+            self.settings = active
+            if active is not None and (self._thread is None or not self._thread.is_alive() or self._pid != os.getpid()):
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+                self._thread.start()
+            if active is None:
+                self._watched.clear()
+
+    def _sample(self):
+        next_flush = time.monotonic() + FLUSH_INTERVAL
+        session = None
+        while True:
+            settings = self.settings
+            if settings is None:
+                break
+            session = settings['session']
+            watched = list(self._watched.items())
+            if watched:
+                frames = sys._current_frames()
+                with self._lock:
+                    for ident, route in watched:
+                        frame = frames.get(ident)
+                        if frame is not None and route in self._routes:
+                            self._routes[route]['stacks'][collapse_stack(frame)] += 1
+                # Frames keep their locals alive until released
+                del frames, frame
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + FLUSH_INTERVAL
+                self._flush(session)
+            time.sleep(self.interval)
+            # Nothing else notices a disabled profiler in a worker that gets no requests
+            if time.monotonic() >= self._next_check:
+                self._next_check = time.monotonic() + SETTINGS_CHECK_INTERVAL
+                self._refresh()
+        if session is not None:
+            self._flush(session)
+
+    # Writes this worker's samples for the session, replacing its previous file
+    def _flush(self, session):
+        with self._lock:
+            routes = {
+                route: {'requests': entry['requests'], 'stacks': dict(entry['stacks'])}
+                for route, entry in self._routes.items()
+            }
+        try:
+            self._write_file(os.path.join(self.profile_dir, f'samples_{os.getpid()}.json'),
+                             json.dumps({'session': session, 'routes': routes}))
+        except OSError:
+            logger.exception('Writing profiler samples failed')
+
+    # Writes through a temporary file so readers never see a partial file
+    def _write_file(self, path, content):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def read_settings(self):
+        try:
+            with open(self.settings_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # Starts a new profiling session in every worker; samples of earlier sessions are dropped
+    def enable(self, sample_rate, routes=None, enabled_by=None):
+        for path in glob.glob(os.path.join(self.profile_dir, 'samples_*.json')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        settings = {
+            'enabled': True,
+            'session': uuid.uuid4().hex,
+            'sample_rate': sample_rate,
+            'routes': routes or [],
+            'interval_ms': self.interval * 1000,
+            'enabled_at': datetime.now().isoformat(),
+            'enabled_by': enabled_by,
+            'disabled_at': None,
+        }
+        self._write_file(self.settings_path, json.dumps(settings))
+        self._next_check = 0.0
+        return settings
+
+    # Stops sampling in every worker; the session's samples stay available for download
+    def disable(self):
+        settings = self.read_settings()
+        if settings is None or not settings['enabled']:
+            return settings
+        settings['enabled'] = False
+        settings['disabled_at'] = datetime.now().isoformat()
+        self._write_file(self.settings_path, json.dumps(settings))
+        self._next_check = 0.0
+        return settings
+
+    # Merges the samples every worker wrote for the latest session: route -> (requests, Counter of stacks)
+    def collect(self):
+        settings = self.read_settings()
+        merged = {}
+        if settings is None:
+            return merged
+        for path in glob.glob(os.path.join(self.profile_dir, 'samples_*.json')):
+            try:
+                with open(path) as f:
+                    samples = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            if samples['session'] != settings['session']:
+                continue
+            for route, entry in samples['routes'].items():
+                requests, stacks = merged.setdefault(route, [0, Counter()])
+                merged[route][0] = requests + entry['requests']
+                stacks.update(entry['stacks'])
+        return merged
+
+    def summary(self):
+        routes = {}
+        for route, (requests, stacks) in sorted(self.collect().items()):
+            routes[route] = {'requests': requests, 'samples': sum(stacks.values())}
+        return {'settings': self.read_settings(), 'routes': routes}
+
+    # Collapsed stacks, one "frame;frame;... count" line each. Without a route filter the
+    # route is the root frame, so one flamegraph shows every route side by side.
+    def collapsed_stacks(self, route=None):
+        lines = []
+        for name, (requests, stacks) in sorted(self.collect().items()):
+            if route is not None and name != route:
+                continue
+            for stack, count in stacks.most_common():
+                lines.append(f'{stack if route else f"{name};{stack}"} {count}')
+        return '\n'.join(lines) + '\n' if lines else ''
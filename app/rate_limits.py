@@ -0,0 +1,143 @@
+"""
+rate_limits.py
+This file contains the rate limiter of the v1 API and its per-API-key quotas.
+Counters are kept in a `limits` storage; the default is a small SQLite database that every
+worker process shares, so a quota holds across gunicorn workers instead of being counted
+per process. Each API key has a quota over a long window and a burst allowance over a
+short one. A hit costs one UPSERT per window and no per-request parsing.
+"""
+
+# Standard library imports
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+# Third-party imports
+from limits import parse_many
+from limits.storage import Storage, storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+# Default quota and burst allowance of every API key, in `limits` notation such as 100/day
+API_RATE_LIMIT = os.getenv('API_RATE_LIMIT', '100/day')
+API_RATE_BURST = os.getenv('API_RATE_BURST', '10/second')
+# Per-key overrides as JSON, keyed by API key id: {"3": {"limit": "10000/day", "burst": "50/second"}}
+API_RATE_LIMITS = json.loads(os.getenv('API_RATE_LIMITS', '{}'))
+
+# Expired counters are deleted at most this often per process, in seconds
+PRUNE_INTERVAL = 600
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS rate_limit_counters
+    (key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL) WITHOUT ROWID
+'''
+
+# Adds to a counter in one statement, starting a new window once the old one has expired
+INCREMENT = '''
+    INSERT INTO rate_limit_counters (key, count, expires_at) VALUES (?1, ?2, ?3)
+    ON CONFLICT (key) DO UPDATE SET
+        count = CASE WHEN expires_at > ?4 THEN count + excluded.count ELSE excluded.count END,
+        expires_at = CASE WHEN expires_at > ?4 THEN expires_at ELSE excluded.expires_at END
+    RETURNING count
+'''
+
+# Returns the parsed limits of an API key id (None for requests without a key), burst allowance first, then quota
+@lru_cache(maxsize=1024)
+def limits_for(identifier):
+    configured = API_RATE_LIMITS.get(identifier, {})
+    limits = [configured.get('burst', API_RATE_BURST), configured.get('limit', API_RATE_LIMIT)]
+    return tuple(parse_many(';'.join(limit for limit in limits if limit)))
+
+class ApiRateLimiter:
+    """Counts requests per identity against the limits of its API key."""
+
+    def __init__(self, storage_uri, scope='api_v1'):
+        self.storage = storage_from_string(storage_uri)
+        self.strategy = FixedWindowRateLimiter(self.storage)
+        self.scope = scope
+        self.enabled = True
+
+    # Records one request and returns the first limit it breached, or None. A request
+    # refused by the burst allowance does not count against the quota.
+    def hit(self, identity, identifier):
+        if not self.enabled:
+            return None
+        for limit in limits_for(identifier):
+            if not self.strategy.hit(limit, self.scope, identity):
+                return limit
+        return None
+
+    # Seconds until the window of a breached limit resets
+    def retry_after(self, limit, identity):
+        reset_at = self.strategy.get_window_stats(limit, self.scope, identity).reset_time
+        return max(int(reset_at - time.time()) + 1, 1)
+
+    def reset(self):
+        self.storage.reset()
+
+class SQLiteLimitStorage(Storage):
+    """Fixed-window counters in a SQLite file, shared by every process that opens it.
+
+    Registered for sqlite:///path/to/file.db storage URIs. Each thread keeps its own
+    connection in autocommit mode, so a hit is a single UPSERT.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri[len('sqlite:///'):]
+        self._local = threading.local()
+        self._last_prune = 0.0
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            # Counters are not worth a sync per hit; a crash loses at most the latest counts
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('PRAGMA busy_timeout = 5000')
+            conn.execute(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def incr(self, key, expiry, amount=1):
+        conn = self._connection()
+        now = time.time()
+        if now - self._last_prune > PRUNE_INTERVAL:
+            self._last_prune = now
+            conn.execute('DELETE FROM rate_limit_counters WHERE expires_at <= ?', (now,))
+        # fetchall() steps the statement to completion, which commits it
+        return conn.execute(INCREMENT, (key, amount, now + expiry, now)).fetchall()[0][0]
+
+    def get(self, key):
+        row = self._connection().execute('SELECT count FROM rate_limit_counters WHERE key = ? AND expires_at > ?',
+                                         (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._connection().execute('SELECT expires_at FROM rate_limit_counters WHERE key = ? AND expires_at > ?',
+                                         (key, time.time())).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._connection().execute('DELETE FROM rate_limit_counters').rowcount
+
+    def clear(self, key):
+        self._connection().execute('DELETE FROM rate_limit_counters WHERE key = ?', (key,))
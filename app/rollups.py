@@ -0,0 +1,132 @@
+"""
+rollups.py
+This file contains the pre-aggregated production rollup used by the charts.
+Shoe counts are kept per (hour, model id, operator) by triggers on the shoes table,
+so chart queries read a few rollup rows instead of grouping the raw shoes table.
+"""
+
+# Bucket expressions over the rollup's 'YYYY-MM-DDTHH' hour key
+GRANULARITY_BUCKETS = {
+    'hour': "hour || ':00'",
+    'day': 'substr(hour, 1, 10)',
+    'week': "date(substr(hour, 1, 10), '-6 days', 'weekday 1')",
+    'month': 'substr(hour, 1, 7)',
+}
+
+# Rollup rows for a set of shoes; callers append a WHERE clause and GROUP BY 1, 2, 3
+GROUPED_COUNTS = '''
+    SELECT substr(created_at, 1, 13), coalesce(shoe_model_id, 0), created_by, COUNT(*)
+    FROM shoes
+'''
+
+ROLLUP_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS shoe_production_hourly
+        (hour TEXT NOT NULL,
+        shoe_model_id INTEGER NOT NULL,
+        created_by TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (hour, shoe_model_id, created_by)) WITHOUT ROWID''',
+    '''CREATE TRIGGER IF NOT EXISTS shoe_production_hourly_ai AFTER INSERT ON shoes BEGIN
+        INSERT INTO shoe_production_hourly (hour, shoe_model_id, created_by, count)
+        VALUES (substr(new.created_at, 1, 13), coalesce(new.shoe_model_id, 0), new.created_by, 1)
+        ON CONFLICT (hour, shoe_model_id, created_by) DO UPDATE SET count = count + 1;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS shoe_production_hourly_ad AFTER DELETE ON shoes BEGIN
+        UPDATE shoe_production_hourly SET count = count - 1
+        WHERE hour = substr(old.created_at, 1, 13) AND shoe_model_id = coalesce(old.shoe_model_id, 0) AND created_by = old.created_by;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS shoe_production_hourly_au AFTER UPDATE OF created_at, shoe_model_id, created_by ON shoes BEGIN
+        UPDATE shoe_production_hourly SET count = count - 1
+        WHERE hour = substr(old.created_at, 1, 13) AND shoe_model_id = coalesce(old.shoe_model_id, 0) AND created_by = old.created_by;
+        INSERT INTO shoe_production_hourly (hour, shoe_model_id, created_by, count)
+        VALUES (substr(new.created_at, 1, 13), coalesce(new.shoe_model_id, 0), new.created_by, 1)
+        ON CONFLICT (hour, shoe_model_id, created_by) DO UPDATE SET count = count + 1;
+    END''',
+]
+
+# Creates the rollup table and triggers, backfilling the table when it is new
+def ensure_production_rollup(conn):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shoe_production_hourly'").fetchone()
+    with conn:
+        for statement in ROLLUP_SCHEMA:
+            conn.execute(statement)
+        if not exists:
+            _backfill(conn)
+
+# Drops the rollup and its triggers, for migrations that change its key
+def drop_production_rollup(conn):
+    with conn:
+        for trigger in ('shoe_production_hourly_ai', 'shoe_production_hourly_ad', 'shoe_production_hourly_au'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute('DROP TABLE IF EXISTS shoe_production_hourly')
+
+# Recomputes the rollup from the raw shoes table and any archived partitions
+def rebuild_production_rollup(conn, archives=()):
+    ensure_production_rollup(conn)
+    with conn:
+        conn.execute('DELETE FROM shoe_production_hourly')
+        _backfill(conn)
+        for archive in archives:
+            add_grouped_counts(conn, archive.execute(GROUPED_COUNTS + ' GROUP BY 1, 2, 3'))
+
+def _backfill(conn):
+    conn.execute(f'''
+        INSERT INTO shoe_production_hourly (hour, shoe_model_id, created_by, count)
+        {GROUPED_COUNTS}
+        GROUP BY 1, 2, 3
+    ''')
+
+# Adds (hour, shoe_model_id, created_by, count) rows onto the rollup
+def add_grouped_counts(conn, rows):
+    conn.executemany('''
+        INSERT INTO shoe_production_hourly (hour, shoe_model_id, created_by, count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (hour, shoe_model_id, created_by) DO UPDATE SET count = count + excluded.count
+    ''', rows)
+
+# Adds back the counts for shoes about to be moved out by archival, so the delete
+# trigger leaves the rollup unchanged and charts keep covering archived months
+def retain_counts(conn, where, params):
+    add_grouped_counts(conn, conn.execute(f'{GROUPED_COUNTS} WHERE {where} GROUP BY 1, 2, 3', params).fetchall())
+
+# Returns [{'date', 'count'}] bucketed by granularity, filtered like the charts endpoint.
+# Brand and category filters join shoe_models, so conn must be able to see that table.
+def production_counts(conn, granularity='day', model_id=None, operator=None, start_date=None, end_date=None, brand=None, category=None):
+    bucket = GRANULARITY_BUCKETS[granularity]
+    query = f'''
+        SELECT {bucket} AS date, SUM(count) AS count
+        FROM shoe_production_hourly
+    '''
+    if brand is not None or category is not None:
+        query += ' JOIN shoe_models ON shoe_models.id = shoe_production_hourly.shoe_model_id'
+    query += ' WHERE count > 0'
+    params = []
+
+    if brand is not None:
+        query += ' AND shoe_models.brand = ?'
+        params.append(brand)
+
+    if category is not None:
+        query += ' AND shoe_models.category = ?'
+        params.append(category)
+
+    if model_id is not None:
+        query += ' AND shoe_model_id = ?'
+        params.append(model_id)
+
+    if operator is not None:
+        query += ' AND shoe_production_hourly.created_by = ?'
+        params.append(operator)
+
+    # Hour keys compare against dates the same way the raw created_at timestamps did
+    if start_date:
+        query += ' AND hour >= ?'
+        params.append(start_date[:13])
+
+    if end_date:
+        query += ' AND hour <= ?'
+        params.append(end_date[:13])
+
+    query += ' GROUP BY 1 ORDER BY 1'
+
+    return [{'date': row['date'], 'count': row['count']} for row in conn.execute(query, params)]
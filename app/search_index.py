@@ -0,0 +1,68 @@
+"""
+search_index.py
+This file contains the SQLite FTS5 full-text indexes over shoes and shoe models.
+The indexes are external-content tables kept in sync by triggers, using the trigram
+tokenizer so partial serial numbers, batch codes and model attributes can be matched.
+"""
+
+# Trigram matching needs at least this many characters in the search term
+MIN_FULLTEXT_TERM_LENGTH = 3
+
+SHOES_FTS_COLUMNS = ('model_name', 'serial_number', 'batch_number', 'created_by')
+SHOE_MODELS_FTS_COLUMNS = ('model_name', 'brand', 'category', 'gender', 'material', 'sole_type', 'closure_type', 'color')
+
+# Builds the virtual table and sync triggers for an external-content FTS5 index
+def _fts_schema(table, columns):
+    fts = f'{table}_fts'
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {column_list}, content='{table}', content_rowid='id', tokenize='trigram')""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END""",
+    ]
+
+# Creates the FTS index for a table, backfilling it when the index is new
+def ensure_fts_index(conn, table, columns):
+    fts = f'{table}_fts'
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)).fetchone()
+    with conn:
+        for statement in _fts_schema(table, columns):
+            conn.execute(statement)
+        if not exists:
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+# Rebuilds an FTS index from its content table
+def rebuild_fts_index(conn, table, columns):
+    ensure_fts_index(conn, table, columns)
+    fts = f'{table}_fts'
+    with conn:
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')")
+
+def ensure_shoes_fts(conn):
+    ensure_fts_index(conn, 'shoes', SHOES_FTS_COLUMNS)
+
+def ensure_shoe_models_fts(conn):
+    ensure_fts_index(conn, 'shoe_models', SHOE_MODELS_FTS_COLUMNS)
+
+# Quotes a user search term as a single FTS5 string, optionally restricted to one column
+def fulltext_query(term, column=None):
+    quoted = '"' + term.replace('"', '""') + '"'
+    if column:
+        return f'{column} : {quoted}'
+    return quoted
+
+def can_use_fulltext(term):
+    return len(term) >= MIN_FULLTEXT_TERM_LENGTH
+
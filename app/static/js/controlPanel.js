@@ -28,6 +28,49 @@ export function renderBackupPage() {
     `;
 }
 
+// How often a running backup job is polled, in milliseconds
+const BACKUP_POLL_INTERVAL = 1000;
+
+// Describes the size and duration of a completed backup
+function describeBackup(message, result) {
+    const megabytes = (result.bytes / (1024 * 1024)).toFixed(2);
+    return `${message} (${megabytes} MB in ${result.duration_seconds}s)`;
+}
+
+// Describes the progress of a running backup job
+function describeBackupProgress(job) {
+    if (job.status === 'queued' || !job.bytes_total) {
+        return 'Backup queued...';
+    }
+    const eta = job.eta_seconds === null ? '' : `, about ${Math.ceil(job.eta_seconds)}s remaining`;
+    return `Backing up ${job.current_database || 'databases'}: ${job.percent}%${eta}`;
+}
+
+// Polls a backup job until it finishes, showing its progress
+function pollBackupJob(statusUrl) {
+    fetch(statusUrl)
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            document.getElementById('backupStatus').innerHTML = `<p style="color: red;">${data.message}</p>`;
+            return;
+        }
+        const job = data.job;
+        if (job.status === 'succeeded') {
+            document.getElementById('backupStatus').innerHTML = `<p style="color: green;">${describeBackup('Backup completed successfully.', job.result)}</p>`;
+        } else if (job.status === 'failed') {
+            document.getElementById('backupStatus').innerHTML = `<p style="color: red;">Backup failed: ${job.error}</p>`;
+        } else {
+            document.getElementById('backupStatus').innerHTML = `<p style="color: blue;">${describeBackupProgress(job)}</p>`;
+            setTimeout(() => pollBackupJob(statusUrl), BACKUP_POLL_INTERVAL);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        document.getElementById('backupStatus').innerHTML = '<p style="color: red;">An error occurred while checking the backup.</p>';
+    });
+}
+
 // Performs a manual backup
 export function performManualBackup() {
     fetch('/api/manual_backup', {
@@ -36,7 +79,8 @@ export function performManualBackup() {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            document.getElementById('backupStatus').innerHTML = `<p style="color: green;">${data.message}</p>`;
+            document.getElementById('backupStatus').innerHTML = `<p style="color: blue;">${data.message}</p>`;
+            pollBackupJob(data.status_url);
         } else if (data.existing_files) {
             const confirmMessage = `The following backup files already exist:\n${data.existing_files.join('\n')}\n\nDo you want to overwrite them?`;
             if (confirm(confirmMessage)) {
@@ -62,7 +106,8 @@ function confirmBackupOverwrite() {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            document.getElementById('backupStatus').innerHTML = `<p style="color: green;">${data.message}</p>`;
+            document.getElementById('backupStatus').innerHTML = `<p style="color: blue;">${data.message}</p>`;
+            pollBackupJob(data.status_url);
         } else {
             document.getElementById('backupStatus').innerHTML = `<p style="color: red;">${data.message}</p>`;
         }
@@ -71,4 +116,4 @@ function confirmBackupOverwrite() {
         console.error('Error:', error);
         document.getElementById('backupStatus').innerHTML = '<p style="color: red;">An error occurred while performing the backup.</p>';
     });
-}
\ No newline at end of file
+}
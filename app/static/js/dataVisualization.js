@@ -22,6 +22,26 @@ export function renderCreateGraphsPage() {
                 </select>
                 <input type="date" id="startDate">
                 <input type="date" id="endDate">
+                <select id="granularitySelect">
+                    <option value="hour">Hourly</option>
+                    <option value="day" selected>Daily</option>
+                    <option value="week">Weekly</option>
+                    <option value="month">Monthly</option>
+                </select>
+                <select id="groupBySelect">
+                    <option value="">No Grouping</option>
+                    <option value="brand">By Brand</option>
+                    <option value="category">By Category</option>
+                    <option value="model">By Model</option>
+                    <option value="operator">By Operator</option>
+                    <option value="batch">By Batch</option>
+                </select>
+                <select id="movingAverageSelect">
+                    <option value="0">No Moving Average</option>
+                    <option value="3">3-Period Average</option>
+                    <option value="7">7-Period Average</option>
+                    <option value="30">30-Period Average</option>
+                </select>
                 <button onclick="updateShoeCreationChart()">Update Chart</button>
             </div>
             <canvas id="shoeCreationChart"></canvas>
@@ -129,6 +149,60 @@ export function createShoeCreationChart(data) {
     });
 }
 
+// Creates a chart with one line per group from /api/analytics/production rows,
+// plotting the moving average instead of raw counts when one was requested
+export function createAnalyticsChart(result) {
+    const ctx = document.getElementById('shoeCreationChart').getContext('2d');
+
+    if (shoeCreationChart) {
+        shoeCreationChart.destroy();
+    }
+
+    const labels = [...new Set(result.rows.map(row => row.bucket))].sort();
+    const series = new Map();
+    result.rows.forEach(row => {
+        const name = result.group_by.map(field => row[field] ?? 'Unknown').join(' / ') || 'Shoes Created';
+        if (!series.has(name)) series.set(name, new Map());
+        series.get(name).set(row.bucket, result.moving_average ? row.moving_average : row.count);
+    });
+
+    shoeCreationChart = new Chart(ctx, {
+        type: 'line',
+        data: {
+            labels: labels,
+            datasets: [...series].map(([name, values]) => ({
+                label: name,
+                data: labels.map(label => values.get(label) ?? null),
+                spanGaps: true,
+                tension: 0.1
+            }))
+        },
+        options: {
+            scales: {
+                y: {
+                    beginAtZero: true,
+                    title: {
+                        display: true,
+                        text: result.moving_average ? `Number of Shoes (${result.moving_average}-period average)` : 'Number of Shoes'
+                    }
+                },
+                x: {
+                    title: {
+                        display: true,
+                        text: 'Date'
+                    }
+                }
+            },
+            plugins: {
+                title: {
+                    display: true,
+                    text: 'Shoes Created Over Time'
+                }
+            }
+        }
+    });
+}
+
 // Downloads the current chart as an image
 export function downloadChart() {
     const canvas = document.getElementById('shoeCreationChart');
@@ -145,14 +219,21 @@ export function updateShoeCreationChart() {
     const operator = document.getElementById('operatorSelect').value;
     const startDate = document.getElementById('startDate').value;
     const endDate = document.getElementById('endDate').value;
+    const granularitySelect = document.getElementById('granularitySelect');
+    const groupBy = document.getElementById('groupBySelect')?.value;
+    const movingAverage = document.getElementById('movingAverageSelect')?.value;
+    const useAnalytics = Boolean(groupBy) || (movingAverage && movingAverage !== '0');
 
-    const url = new URL('/api/shoe_creation_data', window.location.origin);
+    const url = new URL(useAnalytics ? '/api/analytics/production' : '/api/shoe_creation_data', window.location.origin);
     url.searchParams.append('model_id', modelId);
     url.searchParams.append('operator', operator);
     if (startDate) url.searchParams.append('start_date', startDate);
     if (endDate) url.searchParams.append('end_date', endDate);
+    if (granularitySelect) url.searchParams.append('granularity', granularitySelect.value);
+    if (groupBy) url.searchParams.append('group_by', groupBy);
+    if (useAnalytics) url.searchParams.append('moving_average', movingAverage);
 
     fetch(url)
         .then(response => response.json())
-        .then(data => createShoeCreationChart(data));
+        .then(data => useAnalytics ? createAnalyticsChart(data) : createShoeCreationChart(data));
 }
\ No newline at end of file
@@ -110,10 +110,10 @@ export function renderViewDataPage() {
     fetchShoes();
 }
 
-export function fetchShoes(searchTerm = '', searchType = 'model_name') {
-    fetch(`/api/view_shoes?search=${searchTerm}&type=${searchType}`)
+export function fetchShoes(searchTerm = '', searchType = 'model_name', searchMode = 'contains') {
+    fetch(`/api/view_shoes?search=${encodeURIComponent(searchTerm)}&type=${searchType}&mode=${searchMode}`)
     .then(response => response.json())
-    .then(shoes => {
+    .then(page => {
         const app = document.getElementById('app');
         app.innerHTML = `
             ${renderNavBar()}
@@ -126,6 +126,12 @@ export function fetchShoes(searchTerm = '', searchType = 'model_name') {
                     <option value="batch_number" ${searchType === 'batch_number' ? 'selected' : ''}>Batch Number</option>
                     <option value="created_by" ${searchType === 'created_by' ? 'selected' : ''}>Created By</option>
                 </select>
+                <select id="searchMode">
+                    <option value="contains" ${searchMode === 'contains' ? 'selected' : ''}>Contains</option>
+                    <option value="prefix" ${searchMode === 'prefix' ? 'selected' : ''}>Starts With</option>
+                    <option value="exact" ${searchMode === 'exact' ? 'selected' : ''}>Exact Match</option>
+                    <option value="ranked" ${searchMode === 'ranked' ? 'selected' : ''}>Best Match</option>
+                </select>
                 <button onclick="searchShoes()">Search</button>
             </div>
             <table id="shoesTable">
@@ -140,22 +146,44 @@ export function fetchShoes(searchTerm = '', searchType = 'model_name') {
                     </tr>
                 </thead>
                 <tbody>
-                    ${renderShoeRows(shoes)}
+                    ${renderShoeRows(page.shoes)}
                 </tbody>
             </table>
+            <button id="loadMoreShoes" style="display: ${page.next_after_id ? 'inline-block' : 'none'};">Load More</button>
         `;
 
         // Add event listener for real-time search
         document.getElementById('searchInput').addEventListener('input', debounce(searchShoes, 300));
         document.getElementById('searchType').addEventListener('change', searchShoes);
+        document.getElementById('searchMode').addEventListener('change', searchShoes);
+
+        let nextAfterId = page.next_after_id;
+        document.getElementById('loadMoreShoes').addEventListener('click', () => {
+            loadMoreShoes(searchTerm, searchType, searchMode, nextAfterId)
+            .then(next => { nextAfterId = next; });
+        });
+    });
+}
+
+// Appends the next page of search results to the shoes table
+function loadMoreShoes(searchTerm, searchType, searchMode, afterId) {
+    return fetch(`/api/view_shoes?search=${encodeURIComponent(searchTerm)}&type=${searchType}&mode=${searchMode}&after_id=${afterId}`)
+    .then(response => response.json())
+    .then(page => {
+        document.querySelector('#shoesTable tbody').insertAdjacentHTML('beforeend', renderShoeRows(page.shoes));
+        if (!page.next_after_id) {
+            document.getElementById('loadMoreShoes').style.display = 'none';
+        }
+        return page.next_after_id;
     });
 }
 
-// Searches for shoes based on the search term and type
+// Searches for shoes based on the search term, type and mode
 export function searchShoes() {
     const searchInput = document.getElementById('searchInput').value;
     const searchType = document.getElementById('searchType').value;
-    fetchShoes(searchInput, searchType);
+    const searchMode = document.getElementById('searchMode').value;
+    fetchShoes(searchInput, searchType, searchMode);
 }
 
 // Debounce function to limit how often searchShoes gets called
@@ -99,9 +99,9 @@ export function submitShoeModel(form) {
 }
 
 // Renders the page for viewing shoe models
-export function renderViewShoeModelsPage() {
+export function renderViewShoeModelsPage(searchTerm = '') {
     Promise.all([
-        fetch('/api/shoe_models').then(response => response.json()),
+        fetch(`/api/shoe_models?search=${encodeURIComponent(searchTerm)}`).then(response => response.json()),
         fetch('/api/users').then(response => response.json()),
         fetch('/api/shoe_models_and_operators').then(response => response.json())
     ])
@@ -110,6 +110,10 @@ export function renderViewShoeModelsPage() {
         app.innerHTML = `
             ${renderNavBar()}
             <h1>Shoe Models</h1>
+            <div class="search-container">
+                <input type="text" id="modelSearchInput" placeholder="Search models...">
+                <button onclick="searchShoeModels()">Search</button>
+            </div>
             <table>
                 <thead>
                     <tr>
@@ -150,11 +154,18 @@ export function renderViewShoeModelsPage() {
                 </tbody>
             </table>
         `;
+        // Set as a property, so the term is never parsed as markup
+        document.getElementById('modelSearchInput').value = searchTerm;
         updateShoeCreationChart();
         document.getElementById('downloadChartBtn').addEventListener('click', downloadChart);
     });
 }
 
+// Searches shoe models by name and attributes
+export function searchShoeModels() {
+    renderViewShoeModelsPage(document.getElementById('modelSearchInput').value);
+}
+
 // Deletes a shoe model
 export function deleteShoeModel(modelId) {
     if (confirm('Are you sure you want to delete this shoe model?')) {
@@ -0,0 +1,8 @@
+"""
+wsgi.py
+WSGI entry point for production servers, e.g. `gunicorn -c gunicorn.conf.py wsgi:app`.
+"""
+
+from main import create_app
+
+app = create_app()
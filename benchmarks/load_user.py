@@ -0,0 +1,87 @@
+"""
+load_user.py
+Benchmark for the Flask-Login user loader. It measures an authenticated request
+with the user cache cold (every load_user call hits users.db) and warm
+(load_user is served from the LRU), and prints the per-request saving.
+
+Usage: python benchmarks/load_user.py [--requests 2000]
+"""
+
+# Standard library imports
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Points the app at a scratch copy of the databases with a known benchmark user
+def prepare_databases():
+    workdir = tempfile.mkdtemp(prefix='shoe_bench_')
+    for name in ('shoes', 'users', 'models'):
+        shutil.copy(os.path.join(REPO_ROOT, 'database', f'{name}.db'), os.path.join(workdir, f'{name}.db'))
+    os.environ['SHOE_DB_PATH'] = os.path.join(workdir, 'shoes.db')
+    os.environ['USERS_DB_PATH'] = os.path.join(workdir, 'users.db')
+    os.environ['MODELS_DB_PATH'] = os.path.join(workdir, 'models.db')
+
+    from werkzeug.security import generate_password_hash
+    conn = sqlite3.connect(os.environ['USERS_DB_PATH'])
+    conn.execute('INSERT INTO users (username, password, role, last_password_change) VALUES (?, ?, ?, ?)',
+                 ('bench', generate_password_hash('bench'), 'admin', date.today().isoformat()))
+    conn.commit()
+    conn.close()
+    return workdir
+
+# Alternates cold and warm requests so both see the same interpreter and page-cache state
+def time_requests(client, user_cache, requests):
+    cold, warm = [], []
+    for _ in range(requests):
+        user_cache.clear()
+        started = time.perf_counter()
+        client.get('/api/logout_check')
+        cold.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        client.get('/api/logout_check')
+        warm.append(time.perf_counter() - started)
+    cold.sort()
+    warm.sort()
+    return cold[len(cold) // 2] * 1e6, warm[len(warm) // 2] * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = prepare_databases()
+    sys.path.insert(0, os.path.join(REPO_ROOT, 'app'))
+    import main as shoe_app
+
+    # A cheap @login_required endpoint so load_user dominates the request
+    @shoe_app.app.route('/api/logout_check')
+    @shoe_app.login_required
+    def logout_check():
+        return ''
+
+    client = shoe_app.app.test_client()
+    client.post('/api/login', json={'username': 'bench', 'password': 'bench'})
+
+    time_requests(client, shoe_app.user_cache, 200)
+    cold_us, warm_us = time_requests(client, shoe_app.user_cache, args.requests)
+
+    print(json.dumps({
+        'requests': args.requests,
+        'uncached_p50_us': round(cold_us, 1),
+        'cached_p50_us': round(warm_us, 1),
+        'saving_per_request_us': round(cold_us - warm_us, 1),
+        'user_cache': shoe_app.user_cache.stats()
+    }, indent=2))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
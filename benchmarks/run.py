@@ -0,0 +1,278 @@
+"""
+run.py
+Load and latency benchmark for the scan-entry and search paths. It drives
+api_shoe_entry, api_view_shoes, api_get_shoe_creation_data, the production
+analytics and /api/v1/shoes concurrently through the Flask test client (default)
+or a local HTTP server, and writes p50/p95/p99 latency, throughput and peak RSS
+per scenario as JSON.
+
+Usage:
+    python benchmarks/run.py --rows 100000 --output results.json
+    python benchmarks/run.py --data-dir /tmp/shoe_bench --server --compare baseline.json
+"""
+
+# Standard library imports
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import seed
+
+# Each scenario builds (method, path, json_body, headers) for the i-th request of a worker
+def shoe_entry_request(ctx, worker, i):
+    body = {
+        'model_name': seed.model_name(ctx['rng'].randrange(ctx['models'])),
+        'serial_number': f'BENCH-{ctx["run_id"]}-{worker}-{i}',
+        'batch_number': f'BENCH{worker:03d}'
+    }
+    return 'POST', '/api/shoe_entry', body, {}
+
+def view_shoes_request(ctx, worker, i):
+    serial = seed.serial_number(ctx['rng'].randrange(max(ctx['rows'], 1)))
+    variants = (
+        f'/api/view_shoes?type=serial_number&mode=exact&search={serial}',
+        f'/api/view_shoes?type=serial_number&mode=prefix&search={serial[:-3]}',
+        f'/api/view_shoes?type=batch_number&mode=prefix&search=B{ctx["rng"].randrange(max(ctx["rows"] // 500, 1)):07d}',
+        '/api/view_shoes?type=model_name&mode=contains&search=Model-00',
+    )
+    return 'GET', variants[i % len(variants)], None, {}
+
+def shoe_creation_data_request(ctx, worker, i):
+    variants = (
+        '/api/shoe_creation_data?granularity=day',
+        f'/api/shoe_creation_data?granularity=week&operator=operator{i % 20:02d}',
+        '/api/shoe_creation_data?granularity=month&model_id=1',
+    )
+    return 'GET', variants[i % len(variants)], None, {}
+
+def production_analytics_request(ctx, worker, i):
+    variants = (
+        '/api/analytics/production?granularity=day&group_by=operator&moving_average=7',
+        f'/api/analytics/production?granularity=week&group_by=brand&moving_average=4&start_date={ctx["start_date"]}',
+        f'/api/analytics/production?granularity=month&moving_average=3&start_date={ctx["start_date"]}',
+        f'/api/analytics/production?granularity=month&group_by=model&moving_average=3&start_date={ctx["start_date"]}',
+    )
+    return 'GET', variants[i % len(variants)], None, {}
+
+def v1_shoes_request(ctx, worker, i):
+    since_id = max(ctx['max_id'] - ctx['export_rows'], 0)
+    return 'GET', f'/api/v1/shoes?format=ndjson&since_id={since_id}', None, {'X-API-Key': ctx['api_key']}
+
+SCENARIOS = {
+    'shoe_entry': shoe_entry_request,
+    'view_shoes': view_shoes_request,
+    'shoe_creation_data': shoe_creation_data_request,
+    'production_analytics': production_analytics_request,
+    'v1_shoes': v1_shoes_request,
+}
+
+class TestClientSession:
+    """Logged-in Flask test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.request('POST', '/api/login', {'username': seed.BENCH_USERNAME, 'password': seed.BENCH_PASSWORD}, {})
+
+    def request(self, method, path, body, headers):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        response.get_data()
+        return response.status_code
+
+class HTTPSession:
+    """Logged-in urllib session against a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.request('POST', '/api/login', {'username': seed.BENCH_USERNAME, 'password': seed.BENCH_PASSWORD}, {})
+
+    def request(self, method, path, body, headers):
+        data = json.dumps(body).encode() if body is not None else None
+        headers = dict(headers, **({'Content-Type': 'application/json'} if data else {}))
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return None
+    index = min(int(round(fraction * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+# Runs one scenario with `concurrency` workers issuing `requests` requests each
+def run_scenario(name, make_session, ctx, concurrency, requests):
+    build_request = SCENARIOS[name]
+    sessions = [make_session() for _ in range(concurrency)]
+    barrier = threading.Barrier(concurrency)
+
+    def worker(index):
+        session = sessions[index]
+        latencies, errors = [], 0
+        barrier.wait()
+        for i in range(requests):
+            method, path, body, headers = build_request(ctx, index, i)
+            started = time.perf_counter()
+            status = session.request(method, path, body, headers)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(sample for samples, _ in results for sample in samples)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'concurrency': concurrency,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+# Starts the app on a local threaded HTTP server and returns its base URL
+def start_local_server(app):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=seed.REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Prints the change of each metric against a previous results file
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f'\nCompared with {baseline_path} ({baseline["meta"].get("revision")}):')
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if not previous:
+            continue
+        changes = []
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            if previous.get(metric):
+                delta = (current[metric] - previous[metric]) / previous[metric] * 100
+                changes.append(f'{metric} {previous[metric]} -> {current[metric]} ({delta:+.1f}%)')
+        print(f'  {name}: ' + ', '.join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='shoes to seed when --data-dir is not given or empty')
+    parser.add_argument('--data-dir', help='reuse (or create) seeded databases in this directory')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per worker per scenario')
+    parser.add_argument('--export-rows', type=int, default=1000, help='rows fetched per /api/v1/shoes request')
+    parser.add_argument('--server', action='store_true', help='go through a local HTTP server instead of the test client')
+    parser.add_argument('--base-url', help='benchmark an already running server (its rate limiter must allow the load)')
+    parser.add_argument('--api-key', default=os.getenv('SHOE_API_KEY'),
+                        help='API key for /api/v1/shoes (default: $SHOE_API_KEY, or a key issued in the seeded users.db)')
+    parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    args = parser.parse_args()
+    if args.base_url and not args.api_key and 'v1_shoes' in args.scenarios.split(','):
+        parser.error('--base-url needs --api-key or SHOE_API_KEY for the v1_shoes scenario')
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='shoe_bench_')
+    if not os.path.exists(os.path.join(data_dir, 'shoes.db')):
+        print(f'Seeding {args.rows:,} shoes into {data_dir}...', file=sys.stderr)
+        seed.seed(data_dir, args.rows)
+    seed.use_data_dir(data_dir)
+
+    import main as shoe_app
+    import api_keys
+    shoe_app.limiter.enabled = False
+
+    api_key = args.api_key
+    if api_key is None:
+        conn = sqlite3.connect(shoe_app.USERS_DB_PATH)
+        api_keys.ensure_api_keys_table(conn)
+        api_key = api_keys.create_key(conn, 'benchmark', 'benchmarks/run.py')[1]
+        conn.close()
+
+    conn = sqlite3.connect(shoe_app.SHOE_DB_PATH)
+    rows, max_id = conn.execute('SELECT COUNT(*), COALESCE(MAX(id), 0) FROM shoes').fetchone()
+    models = conn.execute('SELECT COUNT(DISTINCT model_name) FROM shoes').fetchone()[0]
+    conn.close()
+
+    if args.base_url:
+        make_session = lambda: HTTPSession(args.base_url)
+    elif args.server:
+        base_url = start_local_server(shoe_app.app)
+        make_session = lambda: HTTPSession(base_url)
+    else:
+        make_session = lambda: TestClientSession(shoe_app.app)
+
+    ctx = {
+        'rows': rows,
+        'max_id': max_id,
+        'models': max(models, 1),
+        'export_rows': args.export_rows,
+        'start_date': time.strftime('%Y-%m-%d', time.localtime(time.time() - 90 * 86400)),
+        'api_key': api_key,
+        'run_id': int(time.time()),
+        'rng': random.Random(7),
+    }
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'rows': rows,
+            'transport': 'http' if (args.server or args.base_url) else 'test_client',
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'scenarios': {}
+    }
+    for name in args.scenarios.split(','):
+        print(f'Running {name}...', file=sys.stderr)
+        results['scenarios'][name] = run_scenario(name, make_session, ctx, args.concurrency, args.requests)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
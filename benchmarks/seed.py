@@ -0,0 +1,148 @@
+"""
+seed.py
+Creates benchmark databases of a configurable size. The schema comes from the
+application itself (main.init_databases), then shoes.db and models.db are filled
+with synthetic models, shoes and operators and the derived indexes are rebuilt.
+
+Usage: python benchmarks/seed.py --rows 100000 --data-dir /tmp/shoe_bench
+"""
+
+# Standard library imports
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench'
+
+BRANDS = ('Nike', 'Adidas', 'Puma', 'Reebok')
+CATEGORIES = ('Running', 'Basketball', 'Casual', 'Football')
+MATERIALS = ('Leather', 'Synthetic', 'Canvas', 'Knit')
+
+# Points the application's database settings at data_dir; must run before importing main
+def use_data_dir(data_dir):
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ['SHOE_DB_PATH'] = os.path.join(data_dir, 'shoes.db')
+    os.environ['USERS_DB_PATH'] = os.path.join(data_dir, 'users.db')
+    os.environ['MODELS_DB_PATH'] = os.path.join(data_dir, 'models.db')
+    if os.path.join(REPO_ROOT, 'app') not in sys.path:
+        sys.path.insert(0, os.path.join(REPO_ROOT, 'app'))
+
+def model_name(index):
+    return f'Model-{index:04d}'
+
+def serial_number(index):
+    return f'SN{index:010d}'
+
+def seed_models(conn, count):
+    now = datetime.now().isoformat()
+    conn.executemany('''
+        INSERT INTO shoe_models (
+            model_name, brand, category, gender, material, sole_type, closure_type,
+            color, weight_grams, price, release_date, created_at, created_by
+        ) VALUES (?, ?, ?, 'Unisex', ?, 'Rubber', 'Lace-up', 'Black', ?, ?, '2024-01-01', ?, 1)
+    ''', [
+        (model_name(i), BRANDS[i % len(BRANDS)], CATEGORIES[i % len(CATEGORIES)],
+         MATERIALS[i % len(MATERIALS)], 250 + i % 200, 50.0 + i % 100, now)
+        for i in range(count)
+    ])
+    conn.commit()
+
+# Inserts rows shoes spread evenly over the last `days` days, in large transactions
+def seed_shoes(conn, rows, model_ids, operators, days, chunk_size=50000):
+    rng = random.Random(42)
+    models = len(model_ids)
+    start = datetime.now() - timedelta(days=days)
+    step = timedelta(days=days) / max(rows, 1)
+    for first in range(0, rows, chunk_size):
+        batch = []
+        for i in range(first, min(first + chunk_size, rows)):
+            name = model_name(rng.randrange(models))
+            batch.append((
+                name,
+                model_ids[name],
+                serial_number(i),
+                f'B{i // 500:07d}',
+                (start + step * i).isoformat(),
+                f'operator{rng.randrange(operators):02d}'
+            ))
+        conn.executemany('''
+            INSERT INTO shoes (model_name, shoe_model_id, serial_number, batch_number, created_at, created_by)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', batch)
+        conn.commit()
+        print(f'  {min(first + chunk_size, rows):,} / {rows:,} shoes', end='\r', flush=True)
+    print()
+
+# Drops the triggers on shoes so bulk loading skips per-row index maintenance
+def drop_shoe_triggers(conn):
+    triggers = conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'shoes'").fetchall()
+    for (name,) in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    conn.commit()
+
+def seed(data_dir, rows, models=50, operators=20, days=365):
+    use_data_dir(data_dir)
+    for name in ('shoes', 'users', 'models'):
+        path = os.path.join(data_dir, f'{name}.db')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    import main
+    from werkzeug.security import generate_password_hash
+
+    started = time.perf_counter()
+    main.init_databases()
+    main.db.close_all_pools()
+
+    conn_users = sqlite3.connect(main.USERS_DB_PATH)
+    conn_users.execute('INSERT INTO users (username, password, role, last_password_change) VALUES (?, ?, ?, ?)',
+                       (BENCH_USERNAME, generate_password_hash(BENCH_PASSWORD), 'admin', date.today().isoformat()))
+    conn_users.commit()
+    conn_users.close()
+
+    conn_models = sqlite3.connect(main.MODELS_DB_PATH)
+    seed_models(conn_models, models)
+    model_ids = dict(conn_models.execute('SELECT model_name, id FROM shoe_models'))
+    conn_models.close()
+
+    conn_shoes = sqlite3.connect(main.SHOE_DB_PATH)
+    drop_shoe_triggers(conn_shoes)
+    seed_shoes(conn_shoes, rows, model_ids, operators, days)
+    conn_shoes.close()
+
+    # Recreate the triggers and rebuild everything they would have maintained
+    runner = main.app.test_cli_runner()
+    main.init_databases()
+    for command in ('rebuild-search-index', 'rebuild-production-rollup'):
+        result = runner.invoke(args=[command])
+        if result.exit_code != 0:
+            raise RuntimeError(f'{command} failed: {result.output}')
+    main.db.close_all_pools()
+
+    conn_shoes = sqlite3.connect(main.SHOE_DB_PATH)
+    conn_shoes.execute('ANALYZE')
+    conn_shoes.close()
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='number of shoes to create (10k to 10M)')
+    parser.add_argument('--models', type=int, default=50)
+    parser.add_argument('--operators', type=int, default=20)
+    parser.add_argument('--days', type=int, default=365, help='spread created_at over this many days')
+    parser.add_argument('--data-dir', required=True)
+    args = parser.parse_args()
+
+    elapsed = seed(args.data_dir, args.rows, args.models, args.operators, args.days)
+    print(f'Seeded {args.rows:,} shoes into {args.data_dir} in {elapsed:.1f}s')
+
+if __name__ == '__main__':
+    main()